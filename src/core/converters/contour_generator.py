@@ -0,0 +1,109 @@
+import numpy as np
+import shapely
+
+MAX_CONTOUR_LEVELS = 1000
+
+# Segmentos por caso de marching squares. Bits: a=1 (inf-izq), b=2 (inf-der), c=4 (sup-der), d=8 (sup-izq).
+# Bordes: 0=inferior (a-b), 1=derecho (b-c), 2=superior (d-c), 3=izquierdo (a-d).
+# Los casos 5 y 10 (silla) se resuelven con el promedio del centro de la celda.
+_CASE_SEGMENTS = {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)],
+    6: [(0, 2)], 7: [(3, 2)], 8: [(2, 3)], 9: [(0, 2)],
+    11: [(1, 2)], 12: [(1, 3)], 13: [(0, 1)], 14: [(3, 0)],
+}
+_SADDLE_SEGMENTS = {
+    # (centro por encima, centro por debajo)
+    5: ([(0, 1), (2, 3)], [(3, 0), (1, 2)]),
+    10: ([(3, 0), (1, 2)], [(0, 1), (2, 3)]),
+}
+
+def contour_levels(z_min, z_max, interval, index_every=5):
+    """Calcula las cotas de las curvas múltiplos del intervalo y marca las curvas índice."""
+    if interval <= 0:
+        raise ValueError("El intervalo de curvas debe ser mayor que cero")
+    first = np.ceil(z_min / interval)
+    last = np.floor(z_max / interval)
+    if last - first + 1 > MAX_CONTOUR_LEVELS:
+        raise ValueError(f"El intervalo {interval} genera más de {MAX_CONTOUR_LEVELS} curvas")
+    steps = np.arange(first, last + 1)
+    levels = steps * interval
+    is_index = (np.mod(steps, index_every) == 0) if index_every and index_every > 0 else np.zeros(len(steps), dtype=bool)
+    return levels, is_index
+
+def _edge_points(level, a, b, c, d, x0, x1, y0, y1):
+    """Intersecciones del nivel con los cuatro bordes de cada celda, siempre orientados izq→der / abajo→arriba."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_bottom = (level - a) / (b - a)
+        t_right = (level - b) / (c - b)
+        t_top = (level - d) / (c - d)
+        t_left = (level - a) / (d - a)
+    return (
+        np.column_stack((x0 + t_bottom * (x1 - x0), y0)),
+        np.column_stack((x1, y0 + t_right * (y1 - y0))),
+        np.column_stack((x0 + t_top * (x1 - x0), y1)),
+        np.column_stack((x0, y0 + t_left * (y1 - y0))),
+    )
+
+def _level_segments(z_grid, x_grid, y_grid, level):
+    a = z_grid[:-1, :-1]
+    b = z_grid[:-1, 1:]
+    c = z_grid[1:, 1:]
+    d = z_grid[1:, :-1]
+    valid = np.isfinite(a) & np.isfinite(b) & np.isfinite(c) & np.isfinite(d)
+    case = (a >= level).astype(np.uint8) | ((b >= level).astype(np.uint8) << 1) | ((c >= level).astype(np.uint8) << 2) | ((d >= level).astype(np.uint8) << 3)
+    crossing = valid & (case != 0) & (case != 15)
+    rows, cols = np.nonzero(crossing)
+    if len(rows) == 0:
+        return np.empty((0, 2, 2))
+    case = case[rows, cols]
+    av, bv, cv, dv = a[rows, cols], b[rows, cols], c[rows, cols], d[rows, cols]
+    edges = _edge_points(level, av, bv, cv, dv, x_grid[cols], x_grid[cols + 1], y_grid[rows], y_grid[rows + 1])
+    center_above = (av + bv + cv + dv) / 4.0 >= level
+    segments = []
+    for case_id, pairs in _CASE_SEGMENTS.items():
+        sel = case == case_id
+        if sel.any():
+            for e0, e1 in pairs:
+                segments.append(np.stack((edges[e0][sel], edges[e1][sel]), axis=1))
+    for case_id, (pairs_above, pairs_below) in _SADDLE_SEGMENTS.items():
+        for pairs, sel in ((pairs_above, (case == case_id) & center_above), (pairs_below, (case == case_id) & ~center_above)):
+            if sel.any():
+                for e0, e1 in pairs:
+                    segments.append(np.stack((edges[e0][sel], edges[e1][sel]), axis=1))
+    return np.concatenate(segments) if segments else np.empty((0, 2, 2))
+
+def _merge_segments(segments):
+    """Une los segmentos de un nivel en polilíneas continuas usando GEOS."""
+    merged = shapely.line_merge(shapely.multilinestrings(shapely.linestrings(segments)))
+    parts = shapely.get_parts(merged)
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    splits = np.flatnonzero(np.diff(index)) + 1
+    return np.split(coords, splits)
+
+def generate_contours(z_grid, x_grid, y_grid, interval=1.0, index_every=5, min_vertices=2):
+    """
+    Extrae curvas de nivel de una grilla con marching squares vectorizado.
+
+    z_grid tiene las filas en el orden de y_grid (ascendente) y las columnas en el
+    de x_grid. Las celdas con NaN se omiten. Retorna una lista de dicts con
+    'level', 'index', 'closed' y 'coords' (arreglo Nx2 en las unidades de la grilla).
+    """
+    finite = z_grid[np.isfinite(z_grid)]
+    if finite.size == 0:
+        return []
+    levels, is_index = contour_levels(float(finite.min()), float(finite.max()), interval, index_every)
+    contours = []
+    for level, index_flag in zip(levels, is_index):
+        segments = _level_segments(z_grid, x_grid, y_grid, level)
+        if len(segments) == 0:
+            continue
+        for line in _merge_segments(segments):
+            if len(line) < min_vertices:
+                continue
+            contours.append({
+                "level": float(level),
+                "index": bool(index_flag),
+                "closed": bool(len(line) > 3 and np.array_equal(line[0], line[-1])),
+                "coords": line,
+            })
+    return contours
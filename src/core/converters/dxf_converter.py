@@ -4,14 +4,15 @@ import tempfile
 import json
 from pathlib import Path
 import ezdxf
-from simplekml import Kml
 import shapefile
-import pyproj
 from src.core.geometry.coordinate_utils import build_transformer, utm_to_latlon_coords, calculate_text_angle
 from src.utils.helpers import zip_directory
 from src.core.converters.geojson_converter import convert_to_geojson
+from src.core.converters.kml_writer import KmlWriter
+from src.core.converters.shapefile_writer import write_prj
+from src.core.converters.gpkg_writer import write_geopackage, geopackage_layers
 
-def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group_by: str = "layer"):
+def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group_by: str = "layer", gpkg: bool = False):
     try:
         doc = ezdxf.readfile(str(file_path))
         msp = doc.modelspace()
@@ -34,15 +35,17 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
     if not visible_layers:
         raise RuntimeError("No se encontraron layers visibles en el DXF.")
 
-    kml = Kml()
+    # KMZ por streaming: los placemarks se escriben a medida que se leen las entidades
+    kmz_buf = io.BytesIO()
+    kml = KmlWriter(kmz_buf, name=Path(file_path).stem, kmz=True)
     # Crear carpetas para organizar elementos
-    points_folder = kml.newfolder(name="📍 Puntos")
-    lines_folder = kml.newfolder(name="📏 Líneas")
-    polylines_folder = kml.newfolder(name="🔗 Polilíneas")
-    shapes_folder = kml.newfolder(name="🔷 Formas")
-    circles_folder = kml.newfolder(name="⭕ Círculos")
-    texts_folder = kml.newfolder(name="📝 Textos")
-    blocks_folder = kml.newfolder(name="🧩 Bloques")
+    points_folder = kml.folder("📍 Puntos")
+    lines_folder = kml.folder("📏 Líneas")
+    polylines_folder = kml.folder("🔗 Polilíneas")
+    shapes_folder = kml.folder("🔷 Formas")
+    circles_folder = kml.folder("⭕ Círculos")
+    texts_folder = kml.folder("📝 Textos")
+    blocks_folder = kml.folder("🧩 Bloques")
     
     json_data = {"layers": {layer: {"points": [], "lines": [], "polylines": [], "texts": [], "circles": [], "shapes": [], "blocks": []} for layer in visible_layers}}
 
@@ -112,7 +115,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
         if etype == "POINT":
             x, y = entity.dxf.location[0], entity.dxf.location[1]
             lon, lat = utm_to_latlon_coords(transformer_wgs84, x, y)
-            points_folder.newpoint(name=f"Point_{len(json_data['layers'][layer]['points'])}", coords=[(lon, lat)])
+            kml.point(f"Point_{len(json_data['layers'][layer]['points'])}", (lon, lat), folder=points_folder)
             json_data["layers"][layer]["points"].append({"x": x, "y": y, "lon": lon, "lat": lat})
             # SHP en EPSG de salida
             x_out, y_out = utm_to_latlon_coords(transformer_out, x, y)
@@ -125,7 +128,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
             end = entity.dxf.end
             lon1, lat1 = utm_to_latlon_coords(transformer_wgs84, start[0], start[1])
             lon2, lat2 = utm_to_latlon_coords(transformer_wgs84, end[0], end[1])
-            lines_folder.newlinestring(name=f"Line_{len(json_data['layers'][layer]['lines'])}", coords=[(lon1, lat1), (lon2, lat2)])
+            kml.linestring(f"Line_{len(json_data['layers'][layer]['lines'])}", [(lon1, lat1), (lon2, lat2)], folder=lines_folder)
             json_data["layers"][layer]["lines"].append({
                 "start": [start[0], start[1]],
                 "end": [end[0], end[1]],
@@ -145,7 +148,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
                 if len(vertices) < 2:
                     continue
                 coords_latlon_wgs84 = [utm_to_latlon_coords(transformer_wgs84, x, y) for x, y in vertices]
-                polylines_folder.newlinestring(name=f"Polyline_{len(json_data['layers'][layer]['polylines'])}", coords=coords_latlon_wgs84)
+                kml.linestring(f"Polyline_{len(json_data['layers'][layer]['polylines'])}", coords_latlon_wgs84, folder=polylines_folder)
                 json_data["layers"][layer]["polylines"].append({"vertices": vertices, "vertices_lonlat": coords_latlon_wgs84})
                 # SHP en EPSG de salida
                 coords_out = [utm_to_latlon_coords(transformer_out, x, y) for x, y in vertices]
@@ -162,7 +165,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
                     continue
                 coords_latlon = [utm_to_latlon_coords(transformer_wgs84, x, y) for x, y in vertices]
                 closed = bool(entity.dxf.flags & 1)
-                shapes_folder.newlinestring(name=f"Shape_{len(json_data['layers'][layer]['shapes'])}", coords=coords_latlon)
+                kml.linestring(f"Shape_{len(json_data['layers'][layer]['shapes'])}", coords_latlon, folder=shapes_folder)
                 json_data["layers"][layer]["shapes"].append({
                     "vertices": vertices,
                     "vertices_lonlat": coords_latlon,
@@ -187,7 +190,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
                 y = center[1] + radius * math.sin(angle)
                 lon, lat = utm_to_latlon_coords(transformer_wgs84, x, y)
                 coords_ll.append((lon, lat))
-            circles_folder.newlinestring(name=f"Circle_{len(json_data['layers'][layer]['circles'])}", coords=coords_ll)
+            kml.linestring(f"Circle_{len(json_data['layers'][layer]['circles'])}", coords_ll, folder=circles_folder)
             json_data["layers"][layer]["circles"].append({
                 "center": [center[0], center[1]],
                 "radius": radius,
@@ -240,7 +243,7 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
             x, y = entity.dxf.insert[0], entity.dxf.insert[1]
             lon, lat = utm_to_latlon_coords(transformer_wgs84, x, y)
             block_name = entity.dxf.name
-            blocks_folder.newpoint(name=f"Block_{len(json_data['layers'][layer]['blocks'])}", coords=[(lon, lat)])
+            kml.point(f"Block_{len(json_data['layers'][layer]['blocks'])}", (lon, lat), folder=blocks_folder)
             json_data["layers"][layer]["blocks"].append({
                 "block_name": block_name,
                 "x": x,
@@ -255,34 +258,20 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
             # Campos: ID, Layer, Type, BlockName
             w.record(f"B{len(json_data['layers'][layer]['blocks'])}", layer, "block", block_name)
 
-    kml_bytes = io.BytesIO()
-    # Usar tempfile para el KMZ
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        kmz_path = Path(tmp_dir) / "export.kmz"
-        kml.save(str(kmz_path))
-        with open(kmz_path, "rb") as f:
-            kml_bytes.write(f.read())
-    kml_bytes.seek(0)
+    kml.close()
 
-    # Cerrar writers y crear PRJ por EPSG de salida (WKT1_ESRI para QGIS)
-    prj_wkt = None
-    try:
-        prj_wkt = pyproj.CRS.from_epsg(int(output_epsg)).to_wkt(version='WKT1_ESRI')
-    except Exception:
-        prj_wkt = None
+    # Cerrar writers y crear PRJ por EPSG de salida (WKT1_ESRI para QGIS, cacheado por EPSG)
     for key, w in writers.items():
         try:
             w.close()
         except Exception:
             pass
-        if prj_wkt:
-            base_path = writer_paths.get(key)
-            if base_path:
-                try:
-                    with open(str(base_path) + ".prj", "w", encoding="utf-8") as prj_file:
-                        prj_file.write(prj_wkt)
-                except Exception:
-                    pass
+        base_path = writer_paths.get(key)
+        if base_path:
+            try:
+                write_prj(base_path, output_epsg)
+            except Exception:
+                pass
 
     shp_zip_bytes = zip_directory(shapefiles_dir)
 
@@ -290,12 +279,22 @@ def convert_dxf(file_path: Path, input_epsg: int, output_epsg: int, shapes_group
     json_bytes = json.dumps(json_data, indent=2).encode("utf-8")
     geojson_bytes = json.dumps(geojson_data, indent=2).encode("utf-8")
 
+    # GeoPackage en WGS84 como el GeoJSON: una tabla por capa (o tipo) y geometría, con índice R-tree
+    gpkg_bytes = None
+    if gpkg:
+        group_by = "type" if str(shapes_group_by).lower() == "type" else "layer"
+        with tempfile.TemporaryDirectory(prefix="gpkg_") as gpkg_dir:
+            gpkg_path = Path(gpkg_dir) / f"{Path(file_path).stem}.gpkg"
+            write_geopackage(gpkg_path, geopackage_layers(geojson_data.get("features", []), group_by=group_by), srs_id=4326)
+            gpkg_bytes = gpkg_path.read_bytes()
+
     return {
         "json": json_data,
         "json_bytes": json_bytes,
         "geojson": geojson_data,
         "geojson_bytes": geojson_bytes,
-        "kmz_bytes": kml_bytes.getvalue(),
+        "kmz_bytes": kmz_buf.getvalue(),
         "shp_zip_bytes": shp_zip_bytes,
         "shp_dir": str(shapefiles_dir),
+        "gpkg_bytes": gpkg_bytes,
     }
@@ -1,67 +1,106 @@
 import ezdxf
 import logging
-import json
+import numpy as np
 import pyproj
 from pathlib import Path
+from src.core.geometry.coordinate_utils import utm_epsg_for_lonlat
 
 logger = logging.getLogger(__name__)
 
-def export_geojson_to_dxf(geojson_obj: dict, dxf_path: Path, point_color="#ff0000", line_color="#0000ff", line_width=0.2):
+def _dxf_target_epsg(output_epsg, lon, lat):
+    """EPSG del DXF: output_epsg si es proyectado; si no (4326 o vacío), la zona UTM del centroide."""
+    if output_epsg:
+        try:
+            if pyproj.CRS.from_epsg(int(output_epsg)).is_projected:
+                return int(output_epsg)
+        except Exception as e:
+            logger.warning(f"DXF: EPSG de salida {output_epsg} no válido ({e}); se usa la zona UTM del centroide")
+    return utm_epsg_for_lonlat(lon, lat)
+
+def _coords_array(coords):
+    """Coordenadas de una parte como arreglo (N, 2); descarta vértices no numéricos."""
+    try:
+        arr = np.asarray(coords, dtype=float)
+        if arr.ndim == 2 and arr.shape[1] >= 2:
+            return arr[:, :2]
+    except (TypeError, ValueError):
+        pass
+    valid = [(float(c[0]), float(c[1])) for c in coords or []
+             if isinstance(c, (list, tuple)) and len(c) >= 2 and all(isinstance(v, (int, float)) for v in c[:2])]
+    return np.asarray(valid, dtype=float).reshape(-1, 2)
+
+def export_geojson_to_dxf(geojson_obj: dict, dxf_path: Path, point_color="#ff0000", line_color="#0000ff", line_width=0.2, output_epsg=None):
     """
-    Exporta GeoJSON a DXF transformando coordenadas WGS84 a UTM Zona 17 Sur (EPSG:32717).
+    Exporta GeoJSON a DXF transformando coordenadas WGS84 a UTM.
     
     AutoCAD/CivilCAD requieren coordenadas UTM (X, Y en metros), no lat/lon en grados.
-    Esta función detecta si las coordenadas están en WGS84 y las transforma automáticamente a UTM.
+    Si las coordenadas están en WGS84 se proyectan a output_epsg cuando es un CRS
+    proyectado (EPSG de salida del sidebar) o, si no, a la zona UTM del centroide
+    de los datos. Todas las coordenadas se recorren una sola vez hacia un arreglo,
+    se transforman en un único llamado vectorizado y las entidades se escriben
+    desde ese arreglo, sin copiar el GeoJSON.
     """
     try:
-        # Detectar si las coordenadas están en WGS84 (grados decimales)
-        def get_bounds(geojson):
-            coords = []
-            for f in geojson.get("features", []):
-                g = f.get("geometry", {})
-                c = g.get("coordinates")
-                if c:
-                    _collect_coords(c, coords)
-            if not coords:
-                return None
-            xs = [p[0] for p in coords]
-            ys = [p[1] for p in coords]
-            return (min(xs), min(ys), max(xs), max(ys))
+        # Partes de geometría: (tipo, capa, cerrada, inicio, fin, etiqueta) sobre un arreglo común
+        parts = []
+        chunks = []
+        count = 0
         
-        def _collect_coords(coords, acc):
-            if isinstance(coords, (list, tuple)):
-                if len(coords) >= 2 and isinstance(coords[0], (int, float)):
-                    acc.append((coords[0], coords[1]))
-                else:
-                    for c in coords:
-                        _collect_coords(c, acc)
+        def add_part(kind, layer, coords, closed=False, label=None):
+            nonlocal count
+            arr = _coords_array(coords)
+            if len(arr) < (1 if kind == "point" else 2):
+                return
+            parts.append((kind, layer, closed, count, count + len(arr), label))
+            chunks.append(arr)
+            count += len(arr)
+        
+        feats = geojson_obj.get("features", []) if geojson_obj.get("type") == "FeatureCollection" else []
+        for f in feats:
+            props = f.get("properties") or {}
+            g = f.get("geometry") or {}
+            t = g.get("type")
+            coords = g.get("coordinates")
+            if not coords:
+                continue
+            
+            label = props.get("name") or props.get("text") or props.get("label")
+            
+            if t == "Point":
+                add_part("point", "POINTS", [coords], label=label)
+            elif t == "MultiPoint":
+                add_part("point", "POINTS", coords)
+            elif t == "LineString":
+                add_part("line", "LINES", coords)
+            elif t == "MultiLineString":
+                for line in coords:
+                    add_part("line", "LINES", line)
+            elif t == "Polygon":
+                add_part("line", "POLYGONS", coords[0], closed=True)
+            elif t == "MultiPolygon":
+                for poly in coords:
+                    if poly:
+                        add_part("line", "POLYGONS", poly[0], closed=True)
         
-        bounds = get_bounds(geojson_obj)
+        xy = np.concatenate(chunks) if chunks else np.empty((0, 2))
         needs_transformation = False
-        transformer = None
         
-        if bounds:
-            min_x, min_y, max_x, max_y = bounds
+        if len(xy):
+            min_x, min_y = xy.min(axis=0)
+            max_x, max_y = xy.max(axis=0)
             # Detectar WGS84: valores entre -180 y 180 para X, -90 y 90 para Y
             if -180 <= min_x <= 180 and -180 <= max_x <= 180 and -90 <= min_y <= 90 and -90 <= max_y <= 90:
                 needs_transformation = True
-                # Crear transformador de WGS84 (EPSG:4326) a UTM Zona 17 Sur (EPSG:32717)
-                # UTM Zona 17 Sur es el sistema correcto para Ecuador
-                transformer = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:32717", always_xy=True)
-                logger.info(f"DXF: Coordenadas WGS84 detectadas. Transformando a UTM Zona 17 Sur (EPSG:32717)")
+                lon_c, lat_c = xy.mean(axis=0)
+                target_epsg = _dxf_target_epsg(output_epsg, lon_c, lat_c)
+                transformer = pyproj.Transformer.from_crs("EPSG:4326", f"EPSG:{target_epsg}", always_xy=True)
+                logger.info(f"DXF: Coordenadas WGS84 detectadas. Transformando a EPSG:{target_epsg} (centroide {lon_c:.4f}, {lat_c:.4f})")
                 logger.info(f"DXF: Bounds originales: X=[{min_x:.6f}, {max_x:.6f}], Y=[{min_y:.6f}, {max_y:.6f}]")
-        
-        # Transformar GeoJSON si es necesario
-        if needs_transformation and transformer:
-            geojson_transformed = transform_geojson_coords(geojson_obj, transformer)
-            # Logging de coordenadas transformadas para verificación
-            bounds_transformed = get_bounds(geojson_transformed)
-            if bounds_transformed:
-                min_x_t, min_y_t, max_x_t, max_y_t = bounds_transformed
-                logger.info(f"DXF: Bounds UTM: X=[{min_x_t:.2f}, {max_x_t:.2f}], Y=[{min_y_t:.2f}, {max_y_t:.2f}]")
-        else:
-            geojson_transformed = geojson_obj
-            logger.info(f"DXF: Coordenadas ya proyectadas, sin transformación")
+                xs, ys = transformer.transform(xy[:, 0], xy[:, 1])
+                xy = np.column_stack((xs, ys))
+                logger.info(f"DXF: Bounds proyectados: X=[{xs.min():.2f}, {xs.max():.2f}], Y=[{ys.min():.2f}, {ys.max():.2f}]")
+            else:
+                logger.info(f"DXF: Coordenadas ya proyectadas, sin transformación")
         
         # Crear DXF con coordenadas transformadas
         doc = ezdxf.new("R2010")
@@ -83,77 +122,25 @@ def export_geojson_to_dxf(geojson_obj: dict, dxf_path: Path, point_color="#ff000
         adjusted_text_height = 5.0  # Altura fija en metros para texto
         text_offset = 2.0  # Offset fijo en metros
         
-        def add_point(x, y):
-            try:
-                msp.add_point((x, y), dxfattribs={
-                    "layer": "POINTS",
-                    "true_color": p_color_int
-                })
-            except Exception:
-                pass
-                
-        def add_polyline(coords, layer="LINES", closed=False):
+        point_attribs = {"layer": "POINTS", "true_color": p_color_int}
+        text_attribs = {"layer": "TEXT_LABELS", "height": adjusted_text_height, "true_color": p_color_int}
+        vertices = xy.tolist()
+        for kind, layer, closed, start, end, label in parts:
             try:
-                if not coords or len(coords) < 2:
-                    return
-                valid_coords = []
-                for c in coords:
-                    if len(c) >= 2 and all(isinstance(v, (int, float)) for v in c[:2]):
-                        valid_coords.append((float(c[0]), float(c[1])))
-                if len(valid_coords) < 2:
-                    return
-                
-                attribs = {
-                    "layer": layer,
-                    "true_color": l_color_int,
-                }
-                if closed:
-                    attribs["closed"] = 1
-                
-                line = msp.add_lwpolyline(valid_coords, dxfattribs=attribs)
-                line.dxf.const_width = adjusted_line_width
+                if kind == "point":
+                    for x, y in vertices[start:end]:
+                        msp.add_point((x, y), dxfattribs=point_attribs)
+                    if label:
+                        x, y = vertices[start]
+                        msp.add_text(str(label), dxfattribs=text_attribs).set_placement((x + text_offset, y + text_offset))
+                else:
+                    attribs = {"layer": layer, "true_color": l_color_int}
+                    if closed:
+                        attribs["closed"] = 1
+                    line = msp.add_lwpolyline(vertices[start:end], dxfattribs=attribs)
+                    line.dxf.const_width = adjusted_line_width
             except Exception:
                 pass
-
-        feats = geojson_transformed.get("features", []) if geojson_transformed.get("type") == "FeatureCollection" else []
-        for f in feats:
-            props = f.get("properties", {})
-            g = f.get("geometry", {})
-            t = g.get("type")
-            
-            label = props.get("name") or props.get("text") or props.get("label")
-            
-            if t == "Point":
-                coords = g.get("coordinates")
-                if coords and len(coords) >= 2:
-                    add_point(coords[0], coords[1])
-                    if label:
-                        try:
-                            msp.add_text(str(label), dxfattribs={
-                                "layer": "TEXT_LABELS",
-                                "height": adjusted_text_height,
-                                "true_color": p_color_int
-                            }).set_placement((coords[0] + text_offset, coords[1] + text_offset))
-                        except Exception:
-                            pass
-            elif t == "MultiPoint":
-                for pt in g.get("coordinates", []):
-                    if pt and len(pt) >= 2:
-                        add_point(pt[0], pt[1])
-            elif t == "LineString":
-                coords = g.get("coordinates", [])
-                add_polyline(coords, layer="LINES", closed=False)
-            elif t == "MultiLineString":
-                for line in g.get("coordinates", []):
-                    add_polyline(line, layer="LINES", closed=False)
-            elif t == "Polygon":
-                rings = g.get("coordinates", [])
-                if rings:
-                    add_polyline(rings[0], layer="POLYGONS", closed=True)
-            elif t == "MultiPolygon":
-                for poly in g.get("coordinates", []):
-                    if poly:
-                        add_polyline(poly[0], layer="POLYGONS", closed=True)
         
         doc.saveas(str(dxf_path))
         logger.info(f"DXF exportado exitosamente a {dxf_path}")
@@ -161,37 +148,3 @@ def export_geojson_to_dxf(geojson_obj: dict, dxf_path: Path, point_color="#ff000
     except Exception as e:
         logger.error(f"Error exportando DXF: {e}")
         return False
-
-
-def transform_geojson_coords(geojson_obj: dict, transformer: pyproj.Transformer) -> dict:
-    """
-    Transforma todas las coordenadas de un GeoJSON usando el transformador proporcionado.
-    """
-    def transform_coords(coords):
-        if isinstance(coords, (list, tuple)):
-            if len(coords) >= 2 and isinstance(coords[0], (int, float)) and isinstance(coords[1], (int, float)):
-                # Es un par de coordenadas [lon, lat]
-                x, y = transformer.transform(coords[0], coords[1])
-                return [x, y]
-            else:
-                # Es una lista de coordenadas
-                return [transform_coords(c) for c in coords]
-        return coords
-    
-    # Crear copia profunda del GeoJSON
-    result = json.loads(json.dumps(geojson_obj))
-    
-    if result.get("type") == "FeatureCollection":
-        for f in result.get("features", []):
-            g = f.get("geometry")
-            if g and isinstance(g, dict) and "coordinates" in g:
-                g["coordinates"] = transform_coords(g["coordinates"])
-    elif result.get("type") == "Feature":
-        g = result.get("geometry")
-        if g and isinstance(g, dict) and "coordinates" in g:
-            g["coordinates"] = transform_coords(g["coordinates"])
-    elif result.get("type") in ("Point", "LineString", "Polygon", "MultiPoint", "MultiLineString", "MultiPolygon"):
-        if "coordinates" in result:
-            result["coordinates"] = transform_coords(result["coordinates"])
-    
-    return result
@@ -0,0 +1,253 @@
+import re
+import json
+import struct
+import logging
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pyproj
+import shapely
+
+logger = logging.getLogger(__name__)
+
+GPKG_APPLICATION_ID = 0x47504B47  # "GPKG"
+GPKG_USER_VERSION = 10300  # GeoPackage 1.3
+# Filas por executemany: acota la memoria de los blobs WKB de una tabla grande
+GPKG_INSERT_CHUNK = 50000
+
+# Tabla por grupo y familia de geometría (una tabla GeoPackage declara un solo tipo)
+GEOMETRY_FAMILIES = {
+    "Point": "puntos", "MultiPoint": "puntos",
+    "LineString": "lineas", "MultiLineString": "lineas",
+    "Polygon": "poligonos", "MultiPolygon": "poligonos",
+}
+
+# Tipo de la columna geom según el type id de shapely; tablas con tipos mezclados usan GEOMETRY
+GPKG_GEOMETRY_TYPES = {0: "POINT", 1: "LINESTRING", 3: "POLYGON", 4: "MULTIPOINT", 5: "MULTILINESTRING", 6: "MULTIPOLYGON"}
+
+# Triggers estándar de la extensión gpkg_rtree_index (las funciones ST_* las provee el lector, p. ej. GDAL/QGIS)
+_RTREE_TRIGGERS = """
+CREATE TRIGGER "rtree_{t}_geom_insert" AFTER INSERT ON "{t}"
+WHEN (new.geom NOT NULL AND NOT ST_IsEmpty(NEW.geom))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_geom" VALUES (NEW.fid, ST_MinX(NEW.geom), ST_MaxX(NEW.geom), ST_MinY(NEW.geom), ST_MaxY(NEW.geom));
+END;
+CREATE TRIGGER "rtree_{t}_geom_update1" AFTER UPDATE OF geom ON "{t}"
+WHEN OLD.fid = NEW.fid AND (NEW.geom NOTNULL AND NOT ST_IsEmpty(NEW.geom))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_geom" VALUES (NEW.fid, ST_MinX(NEW.geom), ST_MaxX(NEW.geom), ST_MinY(NEW.geom), ST_MaxY(NEW.geom));
+END;
+CREATE TRIGGER "rtree_{t}_geom_update2" AFTER UPDATE OF geom ON "{t}"
+WHEN OLD.fid = NEW.fid AND (NEW.geom ISNULL OR ST_IsEmpty(NEW.geom))
+BEGIN
+  DELETE FROM "rtree_{t}_geom" WHERE id = OLD.fid;
+END;
+CREATE TRIGGER "rtree_{t}_geom_update3" AFTER UPDATE ON "{t}"
+WHEN OLD.fid != NEW.fid AND (NEW.geom NOTNULL AND NOT ST_IsEmpty(NEW.geom))
+BEGIN
+  DELETE FROM "rtree_{t}_geom" WHERE id = OLD.fid;
+  INSERT OR REPLACE INTO "rtree_{t}_geom" VALUES (NEW.fid, ST_MinX(NEW.geom), ST_MaxX(NEW.geom), ST_MinY(NEW.geom), ST_MaxY(NEW.geom));
+END;
+CREATE TRIGGER "rtree_{t}_geom_update4" AFTER UPDATE ON "{t}"
+WHEN OLD.fid != NEW.fid AND (NEW.geom ISNULL OR ST_IsEmpty(NEW.geom))
+BEGIN
+  DELETE FROM "rtree_{t}_geom" WHERE id IN (OLD.fid, NEW.fid);
+END;
+CREATE TRIGGER "rtree_{t}_geom_delete" AFTER DELETE ON "{t}"
+WHEN old.geom NOT NULL
+BEGIN
+  DELETE FROM "rtree_{t}_geom" WHERE id = OLD.fid;
+END;
+"""
+
+@lru_cache(maxsize=32)
+def _srs_definition(epsg):
+    """(nombre, WKT) del EPSG para gpkg_spatial_ref_sys."""
+    crs = pyproj.CRS.from_epsg(int(epsg))
+    return crs.name, crs.to_wkt(version="WKT1_GDAL")
+
+def _table_name(name, used):
+    """Nombre de tabla SQL seguro y único (sin prefijos reservados gpkg_/rtree_)."""
+    base = re.sub(r"\W+", "_", str(name)).strip("_") or "capa"
+    if base[0].isdigit() or base.lower().startswith(("gpkg_", "rtree_", "sqlite_")):
+        base = f"t_{base}"
+    candidate, idx = base, 1
+    while candidate.lower() in used:
+        candidate = f"{base}_{idx}"
+        idx += 1
+    used.add(candidate.lower())
+    return candidate
+
+def _sql_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if hasattr(value, "item"):  # escalares numpy (p. ej. el "No" de los puntos topográficos)
+        return value.item()
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+def _column_type(values):
+    kinds = {type(v) for v in values if v is not None}
+    if kinds and kinds <= {int, bool}:
+        return "INTEGER"
+    if kinds and kinds <= {int, bool, float}:
+        return "REAL"
+    return "TEXT"
+
+def geopackage_layers(features, group_by="layer"):
+    """
+    Agrupa features GeoJSON en tablas '<grupo>_<puntos|lineas|poligonos>', con el
+    grupo tomado de properties[group_by] ('layer' o 'type'). Retorna {nombre: [features]}.
+    """
+    layers = {}
+    for f in features:
+        geom = f.get("geometry") or {}
+        family = GEOMETRY_FAMILIES.get(geom.get("type"))
+        if family is None:
+            continue
+        group = (f.get("properties") or {}).get(group_by) or "capa"
+        layers.setdefault(f"{group}_{family}", []).append(f)
+    return layers
+
+def _geometry_blobs(geoms, srs_id):
+    """
+    Geometrías GeoPackage: encabezado GP (little endian, envolvente XY salvo en
+    puntos) seguido del WKB ISO. El WKB y los límites se calculan vectorizados.
+    """
+    wkb = shapely.to_wkb(geoms, output_dimension=3, byte_order=1, flavor="iso")
+    bounds = shapely.bounds(geoms)
+    is_point = shapely.get_type_id(geoms) == 0
+    point_header = b"GP\x00\x01" + struct.pack("<i", srs_id)
+    envelope = struct.Struct("<i4d")
+    return [
+        point_header + w if p else b"GP\x00\x03" + envelope.pack(srs_id, b[0], b[2], b[1], b[3]) + w
+        for w, b, p in zip(wkb.tolist(), bounds.tolist(), is_point.tolist())
+    ], bounds
+
+def _write_table(conn, table, features, srs_id):
+    geoms = shapely.from_geojson([json.dumps(f["geometry"]) for f in features], on_invalid="ignore")
+    valid = ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)
+    features = [f for f, v in zip(features, valid) if v]
+    geoms = geoms[valid]
+    if not features:
+        return 0
+
+    # Columnas: unión de propiedades (sin distinguir mayúsculas, como SQLite)
+    names = []
+    seen = {"fid", "geom"}
+    for f in features:
+        for key in (f.get("properties") or {}):
+            if str(key).lower() not in seen:
+                seen.add(str(key).lower())
+                names.append(key)
+    rows = [[_sql_value((f.get("properties") or {}).get(k)) for k in names] for f in features]
+    types = [_column_type([r[i] for r in rows]) for i in range(len(names))]
+
+    type_ids = np.unique(shapely.get_type_id(geoms))
+    geometry_type = GPKG_GEOMETRY_TYPES.get(int(type_ids[0]), "GEOMETRY") if len(type_ids) == 1 else "GEOMETRY"
+    has_z = shapely.has_z(geoms)
+    z_flag = 1 if has_z.all() else (2 if has_z.any() else 0)
+
+    column_sql = "".join(f', "{n.replace(chr(34), chr(34) * 2)}" {t}' for n, t in zip(names, types))
+    conn.execute(f'CREATE TABLE "{table}" (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom {geometry_type}{column_sql})')
+    insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" * (len(names) + 2))})'
+    rtree_rows = []
+    for start in range(0, len(features), GPKG_INSERT_CHUNK):
+        blobs, bounds = _geometry_blobs(geoms[start:start + GPKG_INSERT_CHUNK], srs_id)
+        conn.executemany(insert, ((start + i + 1, blob, *row) for i, (blob, row) in enumerate(zip(blobs, rows[start:start + GPKG_INSERT_CHUNK]))))
+        rtree_rows.append((np.arange(start + 1, start + len(blobs) + 1), bounds))
+
+    all_bounds = np.concatenate([b for _, b in rtree_rows])
+    conn.execute(
+        "INSERT INTO gpkg_contents (table_name, data_type, identifier, last_change, min_x, min_y, max_x, max_y, srs_id) "
+        "VALUES (?, 'features', ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'), ?, ?, ?, ?, ?)",
+        (table, table, *np.nanmin(all_bounds[:, :2], axis=0).tolist(), *np.nanmax(all_bounds[:, 2:], axis=0).tolist(), srs_id)
+    )
+    conn.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, ?, 0)", (table, geometry_type, srs_id, z_flag))
+
+    # Índice espacial al final: se carga de una vez y recién entonces se crean los triggers
+    conn.execute(f'CREATE VIRTUAL TABLE "rtree_{table}_geom" USING rtree(id, minx, maxx, miny, maxy)')
+    for fids, bounds in rtree_rows:
+        conn.executemany(
+            f'INSERT INTO "rtree_{table}_geom" VALUES (?, ?, ?, ?, ?)',
+            zip(fids.tolist(), bounds[:, 0].tolist(), bounds[:, 2].tolist(), bounds[:, 1].tolist(), bounds[:, 3].tolist())
+        )
+    # executescript haría COMMIT de la transacción en curso: los triggers se ejecutan uno a uno
+    for statement in _RTREE_TRIGGERS.format(t=table).split("END;")[:-1]:
+        conn.execute(statement + "END;")
+    conn.execute(
+        "INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', 'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')",
+        (table,)
+    )
+    return len(features)
+
+def write_geopackage(path, layers, srs_id=4326):
+    """
+    Escribe un GeoPackage (SQLite estándar) con una tabla de features por capa.
+
+    layers es {nombre: [features GeoJSON]} (ver geopackage_layers) con
+    coordenadas en srs_id. Todo se inserta con executemany en una sola
+    transacción y el índice R-tree de cada tabla se construye al final.
+    Retorna {tabla: cantidad de features}.
+    """
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    counts = {}
+    try:
+        conn.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+        conn.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        conn.execute(
+            "CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL, "
+            "organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, "
+            "description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), "
+            "min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER, "
+            "CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))"
+        )
+        conn.execute(
+            "CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, "
+            "srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name), "
+            "CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name), "
+            "CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))"
+        )
+        conn.execute(
+            "CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL, "
+            "scope TEXT NOT NULL, CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))"
+        )
+        srs_rows = [
+            ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"),
+            ("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"),
+        ]
+        for epsg in sorted({4326, int(srs_id)}):
+            name, wkt = _srs_definition(epsg)
+            srs_rows.append((name, epsg, "EPSG", epsg, wkt, None))
+        conn.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", srs_rows)
+
+        used = set()
+        for name, features in layers.items():
+            table = _table_name(name, used)
+            count = _write_table(conn, table, features, int(srs_id))
+            if count:
+                counts[table] = count
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        # Un GeoPackage a medio armar no sirve: no se deja en la carpeta de salida
+        conn.close()
+        path.unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+    logger.info(f"GPKG: {sum(counts.values())} features en {len(counts)} tabla(s) → {path}")
+    return counts
@@ -1,14 +1,25 @@
 import numpy as np
 import scipy.interpolate as interp
 from scipy.interpolate import griddata
+from scipy import ndimage
+from scipy.spatial import Delaunay, QhullError
+import shapely
 import rasterio
 from rasterio.transform import Affine
 from rasterio.crs import CRS
+from rasterio.shutil import copy as rio_copy
 import tempfile
 import os
 import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 import pandas as pd
 import streamlit as st
+from src.core.converters.interpolation_cv import select_interpolation_method
+
+logger = logging.getLogger(__name__)
 
 def validate_heatmap_data(points_df):
     """Valida los datos para el mapa de calor y proporciona información de debug."""
@@ -71,9 +82,26 @@ def debug_heatmap_coordinates(points_df, bounds, resolution):
         }
     }
 
-def create_heatmap_debug_file(points_df, bounds, resolution, output_path):
+DEBUG_DUMP_CHUNK = 100000
+
+def _format_points_block(numbers, x_coords, y_coords, z_values):
+    """Formatea un bloque de puntos con una sola operación de formato en C."""
+    flat = np.column_stack((numbers, x_coords, y_coords, z_values)).ravel().tolist()
+    return ("P%d: X=%.6f, Y=%.6f, Z=%.6f\n" * len(numbers)) % tuple(flat)
+
+def create_heatmap_debug_file(points_df, bounds, resolution, output_path, timings=None, points_csv=False):
+    """
+    Escribe el reporte de debug del mapa de calor.
+
+    El volcado de puntos se escribe por bloques formateados de una vez (o como CSV
+    hermano con points_csv=True), las estadísticas salen de reducciones de NumPy y,
+    si se pasan, se incluyen los tiempos de cada etapa de la interpolación.
+    """
     try:
         debug_info = debug_heatmap_coordinates(points_df, bounds, resolution)
+        xyz = points_df[['x', 'y', 'cota']].to_numpy(dtype=float)
+        index = points_df.index.to_numpy()
+        numbers = index + 1 if np.issubdtype(index.dtype, np.integer) else np.arange(1, len(points_df) + 1)
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write("=== DEBUG MAPA DE CALOR ===\n\n")
             f.write(f"Fecha: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
@@ -90,9 +118,27 @@ def create_heatmap_debug_file(points_df, bounds, resolution, output_path):
             f.write("=== PUNTOS DE MUESTRA ===\n")
             p = debug_info['points_sample']
             f.write(f"Primero: {p['first_point']}\nÚltimo: {p['last_point']}\nCentro: {p['center']}\n\n")
+            f.write("=== ESTADÍSTICAS ===\n")
+            f.write(f"Puntos: {len(xyz)}\n")
+            if len(xyz):
+                mins, maxs, means, stds = xyz.min(axis=0), xyz.max(axis=0), xyz.mean(axis=0), xyz.std(axis=0)
+                for col, name in enumerate(("X", "Y", "Z")):
+                    f.write(f"{name}: min={mins[col]:.6f}, max={maxs[col]:.6f}, media={means[col]:.6f}, desv={stds[col]:.6f}\n")
+            f.write("\n")
+            if timings:
+                f.write("=== TIEMPOS POR ETAPA ===\n")
+                for stage, seconds in timings.items():
+                    f.write(f"{stage}: {seconds * 1000:.1f} ms\n")
+                f.write(f"Total: {sum(timings.values()) * 1000:.1f} ms\n\n")
             f.write("=== TODOS LOS PUNTOS ===\n")
-            for i, row in points_df.iterrows():
-                f.write(f"P{i+1}: X={row['x']:.6f}, Y={row['y']:.6f}, Z={row['cota']:.6f}\n")
+            if points_csv:
+                csv_path = os.path.splitext(output_path)[0] + "_puntos.csv"
+                pd.DataFrame({"No": numbers, "x": xyz[:, 0], "y": xyz[:, 1], "cota": xyz[:, 2]}).to_csv(csv_path, index=False, float_format="%.6f")
+                f.write(f"Ver {os.path.basename(csv_path)}\n")
+            else:
+                for start in range(0, len(xyz), DEBUG_DUMP_CHUNK):
+                    stop = start + DEBUG_DUMP_CHUNK
+                    f.write(_format_points_block(numbers[start:stop], xyz[start:stop, 0], xyz[start:stop, 1], xyz[start:stop, 2]))
         return True
     except Exception as e:
         st.error(f"Error al crear archivo de debug: {e}")
@@ -121,50 +167,322 @@ def get_crs_options():
         'EPSG:3118': 'MAGNA-SIRGAS / Colombia West zone',
     }
 
-def create_heatmap_geotiff_point_perfect(points_list, crs_code='EPSG:32717', resolution=100, padding_percent=1.0, method='cubic'):
-    if not points_list or len(points_list) < 3:
+COG_OVERVIEW_RESAMPLING = ["average", "bilinear", "cubic", "nearest", "mode"]
+
+def _crs_from_code(crs_code):
+    epsg = int(crs_code.split(':')[1]) if crs_code.startswith('EPSG:') else None
+    return CRS.from_epsg(epsg) if epsg else CRS.from_string(crs_code)
+
+def validate_cog(path, blocksize=256):
+    """Verifica que un GeoTIFF tenga layout COG: teselado, overviews internas y encabezado optimizado."""
+    errors = []
+    with rasterio.open(path) as src:
+        structure = src.tags(ns="IMAGE_STRUCTURE")
+        if structure.get("LAYOUT") != "COG":
+            errors.append("El archivo no declara LAYOUT=COG")
+        if max(src.width, src.height) > blocksize and not src.profile.get("tiled"):
+            errors.append("El raster no está teselado")
+        overviews = src.overviews(1)
+        if max(src.width, src.height) > blocksize and not overviews:
+            errors.append("El raster no tiene overviews internas")
+    return {"valid": not errors, "errors": errors, "overviews": overviews}
+
+HEATMAP_DTYPES = ["float32", "uint16", "int16"]
+
+def quantize_grid(grid, dtype="uint16", precision=0.01):
+    """
+    Cuantiza una grilla float a uint16/int16 con scale/offset elegidos del rango de z.
+
+    Se usa la precisión pedida salvo que el rango no quepa en los niveles
+    disponibles; en ese caso la escala crece lo justo. El valor extremo del tipo
+    queda reservado como nodata. Retorna (grilla, scale, offset, nodata) con
+    z = q * scale + offset.
+    """
+    info = np.iinfo(dtype)
+    if info.min == 0:
+        nodata, q_min, q_max = info.max, 0, info.max - 1
+    else:
+        nodata, q_min, q_max = info.min, info.min + 1, info.max
+    finite = np.isfinite(grid)
+    z_min = float(np.min(grid[finite])) if finite.any() else 0.0
+    z_max = float(np.max(grid[finite])) if finite.any() else 0.0
+    # Un nivel de holgura para alinear el offset a un múltiplo de la escala
+    scale = max(float(precision), (z_max - z_min) / float(q_max - q_min - 1))
+    offset = np.floor(z_min / scale) * scale - q_min * scale
+    quantized = np.full(grid.shape, nodata, dtype=dtype)
+    quantized[finite] = np.clip(np.rint((grid[finite] - offset) / scale), q_min, q_max).astype(dtype)
+    return quantized, scale, offset, nodata
+
+def write_heatmap_geotiff(grid, transform, crs_code, tags=None, cog=False, overview_resampling="average", dtype="float32", precision=0.01):
+    """
+    Escribe una grilla como GeoTIFF teselado y retorna los bytes.
+
+    Con cog=True el archivo se reescribe con el driver COG: overviews internas
+    con el remuestreo indicado y predictor (de punto flotante o entero), de modo
+    que los visores lean solo el nivel necesario para el zoom actual. Con dtype
+    uint16/int16 la grilla se cuantiza con quantize_grid y el scale/offset queda
+    en los metadatos de la banda.
+    """
+    height, width = grid.shape
+    crs = _crs_from_code(crs_code)
+    if dtype in ("uint16", "int16"):
+        data, scale, offset, nodata = quantize_grid(grid, dtype=dtype, precision=precision)
+        predictor = "STANDARD"
+    else:
+        data, scale, offset, nodata = grid.astype(rasterio.float32), None, None, np.nan
+        dtype, predictor = rasterio.float32, "FLOATING_POINT"
+    with tempfile.NamedTemporaryFile(suffix='.tif', delete=False) as tmp:
+        tmp_path = tmp.name
+    paths = [tmp_path]
+    try:
+        with rasterio.open(tmp_path, 'w', driver='GTiff', height=height, width=width, count=1, dtype=dtype, crs=crs, transform=transform, nodata=nodata, compress='lzw', predictor=2 if scale is not None else 1, tiled=True, blockxsize=256, blockysize=256, interleave='band', photometric='minisblack') as dst:
+            dst.write(data, 1)
+            if scale is not None:
+                dst.scales = (scale,)
+                dst.offsets = (offset,)
+            if tags:
+                dst.update_tags(**tags)
+            dst.update_tags(SOFTWARE="Antigravity Heatmap", DATETIME=time.strftime("%Y:%m:%d %H:%M:%S"))
+        out_path = tmp_path
+        if cog:
+            if overview_resampling not in COG_OVERVIEW_RESAMPLING:
+                overview_resampling = "average"
+            out_path = tmp_path[:-4] + "_cog.tif"
+            paths.append(out_path)
+            rio_copy(tmp_path, out_path, driver="COG", COMPRESS="LZW", PREDICTOR=predictor, BLOCKSIZE="256", OVERVIEW_RESAMPLING=overview_resampling.upper())
+            check = validate_cog(out_path)
+            if not check["valid"]:
+                raise RuntimeError(f"COG inválido: {'; '.join(check['errors'])}")
+        with open(out_path, 'rb') as f:
+            return f.read()
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
+
+# Cachés de superficies a nivel de proceso: las comparten las sesiones de Streamlit, que corren en hilos.
+# Hay uno por propósito (mapa de calor, volúmenes) para que un uso no desaloje las superficies del otro;
+# los límites aplican a cada uno
+SURFACE_CACHE_SIZE = 8
+SURFACE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_SURFACE_CACHES = {}
+_SURFACE_CACHE_LOCK = threading.Lock()
+
+def _surface_nbytes(entry):
+    """Memoria aproximada de una entrada: puntos, triangulación (incluida su transformada baricéntrica) y máscara."""
+    total = entry["points"].nbytes + sum(m.nbytes for m in entry["masks"].values())
+    tri = entry["triangulation"]
+    if tri is not None:
+        total += tri.points.nbytes + tri.simplices.nbytes + tri.neighbors.nbytes + tri.equations.nbytes + tri.nsimplex * 48
+    return total
+
+def _trim_surface_cache(cache):
+    """Descarta las entradas más viejas por cantidad y por memoria. Llamar con _SURFACE_CACHE_LOCK tomado."""
+    total = sum(_surface_nbytes(e) for e in cache.values())
+    while len(cache) > 1 and (len(cache) > SURFACE_CACHE_SIZE or total > SURFACE_CACHE_MAX_BYTES):
+        _, evicted = cache.popitem(last=False)
+        total -= _surface_nbytes(evicted)
+
+def get_cached_surface(points_xy, purpose="heatmap"):
+    """
+    Retorna la entrada de caché de un conjunto de puntos XY: la triangulación de
+    Delaunay (se arma recién cuando se pide, ver surface_triangulation) y los
+    hulls/máscara ya calculados. Repetir una corrida con los mismos puntos
+    reutiliza la triangulación en lugar de recalcularla. Cada propósito tiene su
+    caché, limitado a SURFACE_CACHE_SIZE entradas y SURFACE_CACHE_MAX_BYTES.
+    """
+    points_xy = np.ascontiguousarray(points_xy, dtype=float)
+    key = hashlib.blake2b(points_xy.tobytes(), digest_size=16).hexdigest()
+    with _SURFACE_CACHE_LOCK:
+        cache = _SURFACE_CACHES.setdefault(purpose, OrderedDict())
+        entry = cache.get(key)
+        if entry is None:
+            entry = {"points": points_xy, "triangulation": None, "hulls": {}, "masks": {}, "purpose": purpose}
+            cache[key] = entry
+            _trim_surface_cache(cache)
+        else:
+            cache.move_to_end(key)
+    return entry
+
+def surface_triangulation(surface):
+    """
+    Triangulación de Delaunay de una entrada de caché, calculada la primera vez que
+    se pide (solo linear/cubic la usan). Lanza QhullError con puntos degenerados.
+    """
+    if surface["triangulation"] is None:
+        tri = Delaunay(surface["points"])
+        with _SURFACE_CACHE_LOCK:
+            surface["triangulation"] = tri
+            _trim_surface_cache(_SURFACE_CACHES[surface["purpose"]])
+    return surface["triangulation"]
+
+def interpolate_on_surface(surface, values, xi, yi, method='linear'):
+    """
+    Interpola sobre la triangulación cacheada (equivalente a griddata sin re-triangular).
+    Si los puntos no se pueden triangular (colineales, repetidos) se usa 'nearest'.
+    """
+    if method != 'nearest':
+        try:
+            tri = surface_triangulation(surface)
+        except QhullError as e:
+            logger.warning(f"Triangulación no disponible ({str(e).strip().splitlines()[0]}); se interpola con 'nearest'")
+            method = 'nearest'
+    if method == 'nearest':
+        return interp.NearestNDInterpolator(surface["points"], values)(xi, yi)
+    if method == 'cubic':
+        return interp.CloughTocher2DInterpolator(tri, values, fill_value=np.nan)(xi, yi)
+    return interp.LinearNDInterpolator(tri, values, fill_value=np.nan)(xi, yi)
+
+def get_hull_mask(surface, x_grid, y_grid, ratio=0.3):
+    """
+    Máscara booleana (filas = y) de los nodos de la grilla dentro del hull cóncavo de
+    los puntos. Se evalúa con shapely.contains_xy sobre toda la grilla de una vez y
+    se guarda en la entrada de caché; solo se conserva la última máscara, que es la
+    que reutiliza una corrida repetida con la misma grilla.
+    """
+    mask_key = (round(float(ratio), 4), len(x_grid), len(y_grid), float(x_grid[0]), float(x_grid[-1]), float(y_grid[0]), float(y_grid[-1]))
+    mask = surface["masks"].get(mask_key)
+    if mask is not None:
+        return mask
+    hull_key = round(float(ratio), 4)
+    hull = surface["hulls"].get(hull_key)
+    if hull is None:
+        hull = shapely.concave_hull(shapely.multipoints(surface["points"]), ratio=ratio)
+        surface["hulls"][hull_key] = hull
+    # Medio paso de tolerancia para no perder los nodos sobre el borde del hull
+    half_step = 0.5 * max(abs(x_grid[1] - x_grid[0]), abs(y_grid[1] - y_grid[0])) if len(x_grid) > 1 and len(y_grid) > 1 else 0.0
+    region = hull.buffer(half_step) if half_step > 0 else hull
+    shapely.prepare(region)
+    X_grid, Y_grid = np.meshgrid(x_grid, y_grid, indexing='xy')
+    mask = shapely.contains_xy(region, X_grid, Y_grid)
+    surface["masks"] = {mask_key: mask}
+    return mask
+
+BIN_STATISTICS = ["mean", "min", "max"]
+
+def bin_points_to_grid(x_coords, y_coords, z_values, x_grid, y_grid):
+    """
+    Agrupa los puntos en el nodo más cercano de la grilla (vectorizado con bincount).
+
+    Retorna mean/min/max/count por celda como arreglos (filas = y, columnas = x)
+    y los índices planos de las celdas ocupadas.
+    """
+    nx, ny = len(x_grid), len(y_grid)
+    step_x = (x_grid[-1] - x_grid[0]) / (nx - 1) if nx > 1 else 1.0
+    step_y = (y_grid[-1] - y_grid[0]) / (ny - 1) if ny > 1 else 1.0
+    xi = np.clip(np.rint((x_coords - x_grid[0]) / step_x), 0, nx - 1).astype(np.intp)
+    yi = np.clip(np.rint((y_coords - y_grid[0]) / step_y), 0, ny - 1).astype(np.intp)
+    cells = yi * nx + xi
+    count = np.bincount(cells, minlength=nx * ny)
+    sums = np.bincount(cells, weights=z_values, minlength=nx * ny)
+    order = np.argsort(cells, kind='stable')
+    sorted_cells, sorted_z = cells[order], z_values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    occupied = sorted_cells[starts]
+    stats = {}
+    for name, values in (("min", np.minimum.reduceat(sorted_z, starts)), ("max", np.maximum.reduceat(sorted_z, starts))):
+        full = np.full(nx * ny, np.nan)
+        full[occupied] = values
+        stats[name] = full.reshape(ny, nx)
+    mean = np.full(nx * ny, np.nan)
+    mean[occupied] = sums[occupied] / count[occupied]
+    stats["mean"] = mean.reshape(ny, nx)
+    stats["count"] = count.reshape(ny, nx)
+    stats["cells"] = occupied
+    return stats
+
+def build_heatmap_grid(points_array, resolution=100, padding_percent=1.0, method='cubic', bin_statistic='mean', direct_density=None, hull_mask=False, hull_ratio=0.3, auto_time_budget=10.0):
+    """
+    Construye la grilla interpolada del mapa de calor.
+
+    Los puntos se pre-agregan por celda antes de interpolar, así el costo depende
+    del tamaño de la grilla y no de la cantidad de puntos. Si la fracción de celdas
+    ocupadas alcanza direct_density, se usan los estadísticos por celda tal cual
+    y solo se interpolan las celdas vacías. Con hull_mask=True las celdas fuera del
+    hull cóncavo de los puntos quedan como nodata. Con method='auto' el método se
+    elige por validación cruzada (select_interpolation_method) dentro de
+    auto_time_budget segundos.
+    """
+    timings = {}
+    stage_start = time.perf_counter()
+    method_selection = None
+    if method == 'auto':
+        method_selection = select_interpolation_method(points_array, time_budget=auto_time_budget)
+        method = method_selection["method"]
+        timings["seleccion_metodo"] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+    x_coords, y_coords, z_values = points_array[:, 0], points_array[:, 1], points_array[:, 2]
+    min_x, max_x = np.min(x_coords), np.max(x_coords)
+    min_y, max_y = np.min(y_coords), np.max(y_coords)
+    x_range, y_range = max_x - min_x, max_y - min_y
+    padding_x, padding_y = (x_range * padding_percent) / 100.0, (y_range * padding_percent) / 100.0
+    bounds_min_x, bounds_max_x = min_x - padding_x, max_x + padding_x
+    bounds_min_y, bounds_max_y = min_y - padding_y, max_y + padding_y
+    x_grid = np.linspace(bounds_min_x, bounds_max_x, resolution)
+    y_grid = np.linspace(bounds_min_y, bounds_max_y, resolution)
+    binned = bin_points_to_grid(x_coords, y_coords, z_values, x_grid, y_grid)
+    cells = binned["cells"]
+    stat_grid = binned[bin_statistic if bin_statistic in BIN_STATISTICS else "mean"]
+    node_points = np.column_stack((x_grid[cells % resolution], y_grid[cells // resolution]))
+    node_values = stat_grid.ravel()[cells]
+    density = len(cells) / float(resolution * resolution)
+    timings["binning"] = time.perf_counter() - stage_start
+    stage_start = time.perf_counter()
+    surface = get_cached_surface(node_points) if len(cells) >= 3 else None
+    Z_interpolated = None
+    if direct_density is not None and density >= direct_density:
+        Z_interpolated = stat_grid.copy()
+        empty = np.isnan(Z_interpolated)
+        # Solo el anillo de celdas ocupadas alrededor de los huecos participa en el relleno
+        ring = ndimage.binary_dilation(empty, iterations=2) & ~empty
+        if empty.any() and ring.sum() >= 3:
+            ry, rx = np.nonzero(ring)
+            ey, ex = np.nonzero(empty)
+            ring_points, ring_values = np.column_stack((x_grid[rx], y_grid[ry])), stat_grid[ry, rx]
+            try:
+                Z_interpolated[ey, ex] = interp.griddata(ring_points, ring_values, (x_grid[ex], y_grid[ey]), method=method, fill_value=np.nan)
+            except QhullError:
+                Z_interpolated[ey, ex] = interp.griddata(ring_points, ring_values, (x_grid[ex], y_grid[ey]), method='nearest')
+    elif surface is not None:
+        X_grid, Y_grid = np.meshgrid(x_grid, y_grid, indexing='xy')
+        Z_interpolated = interpolate_on_surface(surface, node_values, X_grid, Y_grid, method=method)
+    timings["interpolacion"] = time.perf_counter() - stage_start
+    if hull_mask and surface is not None and Z_interpolated is not None:
+        stage_start = time.perf_counter()
+        Z_interpolated[~get_hull_mask(surface, x_grid, y_grid, ratio=hull_ratio)] = np.nan
+        timings["mascara_hull"] = time.perf_counter() - stage_start
+    valid_data = Z_interpolated[~np.isnan(Z_interpolated)] if Z_interpolated is not None else np.empty(0)
+    if len(valid_data) > 0:
+        min_val, max_val, mean_val, std_val = float(np.min(valid_data)), float(np.max(valid_data)), float(np.mean(valid_data)), float(np.std(valid_data))
+    else:
+        min_val, max_val, mean_val, std_val = float(np.min(z_values)), float(np.max(z_values)), float(np.mean(z_values)), float(np.std(z_values))
+        Z_interpolated = stat_grid.copy()
+    Z_interpolated = np.flipud(Z_interpolated)
+    pixel_width, pixel_height = (bounds_max_x - bounds_min_x) / resolution, (bounds_max_y - bounds_min_y) / resolution
+    transform = Affine.translation(bounds_min_x, bounds_max_y) * Affine.scale(pixel_width, -pixel_height)
+    tags = {"STATISTICS_MINIMUM": min_val, "STATISTICS_MAXIMUM": max_val, "STATISTICS_MEAN": mean_val, "STATISTICS_STDDEV": std_val, "BINNED_CELLS": len(cells), "SOURCE_POINTS": len(z_values)}
+    return {
+        "grid": Z_interpolated,
+        "transform": transform,
+        "x_grid": x_grid,
+        "y_grid": y_grid,
+        "binned": binned,
+        "density": density,
+        "surface": surface,
+        "method": method,
+        "method_selection": method_selection,
+        "bounds": (bounds_min_x, bounds_min_y, bounds_max_x, bounds_max_y),
+        "timings": timings,
+        "tags": tags,
+    }
+
+def create_heatmap_geotiff_point_perfect(points_list, crs_code='EPSG:32717', resolution=100, padding_percent=1.0, method='cubic', cog=False, overview_resampling='average', bin_statistic='mean', direct_density=None, hull_mask=False, hull_ratio=0.3):
+    if points_list is None or len(points_list) < 3:
         st.error("❌ Se requieren al menos 3 puntos")
         return None
     try:
-        points_array = np.array(points_list)
-        x_coords, y_coords, z_values = points_array[:, 0], points_array[:, 1], points_array[:, 2]
-        min_x, max_x = np.min(x_coords), np.max(x_coords)
-        min_y, max_y = np.min(y_coords), np.max(y_coords)
-        x_range, y_range = max_x - min_x, max_y - min_y
-        padding_x, padding_y = (x_range * padding_percent) / 100.0, (y_range * padding_percent) / 100.0
-        bounds_min_x, bounds_max_x = min_x - padding_x, max_x + padding_x
-        bounds_min_y, bounds_max_y = min_y - padding_y, max_y + padding_y
-        x_grid = np.linspace(bounds_min_x, bounds_max_x, resolution)
-        y_grid = np.linspace(bounds_min_y, bounds_max_y, resolution)
-        X_grid, Y_grid = np.meshgrid(x_grid, y_grid, indexing='xy')
-        grid_points, grid_values = [], []
-        for x, y, z in points_list:
-            xi, yi = np.argmin(np.abs(x_grid - x)), np.argmin(np.abs(y_grid - y))
-            grid_points.append([x_grid[xi], y_grid[yi]])
-            grid_values.append(z)
-        Z_interpolated = interp.griddata(np.array(grid_points), np.array(grid_values), (X_grid, Y_grid), method=method, fill_value=np.nan)
-        valid_data = Z_interpolated[~np.isnan(Z_interpolated)]
-        if len(valid_data) > 0:
-            min_val, max_val, mean_val, std_val = float(np.min(valid_data)), float(np.max(valid_data)), float(np.mean(valid_data)), float(np.std(valid_data))
-        else:
-            original_z_values = np.array([p[2] for p in points_list])
-            min_val, max_val, mean_val, std_val = float(np.min(original_z_values)), float(np.max(original_z_values)), float(np.mean(original_z_values)), float(np.std(original_z_values))
-            Z_interpolated = np.full((resolution, resolution), np.nan)
-            for x, y, z in points_list: Z_interpolated[np.argmin(np.abs(y_grid - y)), np.argmin(np.abs(x_grid - x))] = z
-        Z_interpolated = np.flipud(Z_interpolated)
-        pixel_width, pixel_height = (bounds_max_x - bounds_min_x) / resolution, (bounds_max_y - bounds_min_y) / resolution
-        transform = Affine.translation(bounds_min_x, bounds_max_y) * Affine.scale(pixel_width, -pixel_height)
-        epsg = int(crs_code.split(':')[1]) if crs_code.startswith('EPSG:') else None
-        crs = CRS.from_epsg(epsg) if epsg else CRS.from_string(crs_code)
-        with tempfile.NamedTemporaryFile(suffix='.tif', delete=False) as tmp:
-            tmp_path = tmp.name
-        with rasterio.open(tmp_path, 'w', driver='GTiff', height=resolution, width=resolution, count=1, dtype=rasterio.float32, crs=crs, transform=transform, nodata=np.nan, compress='lzw', tiled=True, blockxsize=256, blockysize=256, interleave='band', photometric='minisblack') as dst:
-            dst.write(Z_interpolated.astype(rasterio.float32), 1)
-            dst.update_tags(STATISTICS_MINIMUM=min_val, STATISTICS_MAXIMUM=max_val, STATISTICS_MEAN=mean_val, STATISTICS_STDDEV=std_val)
-            dst.update_tags(SOFTWARE="Antigravity Heatmap", DATETIME=time.strftime("%Y:%m:%d %H:%M:%S"))
-        with open(tmp_path, 'rb') as f: data = f.read()
-        os.unlink(tmp_path)
-        return data
+        heat = build_heatmap_grid(np.asarray(points_list, dtype=float), resolution=resolution, padding_percent=padding_percent, method=method, bin_statistic=bin_statistic, direct_density=direct_density, hull_mask=hull_mask, hull_ratio=hull_ratio)
+        return write_heatmap_geotiff(heat["grid"], heat["transform"], crs_code, tags=heat["tags"], cog=cog, overview_resampling=overview_resampling)
     except Exception as e:
         st.error(f"Error: {e}")
         return None
@@ -222,12 +540,12 @@ def create_heatmap_geotiff_corrected(points_df, bounds, resolution=500, method='
         st.error(f"Error: {e}")
         return None
 
-def create_heatmap_geotiff(points_df, bounds, resolution=500, method='linear'):
+def create_heatmap_geotiff(points_df, bounds, resolution=500, method='linear', cog=False, overview_resampling='average', bin_statistic='mean', direct_density=None, hull_mask=False, hull_ratio=0.3):
     input_epsg = st.session_state.get("input_epsg", 32717)
     crs_code = f"EPSG:{input_epsg}"
     if points_df is not None and len(points_df) > 0:
-        points_list = [[row['x'], row['y'], row['cota']] for _, row in points_df.iterrows()]
-        return create_heatmap_geotiff_point_perfect(points_list=points_list, crs_code=crs_code, resolution=resolution, padding_percent=1.0, method=method)
+        points_list = points_df[['x', 'y', 'cota']].to_numpy(dtype=float)
+        return create_heatmap_geotiff_point_perfect(points_list=points_list, crs_code=crs_code, resolution=resolution, padding_percent=1.0, method=method, cog=cog, overview_resampling=overview_resampling, bin_statistic=bin_statistic, direct_density=direct_density, hull_mask=hull_mask, hull_ratio=hull_ratio)
     else:
         st.error("❌ No hay datos")
         return None
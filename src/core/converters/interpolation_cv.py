@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from scipy.interpolate import griddata
+
+logger = logging.getLogger(__name__)
+
+# "nearest" usa internamente un cKDTree (NearestNDInterpolator)
+CV_METHODS = ["linear", "cubic", "nearest"]
+CV_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Pool de procesos compartido por todas las selecciones del proceso: se crea una vez
+# y se reutiliza, así una corrida nueva no suma procesos a los de la anterior
+_CV_POOL = None
+_CV_POOL_LOCK = threading.Lock()
+
+def _get_cv_pool():
+    global _CV_POOL
+    with _CV_POOL_LOCK:
+        if _CV_POOL is None:
+            _CV_POOL = ProcessPoolExecutor(max_workers=CV_MAX_WORKERS)
+        return _CV_POOL
+
+def _discard_cv_pool(pool):
+    """Descarta un pool roto; la próxima selección crea uno nuevo."""
+    global _CV_POOL
+    with _CV_POOL_LOCK:
+        if _CV_POOL is pool:
+            _CV_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _short_error(e):
+    """Primera línea del error (los de Qhull traen varias líneas de ayuda)."""
+    text = str(e).strip()
+    return text.splitlines()[0] if text else type(e).__name__
+
+def _fold_predictions(method, fold, train_xy, train_z, test_xy):
+    """Predice un pliegue con un método. Función de módulo para poder enviarse a otro proceso."""
+    pred = griddata(train_xy, train_z, test_xy, method=method, fill_value=np.nan)
+    return method, fold, pred
+
+def select_interpolation_method(points_array, methods=None, folds=5, max_points=5000, time_budget=10.0, seed=0):
+    """
+    Elige el método de interpolación por validación cruzada k-fold.
+
+    Trabaja sobre una submuestra de hasta max_points puntos y evalúa cada
+    (método, pliegue) como una tarea del pool de procesos compartido. Al vencer
+    time_budget se cancelan las tareas en cola y se descarta lo que no terminó;
+    las que ya corren son un solo pliegue sobre la submuestra, así que liberan
+    el pool enseguida. El RMSE de todos los métodos se mide sobre
+    los mismos puntos de prueba (los que todos los métodos completados cubren),
+    porque linear/cubic no predicen fuera del hull convexo.
+
+    Retorna {"method", "report", "elapsed", "sample_size"}; report tiene por método
+    'rmse', 'coverage' (fracción de puntos de prueba predichos) y 'folds' evaluados.
+    """
+    started = time.time()
+    methods = list(methods or CV_METHODS)
+    rng = np.random.default_rng(seed)
+    points_array = np.asarray(points_array, dtype=float)
+    if len(points_array) > max_points:
+        points_array = points_array[rng.choice(len(points_array), max_points, replace=False)]
+    n = len(points_array)
+    folds = int(min(folds, n // 3))
+    if folds < 2:
+        return {"method": "linear", "report": {}, "elapsed": time.time() - started, "sample_size": n}
+
+    xy, z = points_array[:, :2], points_array[:, 2]
+    fold_index = np.array_split(rng.permutation(n), folds)
+    tasks = []
+    for fold, test_idx in enumerate(fold_index):
+        train_mask = np.ones(n, dtype=bool)
+        train_mask[test_idx] = False
+        for method in methods:
+            tasks.append((method, fold, xy[train_mask], z[train_mask], xy[test_idx]))
+
+    predictions = {m: {} for m in methods}
+    deadline = started + time_budget
+    serial = False
+    try:
+        pool = _get_cv_pool()
+        futures = {pool.submit(_fold_predictions, *task): task for task in tasks}
+    except (OSError, RuntimeError, BrokenExecutor) as e:
+        # Sin procesos disponibles (entornos restringidos): evaluación secuencial con el mismo presupuesto
+        logger.warning(f"Validación cruzada en paralelo no disponible ({e}); se evalúa en serie")
+        serial = True
+    if not serial:
+        pending = set(futures)
+        try:
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    method, fold = futures[future][:2]
+                    try:
+                        predictions[method][fold] = future.result()[2]
+                    except BrokenExecutor as e:
+                        logger.warning(f"El pool de validación cruzada se interrumpió ({e}); se sigue en serie")
+                        _discard_cv_pool(pool)
+                        serial = True
+                        break
+                    except Exception as e:
+                        # Falla de una tarea: ese pliegue no cuenta para el método, el resto sigue
+                        logger.warning(f"Validación cruzada {method}, pliegue {fold}: {_short_error(e)}")
+                if serial:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+    if serial:
+        for task in tasks:
+            if time.time() > deadline:
+                break
+            if task[1] in predictions[task[0]]:
+                continue
+            try:
+                method, fold, pred = _fold_predictions(*task)
+            except Exception as e:
+                logger.warning(f"Validación cruzada {task[0]}, pliegue {task[1]}: {_short_error(e)}")
+                continue
+            predictions[method][fold] = pred
+
+    report = {}
+    scored = [m for m in methods if predictions[m]]
+    errors = {m: [] for m in scored}
+    for fold, test_idx in enumerate(fold_index):
+        fold_methods = [m for m in scored if fold in predictions[m]]
+        if not fold_methods:
+            continue
+        common = np.ones(len(test_idx), dtype=bool)
+        for m in fold_methods:
+            common &= np.isfinite(predictions[m][fold])
+        for m in fold_methods:
+            errors[m].append(predictions[m][fold][common] - z[test_idx][common])
+    for m in scored:
+        residuals = np.concatenate(errors[m]) if errors[m] else np.empty(0)
+        tested = sum(len(fold_index[f]) for f in predictions[m])
+        covered = sum(int(np.isfinite(p).sum()) for p in predictions[m].values())
+        report[m] = {
+            "rmse": float(np.sqrt(np.mean(residuals ** 2))) if residuals.size else float("nan"),
+            "coverage": covered / tested if tested else 0.0,
+            "folds": len(predictions[m]),
+        }
+    ranked = [m for m in scored if np.isfinite(report[m]["rmse"])]
+    best = min(ranked, key=lambda m: report[m]["rmse"]) if ranked else "linear"
+    elapsed = time.time() - started
+    logger.info(f"Selección de interpolación: {best} en {elapsed:.2f}s ({report})")
+    return {"method": best, "report": report, "elapsed": elapsed, "sample_size": n}
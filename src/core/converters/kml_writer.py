@@ -0,0 +1,171 @@
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from src.utils.package_writer import FAST_DEFLATE_LEVEL
+
+# Texto acumulado antes de escribirlo en el archivo / entrada del KMZ
+KML_FLUSH_BYTES = 1024 * 1024
+# Cada carpeta se arma en un temporal propio: en memoria hasta este tamaño y luego en disco
+KML_FOLDER_SPOOL_BYTES = 8 * 1024 * 1024
+
+def hex_to_kml_color(hex_str, alpha="ff"):
+    """Convierte '#rrggbb' al formato KML aabbggrr."""
+    h = str(hex_str).lstrip('#')
+    if len(h) == 6:
+        return f"{alpha}{h[4:6]}{h[2:4]}{h[0:2]}"
+    return f"{alpha}0000ff"
+
+def _coords_text(coords):
+    """Coordenadas (lon, lat[, z]) en el formato de <coordinates>."""
+    return " ".join(
+        f"{c[0]:.8f},{c[1]:.8f},{c[2]:.3f}" if len(c) > 2 else f"{c[0]:.8f},{c[1]:.8f}"
+        for c in coords
+    )
+
+class KmlWriter:
+    """
+    Escritor KML/KMZ por streaming.
+
+    Los estilos se declaran una sola vez (add_style) y los placemarks los
+    referencian con <styleUrl>, en lugar de un <Style> por feature como hace
+    simplekml. Los placemarks se escriben a medida que se agregan: los del
+    documento directamente en el archivo (o en la entrada doc.kml del KMZ) y los
+    de cada carpeta en un temporal que se vuelca en orden al cerrar, así las
+    carpetas pueden llenarse intercaladas sin armar el árbol en memoria.
+
+    target es una ruta (.kmz comprimido, cualquier otra extensión KML de texto)
+    o un archivo binario abierto; en ese caso kmz indica el formato.
+    """
+
+    def __init__(self, target, name=None, kmz=None):
+        if isinstance(target, (str, Path)):
+            kmz = Path(target).suffix.lower() == ".kmz" if kmz is None else kmz
+            self._file = open(target, "wb")
+            self._owns_file = True
+        else:
+            kmz = True if kmz is None else kmz
+            self._file = target
+            self._owns_file = False
+        self._zip = None
+        if kmz:
+            self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED, compresslevel=FAST_DEFLATE_LEVEL, allowZip64=True)
+            self._out = self._zip.open("doc.kml", "w", force_zip64=True)
+        else:
+            self._out = self._file
+        self._styles = []
+        self._style_ids = set()
+        self._folders = {}
+        self._parts = []
+        self._pending = 0
+        self._started = False
+        self.count = 0
+        self._write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n')
+        if name:
+            self._write(f"<name>{escape(str(name))}</name>\n")
+
+    def add_style(self, style_id, icon_color=None, icon_scale=None, label_color=None, line_color=None, line_width=None, poly_color=None):
+        """Declara un estilo compartido. Debe llamarse antes del primer placemark."""
+        if self._started:
+            raise ValueError("Los estilos KML deben declararse antes de los placemarks")
+        parts = [f'<Style id="{escape(str(style_id))}">']
+        if icon_color is not None or icon_scale is not None:
+            parts.append("<IconStyle>")
+            if icon_color is not None:
+                parts.append(f"<color>{icon_color}</color>")
+            if icon_scale is not None:
+                parts.append(f"<scale>{icon_scale:g}</scale>")
+            parts.append("</IconStyle>")
+        if label_color is not None:
+            parts.append(f"<LabelStyle><color>{label_color}</color></LabelStyle>")
+        if line_color is not None or line_width is not None:
+            parts.append("<LineStyle>")
+            if line_color is not None:
+                parts.append(f"<color>{line_color}</color>")
+            if line_width is not None:
+                parts.append(f"<width>{line_width:g}</width>")
+            parts.append("</LineStyle>")
+        if poly_color is not None:
+            parts.append(f"<PolyStyle><color>{poly_color}</color></PolyStyle>")
+        parts.append("</Style>\n")
+        self._styles.append("".join(parts))
+        self._style_ids.add(str(style_id))
+
+    def folder(self, name):
+        """Crea una carpeta (en el orden de creación) y retorna su clave para los placemarks."""
+        key = len(self._folders)
+        self._folders[key] = (name, tempfile.SpooledTemporaryFile(max_size=KML_FOLDER_SPOOL_BYTES))
+        return key
+
+    def point(self, name, coords, style=None, folder=None, altitude_mode=None):
+        self._placemark(name, style, folder, f"<Point>{self._altitude(altitude_mode)}<coordinates>{_coords_text([coords])}</coordinates></Point>")
+
+    def linestring(self, name, coords, style=None, folder=None, altitude_mode=None):
+        self._placemark(name, style, folder, f"<LineString>{self._altitude(altitude_mode)}<coordinates>{_coords_text(coords)}</coordinates></LineString>")
+
+    def polygon(self, name, rings, style=None, folder=None, altitude_mode=None):
+        """rings: anillo exterior seguido de los interiores."""
+        boundaries = [f"<outerBoundaryIs><LinearRing><coordinates>{_coords_text(rings[0])}</coordinates></LinearRing></outerBoundaryIs>"]
+        boundaries.extend(f"<innerBoundaryIs><LinearRing><coordinates>{_coords_text(r)}</coordinates></LinearRing></innerBoundaryIs>" for r in rings[1:])
+        self._placemark(name, style, folder, f"<Polygon>{self._altitude(altitude_mode)}{''.join(boundaries)}</Polygon>")
+
+    def close(self):
+        """Vuelca las carpetas, cierra el documento y el KMZ. Retorna la cantidad de placemarks."""
+        self._start()
+        for name, buf in self._folders.values():
+            self._write(f"<Folder><name>{escape(str(name))}</name>\n")
+            self._flush()
+            buf.seek(0)
+            shutil.copyfileobj(buf, self._out)
+            buf.close()
+            self._write("</Folder>\n")
+        self._folders = {}
+        self._write("</Document>\n</kml>\n")
+        self._flush()
+        if self._zip is not None:
+            self._out.close()
+            self._zip.close()
+        if self._owns_file:
+            self._file.close()
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _altitude(altitude_mode):
+        return f"<altitudeMode>{altitude_mode}</altitudeMode>" if altitude_mode else ""
+
+    def _placemark(self, name, style, folder, geometry):
+        if style is not None and str(style) not in self._style_ids:
+            raise ValueError(f"Estilo KML no declarado: {style}")
+        self._start()
+        style_url = f"<styleUrl>#{escape(str(style))}</styleUrl>" if style is not None else ""
+        text = f"<Placemark><name>{escape(str(name))}</name>{style_url}{geometry}</Placemark>\n"
+        self.count += 1
+        if folder is None:
+            self._write(text)
+        else:
+            self._folders[folder][1].write(text.encode("utf-8"))
+
+    def _start(self):
+        if not self._started:
+            self._started = True
+            self._write("".join(self._styles))
+
+    def _write(self, text):
+        self._parts.append(text)
+        self._pending += len(text)
+        if self._pending >= KML_FLUSH_BYTES:
+            self._flush()
+
+    def _flush(self):
+        if self._parts:
+            self._out.write("".join(self._parts).encode("utf-8"))
+            self._parts = []
+            self._pending = 0
@@ -0,0 +1,139 @@
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import pyproj
+import shapefile
+
+logger = logging.getLogger(__name__)
+
+# Partición por tipo de geometría: un shapefile solo admite un tipo de shape
+SHAPE_PARTITIONS = {
+    "Point": ("puntos", shapefile.POINT),
+    "MultiPoint": ("multipuntos", shapefile.MULTIPOINT),
+    "LineString": ("lineas", shapefile.POLYLINE),
+    "MultiLineString": ("lineas", shapefile.POLYLINE),
+    "Polygon": ("poligonos", shapefile.POLYGON),
+    "MultiPolygon": ("poligonos", shapefile.POLYGON),
+}
+
+@lru_cache(maxsize=32)
+def prj_wkt(epsg):
+    """WKT1_ESRI del EPSG para el .prj (QGIS/ArcGIS); se calcula una vez por proceso."""
+    return pyproj.CRS.from_epsg(int(epsg)).to_wkt(version="WKT1_ESRI")
+
+def write_prj(base_path, epsg):
+    """Escribe <base_path>.prj. Retorna la ruta o None si el EPSG no se puede describir."""
+    try:
+        wkt = prj_wkt(epsg)
+    except Exception as e:
+        logger.warning(f"SHP: No se pudo generar el .prj para EPSG:{epsg}: {e}")
+        return None
+    path = Path(f"{base_path}.prj")
+    path.write_text(wkt, encoding="utf-8")
+    return path
+
+def _field_text(value, size):
+    """Texto recortado a `size` bytes UTF-8 sin partir caracteres (pyshp avisa si tiene que recortarlo)."""
+    return str(value).encode("utf-8")[:size].decode("utf-8", "ignore")
+
+def _xy(coords):
+    """Vértices 2D; si ya lo son se usan tal cual, sin copiar."""
+    if coords and len(coords[0]) == 2:
+        return coords
+    return [(c[0], c[1]) for c in coords]
+
+def _ring(coords, clockwise):
+    """
+    Anillo 2D en la orientación que exige el shapefile: exterior horario e
+    interiores antihorarios (GeoJSON RFC 7946 usa la opuesta).
+    """
+    ring = _xy(coords)
+    area2 = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:]))
+    if (area2 < 0) != clockwise:
+        ring = ring[::-1]
+    return ring
+
+def _polygon_parts(polygons):
+    parts = []
+    for rings in polygons:
+        for i, ring in enumerate(rings):
+            if len(ring) >= 4:
+                parts.append(_ring(ring, clockwise=(i == 0)))
+    return parts
+
+def write_partitioned_shapefiles(features, directory, base_name, epsg=4326):
+    """
+    Escribe features GeoJSON en un shapefile por tipo de geometría
+    (<base_name>_puntos, _multipuntos, _lineas, _poligonos).
+
+    Cada writer se abre recién con el primer feature de su tipo; Multi* se
+    escribe como un registro con varias partes. Los features sin geometría
+    válida se omiten (se cuentan en el log) sin desalinear .shp y .dbf.
+    Retorna la lista ordenada de archivos escritos.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    writers = {}
+    skipped = 0
+
+    def get_writer(suffix, shape_type):
+        w = writers.get(suffix)
+        if w is None:
+            w = shapefile.Writer(str(directory / f"{base_name}_{suffix}"), shapeType=shape_type)
+            w.field("NAME", "C", 50)
+            w.field("TYPE", "C", 20)
+            writers[suffix] = w
+        return w
+
+    try:
+        for f in features:
+            geom = f.get("geometry") or {}
+            g_type = geom.get("type")
+            partition = SHAPE_PARTITIONS.get(g_type)
+            coords = geom.get("coordinates")
+            if partition is None or not coords:
+                skipped += 1
+                continue
+            props = f.get("properties") or {}
+            try:
+                # La geometría se arma antes de tocar el writer: si falla no queda un shape sin registro
+                if g_type == "Point":
+                    shape = (coords[0], coords[1])
+                elif g_type == "MultiPoint":
+                    shape = _xy(coords)
+                elif g_type == "LineString":
+                    shape = [_xy(coords)] if len(coords) >= 2 else None
+                elif g_type == "MultiLineString":
+                    shape = [_xy(line) for line in coords if len(line) >= 2]
+                elif g_type == "Polygon":
+                    shape = _polygon_parts([coords])
+                else:
+                    shape = _polygon_parts(coords)
+            except (TypeError, IndexError, ValueError):
+                shape = None
+            if not shape:
+                skipped += 1
+                continue
+
+            suffix, shape_type = partition
+            w = get_writer(suffix, shape_type)
+            if shape_type == shapefile.POINT:
+                w.point(*shape)
+            elif shape_type == shapefile.MULTIPOINT:
+                w.multipoint(shape)
+            elif shape_type == shapefile.POLYLINE:
+                w.line(shape)
+            else:
+                w.poly(shape)
+            w.record(_field_text(props.get("name") or props.get("label") or "", 50), _field_text(props.get("type") or g_type, 20))
+    finally:
+        for w in writers.values():
+            w.close()
+
+    for suffix in writers:
+        write_prj(directory / f"{base_name}_{suffix}", epsg)
+    if skipped:
+        logger.warning(f"SHP: {skipped} features sin geometría compatible omitidos")
+    logger.info(f"SHP: {', '.join(f'{s}={w.shpNum}' for s, w in writers.items())}")
+    return sorted(p for suffix in writers for p in directory.glob(f"{base_name}_{suffix}.*"))
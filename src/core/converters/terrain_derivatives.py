@@ -0,0 +1,48 @@
+import numpy as np
+
+# Producto -> sufijo del GeoTIFF generado
+TERRAIN_PRODUCTS = {
+    "slope": "pendiente",
+    "aspect": "orientacion",
+    "hillshade": "sombreado",
+}
+
+def compute_terrain_derivatives(grid, pixel_width, pixel_height, products=("slope", "hillshade"), chunk_rows=512, azimuth=315.0, altitude=45.0):
+    """
+    Calcula pendiente (grados), orientación (grados desde el norte, sentido horario)
+    y sombreado (0-255) de una grilla norte-arriba (fila 0 = norte) en una sola pasada.
+
+    El gradiente se calcula por bloques de filas con una fila de solape a cada lado,
+    por lo que el resultado es idéntico al de np.gradient sobre la grilla completa
+    sin tener que materializar todos los temporales a la vez.
+    """
+    products = [p for p in products if p in TERRAIN_PRODUCTS]
+    height, width = grid.shape
+    outputs = {p: np.empty((height, width), dtype=np.float32) for p in products}
+    if not products:
+        return outputs
+    az, alt = np.radians(azimuth), np.radians(altitude)
+    light = (np.sin(az) * np.cos(alt), np.cos(az) * np.cos(alt), np.sin(alt))
+    chunk_rows = max(1, int(chunk_rows))
+    for start in range(0, height, chunk_rows):
+        stop = min(height, start + chunk_rows)
+        lo, hi = max(0, start - 1), min(height, stop + 1)
+        block = grid[lo:hi].astype(np.float64)
+        if block.shape[0] > 1:
+            d_row, d_col = np.gradient(block, pixel_height, pixel_width)
+        else:
+            d_row, d_col = np.zeros_like(block), np.gradient(block, pixel_width, axis=1)
+        rows = slice(start - lo, start - lo + (stop - start))
+        # Las filas avanzan hacia el sur: dz/dnorte = -dz/dfila
+        dz_dx, dz_dy = d_col[rows], -d_row[rows]
+        if "slope" in outputs:
+            outputs["slope"][start:stop] = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+        if "aspect" in outputs:
+            aspect = np.mod(np.degrees(np.arctan2(-dz_dx, -dz_dy)), 360.0)
+            aspect[(dz_dx == 0) & (dz_dy == 0)] = np.nan
+            outputs["aspect"][start:stop] = aspect
+        if "hillshade" in outputs:
+            norm = np.sqrt(dz_dx ** 2 + dz_dy ** 2 + 1.0)
+            shade = (-dz_dx * light[0] - dz_dy * light[1] + light[2]) / norm
+            outputs["hillshade"][start:stop] = 255.0 * np.clip(shade, 0.0, 1.0)
+    return outputs
@@ -1,16 +1,22 @@
 import os
 import json
+import time
 import ezdxf
-import pyproj
 import pandas as pd
 import numpy as np
 import io
 import zipfile
 from pathlib import Path
-from simplekml import Kml, AltitudeMode
 import shapefile
-from src.core.geometry.coordinate_utils import build_transformer, strip_z_from_geojson
-from src.core.converters.heatmap_converter import create_heatmap_geotiff, validate_heatmap_data, calculate_raster_bounds, create_heatmap_debug_file
+from src.core.geometry.coordinate_utils import build_transformer
+from src.core.converters.heatmap_converter import create_heatmap_debug_file, build_heatmap_grid, write_heatmap_geotiff
+from src.core.converters.contour_generator import generate_contours
+from src.core.converters.terrain_derivatives import compute_terrain_derivatives, TERRAIN_PRODUCTS
+from src.core.converters.volume_calculator import compute_volumes
+from src.core.converters.tin_generator import build_tin, add_tin_to_dxf, write_tin_landxml, write_tin_geojson
+from src.core.converters.kml_writer import KmlWriter
+from src.core.converters.shapefile_writer import write_prj
+from src.core.converters.gpkg_writer import write_geopackage, geopackage_layers
 import src.generators.map_generators as mg
 
 import logging
@@ -71,16 +77,21 @@ def process_topo_data(df, input_epsg, output_epsg, options):
     text_style = doc.styles.get("STANDARD")
     text_style.dxf.height = options.get("altura_texto", 0.35)
     
-    # 2. KML
-    kml = Kml()
-    points_folder = kml.newfolder(name="📍 Puntos Topográficos")
-    lines_folder = kml.newfolder(name="🔗 Polígonos/Líneas")
+    # 2. KML (por streaming, con estilos compartidos para líneas y curvas)
+    kml_path = main_folder / f"{folder_name}.kml"
+    kml = KmlWriter(kml_path, name=folder_name)
+    kml.add_style("polilinea", line_color="ff0000ff", line_width=3)
+    kml.add_style("curva", line_color="ff00ffff", line_width=1)
+    kml.add_style("curva_indice", line_color="ff00a5ff", line_width=2.5)
+    points_folder = kml.folder("📍 Puntos Topográficos")
+    lines_folder = kml.folder("🔗 Polígonos/Líneas")
     
     # 3. GeoJSON
     features = []
     
     # Almacén para polilíneas
     poly_info = []
+    breaklines = []
     
     # Procesar puntos
     for idx, row in df.iterrows():
@@ -107,12 +118,10 @@ def process_topo_data(df, input_epsg, output_epsg, options):
                 })
             
             # KML Punto
-            p_kml = points_folder.newpoint(name=str(row.get("No.", idx)))
             if dim_is_3d:
-                p_kml.coords = [(lon, lat, cota_used)]
-                p_kml.altitudemode = AltitudeMode.absolute
+                kml.point(row.get("No.", idx), (lon, lat, cota_used), folder=points_folder, altitude_mode="absolute")
             else:
-                p_kml.coords = [(lon, lat)]
+                kml.point(row.get("No.", idx), (lon, lat), folder=points_folder)
             
             # GeoJSON Feature
             features.append({
@@ -155,6 +164,8 @@ def process_topo_data(df, input_epsg, output_epsg, options):
                         pts_geo.append((lv, lav, zv) if dim_is_3d else (lv, lav))
                     
                     is_closed = len(pts_utm) >= 3 # Simplificación: si tiene 3+, cerrar
+                    breakline = group[['x', 'y', 'cota']].to_numpy(dtype=float)
+                    breaklines.append(np.vstack((breakline, breakline[:1])) if is_closed else breakline)
                     
                     # DXF Línea
                     if dim_is_3d:
@@ -167,10 +178,7 @@ def process_topo_data(df, input_epsg, output_epsg, options):
                         })
                     
                     # KML Línea
-                    ls = lines_folder.newlinestring(name=f"Polilínea {idx_poly}")
-                    ls.coords = pts_geo + ([pts_geo[0]] if is_closed else [])
-                    ls.style.linestyle.color = "red"
-                    ls.style.linestyle.width = 3
+                    kml.linestring(f"Polilínea {idx_poly}", pts_geo + ([pts_geo[0]] if is_closed else []), style="polilinea", folder=lines_folder)
                     
                     # GeoJSON Línea
                     features.append({
@@ -189,10 +197,95 @@ def process_topo_data(df, input_epsg, output_epsg, options):
         except Exception:
             pass
 
+    # Grilla de elevaciones compartida por el mapa de calor y las curvas de nivel
+    heat = None
+    if options.get("heatmap_enabled", False) or options.get("contours_enabled", False):
+        try:
+            heat = build_heatmap_grid(
+                df[["x", "y", "cota"]].to_numpy(dtype=float),
+                resolution=options.get("heatmap_resolution", 500),
+                padding_percent=1.0,
+                method=options.get("heatmap_method", "cubic"),
+                bin_statistic=options.get("heatmap_bin_statistic", "mean"),
+                direct_density=options.get("heatmap_direct_density"),
+                hull_mask=options.get("heatmap_hull_mask", False),
+                hull_ratio=options.get("heatmap_hull_ratio", 0.3),
+                auto_time_budget=options.get("heatmap_auto_budget", 10.0)
+            )
+        except Exception as e:
+            logger.error(f"Error generando grilla de elevaciones: {e}")
+
+    # Curvas de nivel
+    contours = []
+    if heat is not None and options.get("contours_enabled", False):
+        try:
+            contours = generate_contours(
+                np.flipud(heat["grid"]), heat["x_grid"], heat["y_grid"],
+                interval=options.get("contour_interval", 1.0),
+                index_every=options.get("contour_index_every", 5)
+            )
+        except Exception as e:
+            logger.error(f"Error generando curvas de nivel: {e}")
+
+    if contours:
+        layer_curvas = options.get("layer_curvas", "CURVAS")
+        layer_curvas_indice = f"{layer_curvas}_INDICE"
+        doc.layers.new(name=layer_curvas, dxfattribs={"color": color_map.get(options.get("color_curvas", "amarillo"), 2)})
+        doc.layers.new(name=layer_curvas_indice, dxfattribs={"color": color_map.get(options.get("color_curvas_indice", "naranja"), 30), "lineweight": 50})
+        contours_folder = kml.folder("⛰️ Curvas de Nivel")
+        for c in contours:
+            layer_c = layer_curvas_indice if c["index"] else layer_curvas
+            xs, ys = c["coords"][:, 0], c["coords"][:, 1]
+            lons, lats = transformer.transform(xs, ys)
+            z_c = c["level"] if dim_is_3d else 0.0
+
+            # DXF Curva (elevación en la entidad para modo 3D)
+            msp.add_lwpolyline(c["coords"].tolist(), dxfattribs={
+                "layer": layer_c,
+                "closed": c["closed"],
+                "elevation": z_c
+            })
+
+            # KML Curva
+            kml.linestring(
+                f"Cota {c['level']:g}",
+                list(zip(lons, lats, [z_c] * len(lons))) if dim_is_3d else list(zip(lons, lats)),
+                style="curva_indice" if c["index"] else "curva",
+                folder=contours_folder,
+                altitude_mode="absolute" if dim_is_3d else None
+            )
+
+            # GeoJSON Curva
+            features.append({
+                "type": "Feature",
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": [[lo, la, z_c] for lo, la in zip(lons.tolist(), lats.tolist())] if dim_is_3d else np.column_stack((lons, lats)).tolist()
+                },
+                "properties": {"type": "contour", "layer": layer_c, "cota": c["level"], "indice": c["index"]}
+            })
+
+    # TIN (triangulación de Delaunay con líneas de quiebre opcionales)
+    tin = None
+    if options.get("tin_enabled", False):
+        try:
+            tin = build_tin(
+                df[["x", "y", "cota"]].to_numpy(dtype=float),
+                breaklines=breaklines if options.get("tin_breaklines", True) else None,
+                max_edge=options.get("tin_max_edge") or None
+            )
+            if options.get("tin_dxf", True):
+                layer_tin = options.get("layer_tin", "TIN")
+                doc.layers.new(name=layer_tin, dxfattribs={"color": color_map.get(options.get("color_tin", "verde"), 3)})
+                add_tin_to_dxf(msp, tin, layer_tin)
+            write_tin_landxml(main_folder / f"{folder_name}_tin.xml", tin, name=folder_name, epsg=input_epsg)
+            write_tin_geojson(main_folder / f"{folder_name}_tin.geojson", tin, transformer, with_z=dim_is_3d)
+        except Exception as e:
+            logger.error(f"Error generando TIN: {e}")
+
     # Guardar DXF y KML
     doc.saveas(str(dxf_path))
-    kml_path = main_folder / f"{folder_name}.kml"
-    kml.save(str(kml_path))
+    kml.close()
     
     # GeoJSON final
     geojson = {"type": "FeatureCollection", "features": features}
@@ -217,13 +310,36 @@ def process_topo_data(df, input_epsg, output_epsg, options):
                 w.record(str(f["properties"]["No"]), f["properties"]["cota"], f["properties"]["desc"])
         
         # .prj file
-        try:
-            prj_wkt = pyproj.CRS.from_epsg(output_epsg).to_wkt(version='WKT1_ESRI')
-            with open(f"{shp_points_path}.prj", "w") as f:
-                f.write(prj_wkt)
-        except: pass
+        write_prj(shp_points_path, output_epsg)
     except: pass
 
+    if contours:
+        shp_contours_path = shp_dir / f"{folder_name}_curvas"
+        try:
+            shp_line_type = shapefile.POLYLINEZ if dim_is_3d else shapefile.POLYLINE
+            with shapefile.Writer(str(shp_contours_path), shapeType=shp_line_type) as w:
+                w.field("cota", "F", size=20, decimal=8)
+                w.field("indice", "L")
+                for f in [feat for feat in features if feat["properties"].get("type") == "contour"]:
+                    if dim_is_3d:
+                        w.linez([f["geometry"]["coordinates"]])
+                    else:
+                        w.line([f["geometry"]["coordinates"]])
+                    w.record(f["properties"]["cota"], f["properties"]["indice"])
+            write_prj(shp_contours_path, output_epsg)
+        except Exception as e:
+            logger.error(f"Error escribiendo shapefile de curvas: {e}")
+
+    # 4a. GeoPackage: una tabla por capa y geometría, con índice R-tree, en el EPSG de salida
+    gpkg_path = None
+    if options.get("gpkg_enabled"):
+        try:
+            gpkg_path = main_folder / f"{folder_name}.gpkg"
+            write_geopackage(gpkg_path, geopackage_layers(features, group_by="layer"), srs_id=int(output_epsg))
+        except Exception as e:
+            logger.error(f"Error generando GeoPackage: {e}")
+            gpkg_path = None
+
     # 4b. Mapbox Folder (JSON/GeoJSON)
     mapbox_dir = main_folder / "mapbox"
     mapbox_dir.mkdir(exist_ok=True)
@@ -252,34 +368,90 @@ def process_topo_data(df, input_epsg, output_epsg, options):
 
     # 5. Heatmap (GeoTIFF)
     geotiff_bytes = None
-    if options.get("heatmap_enabled", False):
+    if options.get("heatmap_enabled", False) and heat is not None:
         try:
-            bounds = calculate_raster_bounds(df, options.get("heatmap_margin", 15))
-            geotiff_bytes = create_heatmap_geotiff(
-                df, bounds, 
-                resolution=options.get("heatmap_resolution", 500),
-                method=options.get("heatmap_method", "cubic")
+            write_start = time.perf_counter()
+            geotiff_bytes = write_heatmap_geotiff(
+                heat["grid"], heat["transform"], f"EPSG:{input_epsg}",
+                tags=heat["tags"],
+                cog=options.get("heatmap_cog", False),
+                overview_resampling=options.get("heatmap_overview_resampling", "average"),
+                dtype=options.get("heatmap_dtype", "float32"),
+                precision=options.get("heatmap_precision", 0.01)
             )
             if geotiff_bytes:
                 with open(main_folder / f"{folder_name}_heatmap.tif", "wb") as f:
                     f.write(geotiff_bytes)
+            heat["timings"]["escritura_geotiff"] = time.perf_counter() - write_start
         except: pass
+        if options.get("heatmap_debug", False):
+            create_heatmap_debug_file(
+                df, heat["bounds"], len(heat["x_grid"]),
+                str(main_folder / f"{folder_name}_heatmap_debug.txt"),
+                timings=heat["timings"],
+                points_csv=options.get("heatmap_debug_csv", False)
+            )
+
+    # 5b. Derivados del terreno (pendiente, orientación, sombreado) sobre la grilla en memoria
+    terrain_files = []
+    terrain_products = options.get("terrain_products") or []
+    if options.get("heatmap_enabled", False) and heat is not None and terrain_products:
+        try:
+            derivatives = compute_terrain_derivatives(
+                heat["grid"],
+                abs(heat["x_grid"][1] - heat["x_grid"][0]),
+                abs(heat["y_grid"][1] - heat["y_grid"][0]),
+                products=terrain_products
+            )
+            for product, raster in derivatives.items():
+                tif_bytes = write_heatmap_geotiff(
+                    raster, heat["transform"], f"EPSG:{input_epsg}",
+                    cog=options.get("heatmap_cog", False),
+                    overview_resampling=options.get("heatmap_overview_resampling", "average")
+                )
+                tif_path = main_folder / f"{folder_name}_{TERRAIN_PRODUCTS[product]}.tif"
+                with open(tif_path, "wb") as f:
+                    f.write(tif_bytes)
+                terrain_files.append(tif_path.name)
+        except Exception as e:
+            logger.error(f"Error generando derivados del terreno: {e}")
+
+    # 5c. Volúmenes de corte/relleno contra una segunda superficie (levantamiento final)
+    volumes = None
+    df_final = options.get("volume_surface")
+    if df_final is not None and len(df_final) >= 3:
+        try:
+            volumes = compute_volumes(
+                df[["x", "y", "cota"]].to_numpy(dtype=float),
+                df_final[["x", "y", "cota"]].to_numpy(dtype=float),
+                resolution=options.get("volume_resolution", 1000),
+                method=options.get("volume_method", "linear")
+            )
+            tif_bytes = write_heatmap_geotiff(
+                volumes["diff"], volumes["transform"], f"EPSG:{input_epsg}",
+                tags={"CUT_M3": f"{volumes['cut']:.3f}", "FILL_M3": f"{volumes['fill']:.3f}", "NET_M3": f"{volumes['net']:.3f}"},
+                cog=options.get("heatmap_cog", False),
+                overview_resampling=options.get("heatmap_overview_resampling", "average")
+            )
+            with open(main_folder / f"{folder_name}_diferencia.tif", "wb") as f:
+                f.write(tif_bytes)
+        except Exception as e:
+            logger.error(f"Error calculando volúmenes: {e}")
 
     # 6. HTML Viewers
     html_content = ""
+    html_report = {}
     try:
         html_map_type = options.get("html_map_type", "normal")
-        # Usar una copia para no quitar la Z del GeoJSON principal si se requiere después
-        gj_for_html = json.loads(json.dumps(geojson_serializable))
-        gj_2d = strip_z_from_geojson(gj_for_html)
-        
+        # La serialización compacta quita la Z sin copiar ni modificar el GeoJSON principal
+        precision = options.get("html_precision", mg.DEFAULT_COORD_PRECISION)
         if html_map_type == "mapbox":
-            html_content = mg.create_mapbox_html(gj_2d, title=f"{folder_name} View", folder_name=folder_name)
+            html_content = mg.create_mapbox_html(geojson_serializable, title=f"{folder_name} View", folder_name=folder_name, precision=precision, drop_z=True, report=html_report, payload=options.get("html_payload", "json"))
         else:
-            html_content = mg.create_leaflet_grouped_html(gj_2d, title=f"{folder_name} View")
+            html_content = mg.create_leaflet_grouped_html(geojson_serializable, title=f"{folder_name} View", precision=precision, drop_z=True, report=html_report, payload=options.get("html_payload", "json"))
         
-        with open(main_folder / "index.html", "w", encoding="utf-8") as f:
-            f.write(html_content)
+        # En modo "external" el index.html del paquete carga index.data.js; html_content sigue incrustado para la vista previa
+        mg.write_viewer_files(main_folder / "index.html", html_content, options.get("html_data_mode", "inline"))
     except Exception as e:
         logger.error(f"Error generando HTML: {e}")
 
@@ -289,7 +461,14 @@ def process_topo_data(df, input_epsg, output_epsg, options):
         "geojson": geojson,
         "dxf_path": dxf_path,
         "kml_path": kml_path,
+        "gpkg_path": gpkg_path,
         "geotiff_bytes": geotiff_bytes,
         "html_content": html_content,
-        "poly_info": poly_info
+        "html_report": html_report,
+        "poly_info": poly_info,
+        "contour_count": len(contours),
+        "tin_triangles": len(tin["triangles"]) if tin else 0,
+        "volumes": {k: v for k, v in volumes.items() if k not in ("diff", "transform")} if volumes else None,
+        "terrain_files": terrain_files,
+        "heatmap_method_selection": heat.get("method_selection") if heat else None
     }
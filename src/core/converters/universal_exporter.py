@@ -1,190 +1,207 @@
-import os
-import zipfile
-import io
+import time
 import json
+import logging
+import shutil
 import tempfile
-import shapefile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from src.core.converters.dxf_exporter import export_geojson_to_dxf
-from src.generators.map_generators import create_mapbox_html, create_leaflet_grouped_html, get_mapbox_token
-from simplekml import Kml
+from src.generators.map_generators import get_mapbox_token, write_viewer_files
+from src.generators.viewer_cache import get_viewer_html
+from src.utils.package_writer import open_package, add_package_file
+from src.core.converters.kml_writer import KmlWriter, hex_to_kml_color
+from src.core.converters.shapefile_writer import write_partitioned_shapefiles
+from src.core.converters.gpkg_writer import write_geopackage, geopackage_layers
 
-def export_geojson_to_all_formats(geojson_data, base_name, point_color="#ff0000", line_color="#0000ff", line_width=2, output_epsg=4326, map_type="normal"):
-    """
-    Exporta un GeoJSON a DXF, SHP (en carpeta), KMZ y Mapa HTML con estilos personalizados.
-    Retorna un buffer de bytes con el ZIP completo.
-    
-    Args:
-        map_type: "normal" para Leaflet, "mapbox" para Mapbox
-    """
-    zip_buf = io.BytesIO()
-    
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        tmp_path = Path(tmp_dir)
-        
-        # 1. DXF
-        dxf_file = tmp_path / f"{base_name}.dxf"
-        export_geojson_to_dxf(geojson_data, dxf_file, point_color=point_color, line_color=line_color, line_width=line_width)
-        
-        # 2. Shapefiles
-        shp_dir = tmp_path / "shapes"
-        shp_dir.mkdir(exist_ok=True)
-        try:
-            w = shapefile.Writer(str(shp_dir / base_name))
-            w.field("NAME", "C", 50)
-            w.field("TYPE", "C", 20)
-            
-            for f in geojson_data.get("features", []):
-                geom = f.get("geometry", {})
-                props = f.get("properties", {})
-                g_type = geom.get("type")
-                coords = geom.get("coordinates")
-                name = str(props.get("name") or props.get("label") or "")
-                etype = str(props.get("type") or g_type)
-                
-                if g_type == "Point":
-                    w.point(coords[0], coords[1])
-                    w.record(name, etype)
-                elif g_type == "LineString":
-                    w.line([coords])
-                    w.record(name, etype)
-                elif g_type == "Polygon":
-                    w.poly(coords)
-                    w.record(name, etype)
-            w.close()
-            # Crear .prj
-            with open(shp_dir / f"{base_name}.prj", "w") as prj:
-                prj.write('GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]')
-        except Exception:
-            pass
+logger = logging.getLogger(__name__)
 
-        # 3. KMZ con Estilos
-        kmz_file = tmp_path / f"{base_name}.kmz"
-        try:
-            import logging
-            logger = logging.getLogger(__name__)
-            
-            # Validar y diagnosticar coordenadas WGS84
-            def get_bounds(geojson):
-                coords = []
-                for f in geojson.get("features", []):
-                    g = f.get("geometry", {})
-                    c = g.get("coordinates")
-                    if c:
-                        _collect_coords(c, coords)
-                if not coords:
-                    return None
-                lons = [p[0] for p in coords]
-                lats = [p[1] for p in coords]
-                return (min(lons), min(lats), max(lons), max(lats))
-            
-            def _collect_coords(coords, acc):
-                if isinstance(coords, (list, tuple)):
-                    if len(coords) >= 2 and isinstance(coords[0], (int, float)):
-                        acc.append((coords[0], coords[1]))
-                    else:
-                        for c in coords:
-                            _collect_coords(c, acc)
-            
-            bounds = get_bounds(geojson_data)
-            if bounds:
-                min_lon, min_lat, max_lon, max_lat = bounds
-                logger.info(f"KML/KMZ: Exportando con coordenadas WGS84 (EPSG:4326)")
-                logger.info(f"KML/KMZ: Bounds: Lon=[{min_lon:.6f}, {max_lon:.6f}], Lat=[{min_lat:.6f}, {max_lat:.6f}]")
-                
-                # Validar rangos WGS84
-                if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
-                    logger.warning(f"KML/KMZ: Longitud fuera de rango WGS84: [{min_lon}, {max_lon}]")
-                if not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90):
-                    logger.warning(f"KML/KMZ: Latitud fuera de rango WGS84: [{min_lat}, {max_lat}]")
-                
-                # Verificar si está en rango de Ecuador
-                if -81.0 <= min_lon <= -75.0 and -5.0 <= min_lat <= 2.0:
-                    logger.info(f"KML/KMZ: Coordenadas dentro del rango de Ecuador continental")
-                else:
-                    logger.info(f"KML/KMZ: Coordenadas fuera del rango típico de Ecuador")
-            
-            kml = Kml()
-            # Convertir hex color a formato KML (aabbggrr)
-            def hex_to_kml_color(hex_str):
-                h = hex_str.lstrip('#')
-                if len(h) == 6:
-                    r, g, b = h[0:2], h[2:4], h[4:6]
-                    return f"ff{b}{g}{r}" # Alfa ff + bgr
-                return "ff0000ff"
+def _export_dxf(geojson_data, out_dir, base_name, point_color, line_color, line_width, output_epsg):
+    dxf_file = out_dir / f"{base_name}.dxf"
+    export_geojson_to_dxf(geojson_data, dxf_file, point_color=point_color, line_color=line_color, line_width=line_width, output_epsg=output_epsg)
+    return [dxf_file]
+
+def _export_shapefile(geojson_data, out_dir, base_name):
+    # Un shapefile por tipo de geometría (puntos, multipuntos, líneas, polígonos), en WGS84 como el GeoJSON
+    return write_partitioned_shapefiles(geojson_data.get("features", []), out_dir / "shapes", base_name, epsg=4326)
+
+def _export_geopackage(geojson_data, out_dir, base_name):
+    # Una tabla por capa y tipo de geometría, con índice R-tree, en WGS84 como el GeoJSON
+    gpkg_file = out_dir / f"{base_name}.gpkg"
+    write_geopackage(gpkg_file, geopackage_layers(geojson_data.get("features", [])), srs_id=4326)
+    return [gpkg_file]
 
-            kml_p_color = hex_to_kml_color(point_color)
-            kml_l_color = hex_to_kml_color(line_color)
+def _collect_coords(coords, acc):
+    if isinstance(coords, (list, tuple)):
+        if len(coords) >= 2 and isinstance(coords[0], (int, float)):
+            acc.append((coords[0], coords[1]))
+        else:
+            for c in coords:
+                _collect_coords(c, acc)
 
-            feature_count = 0
-            for f in geojson_data.get("features", []):
-                geom = f.get("geometry", {})
-                props = f.get("properties", {})
-                g_type = geom.get("type")
-                coords = geom.get("coordinates")
-                name = props.get("name") or props.get("label") or ""
-                
-                if g_type == "Point":
-                    pnt = kml.newpoint(name=name, coords=[(coords[0], coords[1])])
-                    pnt.style.labelstyle.color = kml_p_color
-                    pnt.style.iconstyle.color = kml_p_color
-                    feature_count += 1
-                elif g_type == "LineString":
-                    lin = kml.newlinestring(name=name, coords=coords)
-                    lin.style.linestyle.color = kml_l_color
-                    lin.style.linestyle.width = line_width
-                    feature_count += 1
-                elif g_type == "Polygon":
-                    pol = kml.newpolygon(name=name, outerboundaryis=coords[0])
-                    pol.style.linestyle.color = kml_l_color
-                    pol.style.linestyle.width = line_width
-                    pol.style.polystyle.color = kml_l_color.replace("ff", "4b") # Opacidad 30%
-                    feature_count += 1
+def _log_wgs84_bounds(geojson):
+    """Valida y diagnostica las coordenadas WGS84 antes de exportar el KMZ."""
+    coords = []
+    for f in geojson.get("features", []):
+        g = f.get("geometry", {})
+        c = g.get("coordinates")
+        if c:
+            _collect_coords(c, coords)
+    if not coords:
+        return
+    lons = [p[0] for p in coords]
+    lats = [p[1] for p in coords]
+    min_lon, min_lat, max_lon, max_lat = min(lons), min(lats), max(lons), max(lats)
+    logger.info(f"KML/KMZ: Exportando con coordenadas WGS84 (EPSG:4326)")
+    logger.info(f"KML/KMZ: Bounds: Lon=[{min_lon:.6f}, {max_lon:.6f}], Lat=[{min_lat:.6f}, {max_lat:.6f}]")
+    
+    # Validar rangos WGS84
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        logger.warning(f"KML/KMZ: Longitud fuera de rango WGS84: [{min_lon}, {max_lon}]")
+    if not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+        logger.warning(f"KML/KMZ: Latitud fuera de rango WGS84: [{min_lat}, {max_lat}]")
+    
+    # Verificar si está en rango de Ecuador
+    if -81.0 <= min_lon <= -75.0 and -5.0 <= min_lat <= 2.0:
+        logger.info(f"KML/KMZ: Coordenadas dentro del rango de Ecuador continental")
+    else:
+        logger.info(f"KML/KMZ: Coordenadas fuera del rango típico de Ecuador")
+
+def _export_kmz(geojson_data, out_dir, base_name, point_color, line_color, line_width):
+    kmz_file = out_dir / f"{base_name}.kmz"
+    _log_wgs84_bounds(geojson_data)
+    
+    # Un estilo compartido por tipo de geometría; los placemarks se escriben directo en el KMZ
+    kml_p_color = hex_to_kml_color(point_color)
+    kml_l_color = hex_to_kml_color(line_color)
+    with KmlWriter(kmz_file, name=base_name) as kml:
+        kml.add_style("point", icon_color=kml_p_color, label_color=kml_p_color)
+        kml.add_style("line", line_color=kml_l_color, line_width=line_width)
+        kml.add_style("polygon", line_color=kml_l_color, line_width=line_width, poly_color=hex_to_kml_color(line_color, alpha="4b")) # Opacidad 30%
+        for f in geojson_data.get("features", []):
+            geom = f.get("geometry", {})
+            props = f.get("properties", {})
+            g_type = geom.get("type")
+            coords = geom.get("coordinates")
+            name = props.get("name") or props.get("label") or ""
             
-            kml.savekmz(str(kmz_file))
-            logger.info(f"KML/KMZ: Exportado exitosamente con {feature_count} features a {kmz_file}")
-        except Exception as e:
-            logger.error(f"KML/KMZ: Error en exportación: {e}")
-            pass
+            if g_type == "Point":
+                kml.point(name, coords[:2], style="point")
+            elif g_type == "LineString":
+                kml.linestring(name, coords, style="line")
+            elif g_type == "Polygon":
+                kml.polygon(name, coords, style="polygon")
+    
+    logger.info(f"KML/KMZ: Exportado exitosamente con {kml.count} features a {kmz_file}")
+    return [kmz_file]
 
-        # 4. HTML Map - Usar el tipo de mapa seleccionado por el usuario
-        try:
-            if map_type == "mapbox":
-                # Generar mapa Mapbox con colores iniciales
-                html_content = create_mapbox_html(
-                    geojson_data, 
-                    title=base_name, 
-                    folder_name=base_name,
-                    point_color=point_color,
-                    line_color=line_color
-                )
-            else:
-                # Generar mapa Leaflet con estilos personalizados
-                html_content = create_leaflet_grouped_html(
-                    geojson_data, 
-                    title=base_name,
-                    point_color=point_color,
-                    line_color=line_color,
-                    line_width=line_width
-                )
-            
-            html_file = tmp_path / "Visualizador_Mapa.html"
-            with open(html_file, "w", encoding="utf-8") as f:
-                f.write(html_content)
-        except Exception:
-            pass
+def _export_html(geojson_data, out_dir, base_name, point_color, line_color, line_width, map_type, html_payload, html_data_mode, data_key):
+    # Caché de visores: repetir la exportación del mismo GeoJSON con el mismo título y
+    # formato solo aplica el estilo; data_key evita serializarlo para calcular la clave
+    viewer_options = {"title": base_name, "payload": html_payload}
+    if map_type == "mapbox":
+        viewer_options["folder_name"] = base_name
+    html_content = get_viewer_html(
+        geojson_data,
+        map_type=map_type,
+        point_color=point_color,
+        line_color=line_color,
+        line_width=line_width,
+        data_key=data_key,
+        **viewer_options
+    )
+    return write_viewer_files(out_dir / "Visualizador_Mapa.html", html_content, html_data_mode)
 
-        # 5. GeoJSON
-        geojson_file = tmp_path / f"{base_name}.geojson"
-        with open(geojson_file, "w", encoding="utf-8") as f:
-            json.dump(geojson_data, f, indent=2)
+def _export_geojson(geojson_data, out_dir, base_name):
+    geojson_file = out_dir / f"{base_name}.geojson"
+    with open(geojson_file, "w", encoding="utf-8") as f:
+        json.dump(geojson_data, f, indent=2)
+    return [geojson_file]
 
-        # Crear ZIP final
-        with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
-            for root, dirs, files in os.walk(tmp_dir):
-                for file in files:
-                    file_path = Path(root) / file
-                    arcname = f"{base_name}/" + str(file_path.relative_to(tmp_dir)).replace("\\", "/")
-                    zf.write(file_path, arcname)
-                    
-    return zip_buf.getvalue()
+def _run_stage(name, func, out_dir, *args):
+    """Ejecuta una etapa de exportación. Retorna (nombre, archivos, segundos); los errores se propagan al futuro."""
+    started = time.time()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = func(*args[:1], out_dir, *args[1:])
+    return name, files, time.time() - started
+
+def export_geojson_to_all_formats(geojson_data, base_name, point_color="#ff0000", line_color="#0000ff", line_width=2, output_epsg=4326, map_type="normal", html_payload="json", html_data_mode="inline", data_key=None, report=None, max_workers=None, target=None, gpkg=False):
+    """
+    Exporta un GeoJSON a DXF, SHP (en carpeta, uno por tipo de geometría), KMZ y Mapa HTML con estilos personalizados.
+    
+    El ZIP se arma entrada por entrada (src.utils.package_writer) sobre target:
+    con una ruta se escribe directo en disco y se retorna la ruta; con un archivo
+    binario abierto se escribe en él y se retorna rebobinado; sin target se
+    retorna bytes, como antes.
+    
+    Las etapas son independientes y corren en paralelo en hilos, que comparten el
+    GeoJSON sin copiarlo (zlib, la escritura a disco y las librerías nativas liberan
+    el GIL). Cada etapa escribe en su propia carpeta temporal; el hilo principal
+    copia sus archivos al ZIP apenas termina y borra la carpeta, así que el disco
+    no acumula el paquete dos veces. Los escritores (pyshp, ezdxf, simplekml)
+    producen archivos completos y zipfile admite una sola entrada abierta a la vez,
+    por eso no se escribe directo en las entradas. Un error en una etapa se
+    registra y no detiene a las demás.
+    
+    Args:
+        output_epsg: CRS proyectado del DXF; con 4326 (geográfico) el DXF usa la zona UTM del centroide
+        map_type: "normal" para Leaflet, "mapbox" para Mapbox
+        html_payload: "json" (GeoJSON incrustado) o "gzip" (comprimido, se descomprime en el navegador)
+        html_data_mode: "inline" (un solo HTML) o "external" (datos en Visualizador_Mapa.data.js junto al HTML)
+        data_key: hash del GeoJSON ya calculado (session_geojson_hash) para la clave del caché de visores
+        report: dict opcional; recibe "stages" {etapa: {"seconds", "files", "error"}} y "total_seconds"
+        target: ruta del ZIP, archivo binario abierto o None (retorna bytes)
+        gpkg: agrega un GeoPackage (una tabla por capa y tipo, con índice R-tree)
+    """
+    started = time.time()
+    zf, package_file = open_package(target)
+    stages = {
+        "dxf": (_export_dxf, geojson_data, base_name, point_color, line_color, line_width, output_epsg),
+        "shp": (_export_shapefile, geojson_data, base_name),
+        "kmz": (_export_kmz, geojson_data, base_name, point_color, line_color, line_width),
+        "html": (_export_html, geojson_data, base_name, point_color, line_color, line_width, map_type, html_payload, html_data_mode, data_key),
+        "geojson": (_export_geojson, geojson_data, base_name),
+    }
+    if gpkg:
+        stages["gpkg"] = (_export_geopackage, geojson_data, base_name)
+    stage_report = {}
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir)
+            with zf, ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+                futures = {
+                    executor.submit(_run_stage, name, func, tmp_path / name, *args): name
+                    for name, (func, *args) in stages.items()
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        _, files, seconds = future.result()
+                    except Exception as e:
+                        logger.error(f"Exportación {name.upper()}: Error en exportación: {e}")
+                        stage_report[name] = {"seconds": None, "files": 0, "error": str(e)}
+                        continue
+                    # Solo el hilo principal escribe en el ZIP
+                    stage_dir = tmp_path / name
+                    for file_path in files:
+                        add_package_file(zf, file_path, f"{base_name}/" + Path(file_path).relative_to(stage_dir).as_posix())
+                    shutil.rmtree(stage_dir, ignore_errors=True)
+                    stage_report[name] = {"seconds": seconds, "files": len(files), "error": None}
+                    logger.info(f"Exportación {name.upper()}: {len(files)} archivo(s) en {seconds:.2f}s")
+    except BaseException:
+        # El paquete a medio escribir no sirve; un archivo del llamador queda abierto para él
+        if package_file is not target:
+            package_file.close()
+        raise
+    
+    if report is not None:
+        report["stages"] = stage_report
+        report["total_seconds"] = time.time() - started
+    if isinstance(target, (str, Path)):
+        package_file.close()
+        return Path(target)
+    package_file.seek(0)
+    if target is None:
+        with package_file:
+            return package_file.read()
+    return package_file
@@ -0,0 +1,89 @@
+import numpy as np
+from rasterio.transform import Affine
+from scipy.spatial import QhullError
+
+from src.core.converters.heatmap_converter import get_cached_surface, interpolate_on_surface, surface_triangulation
+
+VOLUME_METHODS = ["linear", "cubic", "nearest"]
+
+def _surface_values(surface, z, points_xy, method="linear"):
+    """
+    Evalúa una superficie cacheada en los puntos dados. Para 'linear' se usan
+    directamente las coordenadas baricéntricas de la triangulación (una búsqueda
+    de triángulo y una suma por punto); fuera del hull convexo el resultado es NaN.
+    Con puntos degenerados (colineales) se delega en interpolate_on_surface, que
+    cae a 'nearest'.
+    """
+    if method != "linear":
+        return interpolate_on_surface(surface, z, points_xy[:, 0], points_xy[:, 1], method)
+    try:
+        tri = surface_triangulation(surface)
+    except QhullError:
+        return interpolate_on_surface(surface, z, points_xy[:, 0], points_xy[:, 1], method)
+    simplex = tri.find_simplex(points_xy)
+    inside = simplex >= 0
+    values = np.full(len(points_xy), np.nan)
+    s = simplex[inside]
+    affine = tri.transform[s]
+    b = np.einsum("ijk,ik->ij", affine[:, :2], points_xy[inside] - affine[:, 2])
+    weights = np.column_stack((b, 1.0 - b.sum(axis=1)))
+    values[inside] = (z[tri.simplices[s]] * weights).sum(axis=1)
+    return values
+
+def compute_volumes(before_xyz, after_xyz, resolution=1000, method="linear"):
+    """
+    Calcula corte, relleno y volumen neto entre dos levantamientos (arreglos x, y, cota).
+
+    Ambas superficies se evalúan en los centros de una grilla común de
+    resolution x resolution celdas sobre el área que comparten, reutilizando las
+    triangulaciones cacheadas. Cada celda aporta (final - inicial) * área de celda;
+    las celdas fuera de alguna de las dos superficies no se integran.
+
+    Retorna {"cut", "fill", "net", "cut_area", "fill_area", "cell_area", "cells",
+    "diff" (grilla norte-arriba, final - inicial), "transform"}.
+    """
+    before_xyz = np.asarray(before_xyz, dtype=float)
+    after_xyz = np.asarray(after_xyz, dtype=float)
+    before_xyz = before_xyz[np.isfinite(before_xyz).all(axis=1)]
+    after_xyz = after_xyz[np.isfinite(after_xyz).all(axis=1)]
+    if len(before_xyz) < 3 or len(after_xyz) < 3:
+        raise ValueError("Cada superficie necesita al menos 3 puntos")
+
+    min_x = max(before_xyz[:, 0].min(), after_xyz[:, 0].min())
+    max_x = min(before_xyz[:, 0].max(), after_xyz[:, 0].max())
+    min_y = max(before_xyz[:, 1].min(), after_xyz[:, 1].min())
+    max_y = min(before_xyz[:, 1].max(), after_xyz[:, 1].max())
+    if max_x <= min_x or max_y <= min_y:
+        raise ValueError("Las dos superficies no se superponen")
+
+    dx = (max_x - min_x) / resolution
+    dy = (max_y - min_y) / resolution
+    # Coordenadas locales (origen común) para que Qhull no pierda precisión con magnitudes UTM
+    origin = np.array([min_x, min_y])
+    cx = (np.arange(resolution) + 0.5) * dx
+    cy = (max_y - min_y) - (np.arange(resolution) + 0.5) * dy
+    centers = np.column_stack((np.tile(cx, resolution), np.repeat(cy, resolution)))
+
+    surfaces = []
+    for xyz in (before_xyz, after_xyz):
+        surface = get_cached_surface(xyz[:, :2] - origin, purpose="volumes")
+        surfaces.append(_surface_values(surface, xyz[:, 2], centers, method))
+    diff = (surfaces[1] - surfaces[0]).reshape(resolution, resolution)
+
+    cell_area = dx * dy
+    valid = np.isfinite(diff)
+    cut_cells = valid & (diff < 0)
+    fill_cells = valid & (diff > 0)
+    cut = float(np.abs(diff[cut_cells]).sum() * cell_area)
+    fill = float(diff[fill_cells].sum() * cell_area)
+    return {
+        "cut": cut,
+        "fill": fill,
+        "net": fill - cut,
+        "cut_area": float(cut_cells.sum() * cell_area),
+        "fill_area": float(fill_cells.sum() * cell_area),
+        "cell_area": float(cell_area),
+        "cells": int(valid.sum()),
+        "diff": diff.astype(np.float32),
+        "transform": Affine.translation(min_x, max_y) * Affine.scale(dx, -dy),
+    }
@@ -96,6 +96,11 @@ def filter_geojson_valid(geojson_obj: dict) -> dict:
 def build_transformer(input_epsg: int, output_epsg: int) -> pyproj.Transformer:
     return pyproj.Transformer.from_crs(f"EPSG:{input_epsg}", f"EPSG:{output_epsg}", always_xy=True)
 
+def utm_epsg_for_lonlat(lon: float, lat: float) -> int:
+    """EPSG de la zona UTM WGS84 que contiene el punto (326zz norte, 327zz sur)."""
+    zone = int((float(lon) + 180.0) // 6.0) % 60 + 1
+    return (32600 if lat >= 0 else 32700) + zone
+
 def utm_to_latlon_coords(transformer: pyproj.Transformer, x: float, y: float):
     lon, lat = transformer.transform(x, y)
     return lon, lat
@@ -1,9 +1,93 @@
 import json
 import folium
+from folium.utilities import JsCode
 from streamlit_folium import st_folium
 import streamlit as st
 import os
+import base64
+import gzip
+import logging
+from pathlib import Path
 from src.core.geometry.coordinate_utils import compute_bounds_from_geojson
+from src.generators.vector_tiles import build_geojson_tiles
+from src.generators.simplification import build_viewer_lods
+
+logger = logging.getLogger(__name__)
+
+# 7 decimales en grados equivalen a ~1 cm
+DEFAULT_COORD_PRECISION = 7
+
+def _json_default(obj):
+    """Serializa escalares de NumPy (np.float64, np.int64...) como tipos nativos."""
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+_COMPACT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+def _round_coords(coords, precision, drop_z=False):
+    """Redondea (y opcionalmente quita la Z de) un arreglo anidado de coordenadas."""
+    if not coords:
+        return coords
+    if isinstance(coords[0], (list, tuple)):
+        return [_round_coords(c, precision, drop_z) for c in coords]
+    if drop_z:
+        coords = coords[:2]
+    return [round(float(c), precision) for c in coords]
+
+def _compact_geometry(geometry, precision, drop_z=False):
+    if not isinstance(geometry, dict):
+        return geometry
+    if geometry.get("type") == "GeometryCollection":
+        return {"type": "GeometryCollection", "geometries": [_compact_geometry(g, precision, drop_z) for g in geometry.get("geometries", [])]}
+    if "coordinates" not in geometry:
+        return geometry
+    return {"type": geometry.get("type"), "coordinates": _round_coords(geometry["coordinates"], precision, drop_z)}
+
+def _serialized_bytes(geojson_data, indent=None):
+    """Tamaño de la serialización anterior (json.dumps completo), usado como referencia en los reportes."""
+    return len(json.dumps(geojson_data, ensure_ascii=False, indent=indent, default=_json_default).encode("utf-8"))
+
+def compact_geojson_str(geojson_data, precision=DEFAULT_COORD_PRECISION, drop_z=False, normalize_properties=False, report=None, baseline_indent=None):
+    """
+    Serializa un FeatureCollection para incrustarlo en un visor HTML: sin sangría,
+    con coordenadas redondeadas a `precision` decimales y feature por feature, sin
+    copiar el GeoJSON de entrada (solo se crean la geometría redondeada y, si hace
+    falta, las propiedades normalizadas de cada feature).
+
+    normalize_properties pasa 'type' a minúsculas y completa 'layer' con "default"
+    (lo que esperan los visores Leaflet). Si se pasa un dict en `report`, se llena
+    con el número de features y el tamaño en bytes antes (serialización anterior,
+    con baseline_indent) y después.
+    """
+    if not isinstance(geojson_data, dict) or geojson_data.get("type") != "FeatureCollection":
+        text = _COMPACT_ENCODER.encode(geojson_data)
+    else:
+        head = _COMPACT_ENCODER.encode({k: v for k, v in geojson_data.items() if k != "features"})
+        parts = [head[:-1] + ("," if len(head) > 2 else "") + '"features":[']
+        features = geojson_data.get("features", [])
+        for i, f in enumerate(features):
+            if isinstance(f, dict):
+                props = f.get("properties") or {}
+                if normalize_properties:
+                    props = dict(props)
+                    if isinstance(props.get("type"), str):
+                        props["type"] = props["type"].lower()
+                    props.setdefault("layer", "default")
+                f = dict(f, geometry=_compact_geometry(f.get("geometry"), precision, drop_z), properties=props)
+            parts.append(("," if i else "") + _COMPACT_ENCODER.encode(f))
+        parts.append("]}")
+        text = "".join(parts)
+    # Evitar que un '</script>' dentro de un texto cierre el bloque de script del visor
+    text = text.replace("</", "<\\/")
+    if report is not None:
+        report.update({
+            "features": len(geojson_data.get("features", [])) if isinstance(geojson_data, dict) else 0,
+            "original_bytes": _serialized_bytes(geojson_data, baseline_indent),
+            "compact_bytes": len(text.encode("utf-8")),
+        })
+        logger.info(f"GeoJSON incrustado: {report['original_bytes']} -> {report['compact_bytes']} bytes ({report['features']} features)")
+    return text
 
 def get_mapbox_token():
     """Retorna el token de Mapbox buscando en secretos, entorno o localmente."""
@@ -21,9 +105,223 @@ def get_mapbox_token():
         
     return None
 
-def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_mode="type"):
+VIEWER_PAYLOADS = ["json", "gzip"]
+# "external": los datos van en un archivo hermano <nombre>.data.js (ver externalize_viewer_data)
+VIEWER_DATA_MODES = ["inline", "external"]
+_VIEWER_DATA_START = "/*VIEWER_DATA*/"
+_VIEWER_DATA_END = "/*END_VIEWER_DATA*/"
+# A partir de este número de features el visor Leaflet usa teselas vectoriales
+TILED_VIEWER_MIN_FEATURES = 50000
+
+_PAYLOAD_READY_JS = """function viewerPayloadReady() {
+            if (!viewerDataFile) return Promise.resolve(viewerPayload);
+            // Datos en un archivo hermano: una etiqueta <script> también carga con file://
+            return new Promise((resolve, reject) => {
+                const s = document.createElement('script');
+                s.src = viewerDataFile;
+                s.onload = () => resolve(window.VIEWER_PAYLOAD);
+                s.onerror = () => reject(new Error('No se encontró el archivo de datos ' + viewerDataFile + ' junto al HTML'));
+                document.head.appendChild(s);
+            });
+        }"""
+
+# Un payload en texto es GeoJSON gzip en base64 (payload 'gzip' o archivo .data.js); uno en objeto se usa tal cual
+_LOAD_DATA_JS = """function loadViewerData() {
+            return viewerPayloadReady().then(packed => {
+                if (typeof packed !== 'string') return packed;
+                if (typeof DecompressionStream === 'undefined') {
+                    throw new Error('El navegador no soporta DecompressionStream');
+                }
+                const bin = atob(packed);
+                const bytes = new Uint8Array(bin.length);
+                for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+                const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+                return new Response(stream).text().then(JSON.parse);
+            });
+        }"""
+
+# Marca en el <head> de los visores donde se inyecta el estilo (ver apply_viewer_style)
+VIEWER_STYLE_PLACEHOLDER = "<!--VIEWER_STYLE-->"
+
+def viewer_style_script(point_color="#ff0000", line_color="#0000ff", line_width=2):
+    """<script> que define window.VIEWER_STYLE; tiene prioridad sobre los colores con que se generó el visor."""
+    style = json.dumps({"pointColor": point_color, "lineColor": line_color, "lineWidth": line_width}).replace("</", "<\\/")
+    return f"<script>window.VIEWER_STYLE = {style};</script>"
+
+def apply_viewer_style(html, point_color="#ff0000", line_color="#0000ff", line_width=2):
+    """
+    Cambia colores y ancho de línea de un visor ya generado reemplazando la marca
+    VIEWER_STYLE_PLACEHOLDER, sin volver a serializar los datos.
+    """
+    return html.replace(VIEWER_STYLE_PLACEHOLDER, viewer_style_script(point_color, line_color, line_width), 1)
+
+# Visor Leaflet: con más puntos visibles que VIEWER_MAX_POINTS se agrupan en celdas de VIEWER_CLUSTER_PIXELS píxeles
+VIEWER_MAX_POINTS = 5000
+VIEWER_CLUSTER_PIXELS = 48
+# Con más textos que VIEWER_MAX_LABELS solo se rotulan desde VIEWER_LABEL_MIN_ZOOM, y siempre dentro de la vista
+VIEWER_LABEL_MIN_ZOOM = 16
+VIEWER_MAX_LABELS = 300
+
+_VIEWPORT_LAYERS_JS = """const viewerRenderer = L.canvas({ padding: 0.5 });
+        // Capas que guardan solo coordenadas y en cada movimiento del mapa dibujan lo visible
+        const ViewportLayer = L.LayerGroup.extend({
+            onAdd: function (map) {
+                L.LayerGroup.prototype.onAdd.call(this, map);
+                map.on('moveend', this._redraw, this);
+                this._redraw();
+            },
+            onRemove: function (map) {
+                map.off('moveend', this._redraw, this);
+                L.LayerGroup.prototype.onRemove.call(this, map);
+            }
+        });
+        // Puntos sobre el canvas compartido; si los visibles superan maxPoints se agrupan por celdas de la grilla
+        const PointCloudLayer = ViewportLayer.extend({
+            initialize: function (style) {
+                L.LayerGroup.prototype.initialize.call(this);
+                this._style = Object.assign({ renderer: viewerRenderer }, style);
+                this._points = [];
+            },
+            addPoint: function (latlng) { this._points.push(latlng); return this; },
+            getBounds: function () { return L.latLngBounds(this._points); },
+            _redraw: function () {
+                const map = this._map;
+                if (!map || !map._loaded) return;
+                this.clearLayers();
+                const b = map.getBounds().pad(0.1);
+                const south = b.getSouth(), north = b.getNorth(), west = b.getWest(), east = b.getEast();
+                const visible = this._points.filter(p => p[0] >= south && p[0] <= north && p[1] >= west && p[1] <= east);
+                const zoom = map.getZoom();
+                if (visible.length <= viewerLayerOptions.maxPoints || zoom >= map.getMaxZoom()) {
+                    visible.forEach(p => this.addLayer(L.circleMarker(p, this._style)));
+                    return;
+                }
+                const cell = viewerLayerOptions.clusterPixels;
+                const cells = new Map();
+                visible.forEach(p => {
+                    const pt = map.project(p, zoom);
+                    const key = Math.floor(pt.x / cell) + ':' + Math.floor(pt.y / cell);
+                    const c = cells.get(key);
+                    if (c) { c[0] += p[0]; c[1] += p[1]; c[2]++; } else cells.set(key, [p[0], p[1], 1]);
+                });
+                cells.forEach(c => {
+                    const n = c[2];
+                    if (n === 1) {
+                        this.addLayer(L.circleMarker([c[0], c[1]], this._style));
+                        return;
+                    }
+                    const style = Object.assign({}, this._style, { radius: Math.min(20, 6 + 2 * Math.log2(n)), fillOpacity: 0.5 });
+                    this.addLayer(L.circleMarker([c[0] / n, c[1] / n], style).bindTooltip(String(n)));
+                });
+            }
+        });
+        // Textos: con más de maxLabels solo desde labelMinZoom, y siempre solo los que caen en la vista
+        const LabelLayer = ViewportLayer.extend({
+            initialize: function (html) {
+                L.LayerGroup.prototype.initialize.call(this);
+                this._html = html;
+                this._labels = [];
+            },
+            addLabel: function (latlng, text) { this._labels.push([latlng[0], latlng[1], text]); return this; },
+            getBounds: function () { return L.latLngBounds(this._labels.map(l => [l[0], l[1]])); },
+            _redraw: function () {
+                const map = this._map;
+                if (!map || !map._loaded) return;
+                this.clearLayers();
+                if (this._labels.length > viewerLayerOptions.maxLabels && map.getZoom() < viewerLayerOptions.labelMinZoom) return;
+                const b = map.getBounds();
+                let drawn = 0;
+                for (const l of this._labels) {
+                    if (!b.contains([l[0], l[1]])) continue;
+                    if (drawn++ >= viewerLayerOptions.maxLabels) break;
+                    this.addLayer(L.marker([l[0], l[1]], { icon: L.divIcon({ className: '', html: this._html(l[2]) }), interactive: false }));
+                }
+            }
+        });"""
+
+def viewer_layers_script(max_points=VIEWER_MAX_POINTS, cluster_pixels=VIEWER_CLUSTER_PIXELS, label_min_zoom=VIEWER_LABEL_MIN_ZOOM, max_labels=VIEWER_MAX_LABELS):
+    """
+    JS con las capas PointCloudLayer y LabelLayer de los visores Leaflet.
+
+    En vez de un L.marker por punto y un div por texto, cada grupo guarda sus
+    coordenadas y en cada 'moveend' crea capas solo para lo que cae en la vista:
+    círculos sobre un único canvas (agrupados por grilla si son demasiados) y
+    etiquetas solo por encima del zoom umbral.
+    """
+    options = json.dumps({"maxPoints": max_points, "clusterPixels": cluster_pixels, "labelMinZoom": label_min_zoom, "maxLabels": max_labels})
+    return f"const viewerLayerOptions = {options};\n        {_VIEWPORT_LAYERS_JS}"
+
+def viewer_data_script(geojson_str, payload="json", report=None):
+    """
+    JS que define loadViewerData(), una promesa con el GeoJSON del visor.
+
+    'json' incrusta el literal tal cual. 'gzip' incrusta el texto comprimido en
+    base64 y lo descomprime en el navegador con DecompressionStream: el HTML pesa
+    varias veces menos y el parseo ocurre después de dibujar el mapa base. El
+    cargador acepta las dos formas, así que externalize_viewer_data puede
+    comprimir los datos de un visor 'json'.
+    """
+    if payload == "gzip":
+        packed = _pack_viewer_data(geojson_str)
+        if report is not None:
+            report["payload_bytes"] = len(packed)
+        literal = f'"{packed}"'
+    else:
+        if report is not None:
+            report["payload_bytes"] = len(geojson_str.encode("utf-8"))
+        literal = geojson_str
+    return (f"let viewerPayload = {_VIEWER_DATA_START}{literal}{_VIEWER_DATA_END};\n"
+            f"        const viewerDataFile = null;\n        {_PAYLOAD_READY_JS}\n        {_LOAD_DATA_JS}")
+
+def _pack_viewer_data(text):
+    """Texto JSON comprimido con gzip y codificado en base64 (lo que espera _LOAD_DATA_JS)."""
+    return base64.b64encode(gzip.compress(text.encode("utf-8"), compresslevel=6, mtime=0)).decode("ascii")
+
+def externalize_viewer_data(html, data_file_name):
+    """
+    Separa los datos de un visor ya generado: retorna (html, contenido de
+    data_file_name). El HTML queda sin datos y los carga de forma asíncrona desde
+    el archivo hermano con una etiqueta <script>, que funciona también al abrirlo
+    con file://. El HTML original sigue siendo el visor de un solo archivo.
+    El archivo de datos siempre lleva el payload gzip/base64, aunque el visor se
+    haya generado con 'json': así no repite el GeoJSON completo que ya va en el
+    paquete. Si el HTML no tiene datos incrustados se retorna (html, None).
+    """
+    start = html.find(_VIEWER_DATA_START)
+    end = html.rfind(_VIEWER_DATA_END)
+    if start < 0 or end < start:
+        return html, None
+    literal = html[start + len(_VIEWER_DATA_START):end]
+    if not literal.startswith('"'):
+        literal = f'"{_pack_viewer_data(literal)}"'
+    data_js = f"window.VIEWER_PAYLOAD = {literal};\n"
+    tail = html[end + len(_VIEWER_DATA_END):].replace("const viewerDataFile = null;", f"const viewerDataFile = {json.dumps(data_file_name)};", 1)
+    return html[:start] + "null" + tail, data_js
+
+def write_viewer_files(html_path, html, data_mode="inline"):
+    """
+    Escribe el visor en html_path. Con data_mode="external" los datos van a
+    <nombre>.data.js junto al HTML. Retorna las rutas escritas.
+    """
+    html_path = Path(html_path)
+    written = [html_path]
+    if data_mode == "external":
+        data_path = html_path.with_name(f"{html_path.stem}.data.js")
+        html, data_js = externalize_viewer_data(html, data_path.name)
+        if data_js is not None:
+            data_path.write_text(data_js, encoding="utf-8")
+            written.append(data_path)
+    html_path.write_text(html, encoding="utf-8")
+    return written
+
+def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_mode="type", compact=True, precision=DEFAULT_COORD_PRECISION, report=None, payload="json"):
     """Genera HTML con visor Leaflet normal con control de capas según modo de agrupamiento"""
-    geojson_str = json.dumps(geojson_data)
+    if compact:
+        geojson_str = compact_geojson_str(geojson_data, precision=precision, report=report)
+    else:
+        geojson_str = json.dumps(geojson_data)
+    data_script = viewer_data_script(geojson_str, payload, report)
+    layers_script = viewer_layers_script()
     bounds_str = json.dumps(bounds) if bounds else "null"
     
     if grouping_mode.lower() == "layer":
@@ -60,8 +358,9 @@ def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_m
         // Agregar capa base por defecto
         positron.addTo(map);
 
-        // GeoJSON y grupos por LAYER
-        const data = {geojson_str};
+        // GeoJSON y grupos por LAYER (los datos se cargan después de dibujar el mapa base)
+        {data_script}
+        {layers_script}
         function groupByLayer(features) {{
             const groups = {{}};
             features.forEach(f => {{
@@ -72,99 +371,98 @@ def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_m
             return groups;
         }}
         
-        const grouped = groupByLayer(data.features || []);
-        const overlayMaps = {{}};
+        loadViewerData().then(data => {{
+            const grouped = groupByLayer(data.features || []);
+            const overlayMaps = {{}};
         
-        // Colores por layer
-        const layerColors = ['#ff0000', '#0000ff', '#00ff00', '#ffff00', '#ff00ff', '#00ffff', '#ff8000', '#8000ff', '#0080ff', '#ff0080'];
-        let colorIndex = 0;
+            // Colores por layer
+            const layerColors = ['#ff0000', '#0000ff', '#00ff00', '#ffff00', '#ff00ff', '#00ffff', '#ff8000', '#8000ff', '#0080ff', '#ff0080'];
+            let colorIndex = 0;
         
-        Object.keys(grouped).forEach(layer => {{
-            const feats = grouped[layer];
-            const color = layerColors[colorIndex % layerColors.length];
-            colorIndex++;
+            Object.keys(grouped).forEach(layer => {{
+                const feats = grouped[layer];
+                const color = layerColors[colorIndex % layerColors.length];
+                colorIndex++;
             
-            let layerGroup = L.layerGroup();
+                let layerGroup = L.layerGroup();
+                const points = new PointCloudLayer({{
+                    radius: 4, 
+                    color: color, 
+                    fillColor: color,
+                    fillOpacity: 0.8
+                }});
+                const labels = new LabelLayer(label => `<div style='font-size:12px;color:${{color}};font-weight:600;background:white;padding:2px;border-radius:3px;'>${{label}}</div>`);
+                layerGroup.addLayer(points);
+                layerGroup.addLayer(labels);
             
-            feats.forEach(feature => {{
-                const type = (feature.properties && feature.properties.type) ? feature.properties.type : 'unknown';
+                feats.forEach(feature => {{
+                    const type = (feature.properties && feature.properties.type) ? feature.properties.type : 'unknown';
                 
-                       if (type === 'point' || type === 'block') {{
-                           const [lon, lat] = feature.geometry.coordinates;
-                           const marker = L.circleMarker([lat, lon], {{
-                               radius: 4, 
-                               color: color, 
-                               fillColor: color,
-                               fillOpacity: 0.8
-                           }});
-                           layerGroup.addLayer(marker);
-                       }} else if (type === 'text') {{
-                           const [lon, lat] = feature.geometry.coordinates;
-                           const label = feature.properties && feature.properties.text ? feature.properties.text : '';
-                           const marker = L.marker([lat, lon], {{
-                               icon: L.divIcon({{ 
-                                   className: '', 
-                                   html: `<div style='font-size:12px;color:${{color}};font-weight:600;background:white;padding:2px;border-radius:3px;'>${{label}}</div>` 
-                               }})
-                           }});
-                           layerGroup.addLayer(marker);
-                       }} else {{
-                           // Líneas y polígonos - convertir coordenadas correctamente
-                           if (feature.geometry.type === 'LineString') {{
-                               const coords = feature.geometry.coordinates.map(coord => [coord[1], coord[0]]);
-                               const line = L.polyline(coords, {{
-                                   color: color, 
-                                   weight: 2, 
-                                   opacity: 0.8
-                               }});
-                               layerGroup.addLayer(line);
-                           }} else if (feature.geometry.type === 'Polygon') {{
-                               const coords = feature.geometry.coordinates[0].map(coord => [coord[1], coord[0]]);
-                               const polygon = L.polygon(coords, {{
-                                   color: color, 
-                                   weight: 2, 
-                                   opacity: 0.8,
-                                   fillOpacity: 0.1
-                               }});
-                               layerGroup.addLayer(polygon);
+                           if (type === 'point' || type === 'block') {{
+                               const [lon, lat] = feature.geometry.coordinates;
+                               points.addPoint([lat, lon]);
+                           }} else if (type === 'text') {{
+                               const [lon, lat] = feature.geometry.coordinates;
+                               const label = feature.properties && feature.properties.text ? feature.properties.text : '';
+                               labels.addLabel([lat, lon], label);
                            }} else {{
-                               // Otros tipos usando geoJSON estándar
-                               const geoJsonLayer = L.geoJSON(feature, {{
-                                   style: {{ color: color, weight: 2, opacity: 0.8 }}
-                               }});
-                               layerGroup.addLayer(geoJsonLayer);
+                               // Líneas y polígonos - convertir coordenadas correctamente
+                               if (feature.geometry.type === 'LineString') {{
+                                   const coords = feature.geometry.coordinates.map(coord => [coord[1], coord[0]]);
+                                   const line = L.polyline(coords, {{
+                                       color: color, 
+                                       weight: 2, 
+                                       opacity: 0.8
+                                   }});
+                                   layerGroup.addLayer(line);
+                               }} else if (feature.geometry.type === 'Polygon') {{
+                                   const coords = feature.geometry.coordinates[0].map(coord => [coord[1], coord[0]]);
+                                   const polygon = L.polygon(coords, {{
+                                       color: color, 
+                                       weight: 2, 
+                                       opacity: 0.8,
+                                       fillOpacity: 0.1
+                                   }});
+                                   layerGroup.addLayer(polygon);
+                               }} else {{
+                                   // Otros tipos usando geoJSON estándar
+                                   const geoJsonLayer = L.geoJSON(feature, {{
+                                       style: {{ color: color, weight: 2, opacity: 0.8 }}
+                                   }});
+                                   layerGroup.addLayer(geoJsonLayer);
+                               }}
                            }}
-                       }}
-            }});
+                }});
             
-            overlayMaps[layer] = layerGroup;
-            layerGroup.addTo(map);
-        }});
+                overlayMaps[layer] = layerGroup;
+                layerGroup.addTo(map);
+            }});
 
-        // Control de capas
-        L.control.layers(baseMaps, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
+            // Control de capas
+            L.control.layers(baseMaps, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
 
-        // Ajuste de extensión
-        const bounds = {bounds_str};
-        if (bounds && bounds.length === 2) {{ 
-            map.fitBounds(bounds); 
-        }} else {{
-            try {{
-                let allBounds = [];
-                Object.values(overlayMaps).forEach(l => {{
-                    if (l.getBounds) allBounds.push(l.getBounds());
-                }});
-                if (allBounds.length) {{
-                    let merged = allBounds[0];
-                    for (let i = 1; i < allBounds.length; i++) {{
-                        merged.extend(allBounds[i]);
+            // Ajuste de extensión
+            const bounds = {bounds_str};
+            if (bounds && bounds.length === 2) {{ 
+                map.fitBounds(bounds); 
+            }} else {{
+                try {{
+                    let allBounds = [];
+                    Object.values(overlayMaps).forEach(l => {{
+                        if (l.getBounds) allBounds.push(l.getBounds());
+                    }});
+                    if (allBounds.length) {{
+                        let merged = allBounds[0];
+                        for (let i = 1; i < allBounds.length; i++) {{
+                            merged.extend(allBounds[i]);
+                        }}
+                        map.fitBounds(merged);
+                    }} else {{
+                        map.setView([0,0], 2);
                     }}
-                    map.fitBounds(merged);
-                }} else {{
-                    map.setView([0,0], 2);
-                }}
-            }} catch (e) {{ map.setView([0,0], 2); }}
-        }}
+                }} catch (e) {{ map.setView([0,0], 2); }}
+            }}
+        }}).catch(e => {{ console.error(e); map.setView([0,0], 2); }});
     </script>
 </body>
 </html>"""
@@ -202,8 +500,9 @@ def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_m
         // Agregar capa base por defecto
         positron.addTo(map);
 
-        // GeoJSON y grupos por TIPO
-        const data = {geojson_str};
+        // GeoJSON y grupos por TIPO (los datos se cargan después de dibujar el mapa base)
+        {data_script}
+        {layers_script}
         function groupByType(features) {{
             const groups = {{}};
             features.forEach(f => {{
@@ -214,94 +513,106 @@ def create_normal_html(geojson_data, title="Map Viewer", bounds=None, grouping_m
             return groups;
         }}
         
-        const grouped = groupByType(data.features || []);
-        const overlayMaps = {{}};
+        loadViewerData().then(data => {{
+            const grouped = groupByType(data.features || []);
+            const overlayMaps = {{}};
         
-        Object.keys(grouped).forEach(type => {{
-            const feats = grouped[type];
-            let layer;
+            Object.keys(grouped).forEach(type => {{
+                const feats = grouped[type];
+                let layer;
             
-                   if (type === 'point' || type === 'block') {{
-                       layer = L.layerGroup();
-                       feats.forEach(feature => {{
-                           const [lon, lat] = feature.geometry.coordinates;
-                           const marker = L.circleMarker([lat, lon], {{ radius: 4, color: '#00ff00', fillOpacity: 0.8 }});
-                           layer.addLayer(marker);
-                       }});
-                   }} else if (type === 'text') {{
-                       layer = L.layerGroup();
-                       feats.forEach(feature => {{
-                           const [lon, lat] = feature.geometry.coordinates;
-                           const label = feature.properties && feature.properties.text ? feature.properties.text : '';
-                           const marker = L.marker([lat, lon], {{
-                               icon: L.divIcon({{ 
-                                   className: '', 
-                                   html: `<div style='font-size:12px;color:#0d6efd;font-weight:600;background:white;padding:2px;border-radius:3px;'>${{label}}</div>` 
-                               }})
+                       if (type === 'point' || type === 'block') {{
+                           layer = new PointCloudLayer({{ radius: 4, color: '#00ff00', fillOpacity: 0.8 }});
+                           feats.forEach(feature => {{
+                               const [lon, lat] = feature.geometry.coordinates;
+                               layer.addPoint([lat, lon]);
                            }});
-                           layer.addLayer(marker);
-                       }});
-                   }} else {{
-                       // Líneas y polígonos - manejar coordenadas correctamente
-                       layer = L.layerGroup();
-                       feats.forEach(feature => {{
-                           if (feature.geometry.type === 'LineString') {{
-                               const coords = feature.geometry.coordinates.map(coord => [coord[1], coord[0]]);
-                               const line = L.polyline(coords, {{ color: '#ff0000', weight: 2, opacity: 0.8 }});
-                               layer.addLayer(line);
-                           }} else if (feature.geometry.type === 'Polygon') {{
-                               const coords = feature.geometry.coordinates[0].map(coord => [coord[1], coord[0]]);
-                               const polygon = L.polygon(coords, {{ color: '#ff0000', weight: 2, opacity: 0.8, fillOpacity: 0.1 }});
-                               layer.addLayer(polygon);
-                           }} else {{
-                               // Otros tipos usando geoJSON estándar
-                               const geoJsonLayer = L.geoJSON(feature, {{ style: {{ color: '#ff0000', weight: 2, opacity: 0.8 }} }});
-                               layer.addLayer(geoJsonLayer);
-                           }}
-                       }});
-                   }}
+                       }} else if (type === 'text') {{
+                           layer = new LabelLayer(label => `<div style='font-size:12px;color:#0d6efd;font-weight:600;background:white;padding:2px;border-radius:3px;'>${{label}}</div>`);
+                           feats.forEach(feature => {{
+                               const [lon, lat] = feature.geometry.coordinates;
+                               const label = feature.properties && feature.properties.text ? feature.properties.text : '';
+                               layer.addLabel([lat, lon], label);
+                           }});
+                       }} else {{
+                           // Líneas y polígonos - manejar coordenadas correctamente
+                           layer = L.layerGroup();
+                           feats.forEach(feature => {{
+                               if (feature.geometry.type === 'LineString') {{
+                                   const coords = feature.geometry.coordinates.map(coord => [coord[1], coord[0]]);
+                                   const line = L.polyline(coords, {{ color: '#ff0000', weight: 2, opacity: 0.8 }});
+                                   layer.addLayer(line);
+                               }} else if (feature.geometry.type === 'Polygon') {{
+                                   const coords = feature.geometry.coordinates[0].map(coord => [coord[1], coord[0]]);
+                                   const polygon = L.polygon(coords, {{ color: '#ff0000', weight: 2, opacity: 0.8, fillOpacity: 0.1 }});
+                                   layer.addLayer(polygon);
+                               }} else {{
+                                   // Otros tipos usando geoJSON estándar
+                                   const geoJsonLayer = L.geoJSON(feature, {{ style: {{ color: '#ff0000', weight: 2, opacity: 0.8 }} }});
+                                   layer.addLayer(geoJsonLayer);
+                               }}
+                           }});
+                       }}
             
-            overlayMaps[type.charAt(0).toUpperCase() + type.slice(1)] = layer;
-            layer.addTo(map);
-        }});
+                overlayMaps[type.charAt(0).toUpperCase() + type.slice(1)] = layer;
+                layer.addTo(map);
+            }});
 
-        // Control de capas
-        L.control.layers(baseMaps, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
+            // Control de capas
+            L.control.layers(baseMaps, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
 
-        // Ajuste de extensión
-        const bounds = {bounds_str};
-        if (bounds && bounds.length === 2) {{ 
-            map.fitBounds(bounds); 
-        }} else {{
-            try {{
-                let allBounds = [];
-                Object.values(overlayMaps).forEach(l => {{
-                    if (l.getBounds) allBounds.push(l.getBounds());
-                }});
-                if (allBounds.length) {{
-                    let merged = allBounds[0];
-                    for (let i = 1; i < allBounds.length; i++) {{
-                        merged.extend(allBounds[i]);
+            // Ajuste de extensión
+            const bounds = {bounds_str};
+            if (bounds && bounds.length === 2) {{ 
+                map.fitBounds(bounds); 
+            }} else {{
+                try {{
+                    let allBounds = [];
+                    Object.values(overlayMaps).forEach(l => {{
+                        if (l.getBounds) allBounds.push(l.getBounds());
+                    }});
+                    if (allBounds.length) {{
+                        let merged = allBounds[0];
+                        for (let i = 1; i < allBounds.length; i++) {{
+                            merged.extend(allBounds[i]);
+                        }}
+                        map.fitBounds(merged);
+                    }} else {{
+                        map.setView([0,0], 2);
                     }}
-                    map.fitBounds(merged);
-                }} else {{
-                    map.setView([0,0], 2);
-                }}
-            }} catch (e) {{ map.setView([0,0], 2); }}
-        }}
+                }} catch (e) {{ map.setView([0,0], 2); }}
+            }}
+        }}).catch(e => {{ console.error(e); map.setView([0,0], 2); }});
     </script>
 </body>
 </html>"""
     
     return html_template
 
-def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_name="Proyecto", grouping_mode="layer", point_color="#ff0000", line_color="#0000ff"):
-    """Genera HTML con visor Mapbox usando el template avanzado"""
-    try:
-        gj_obj = json.loads(json.dumps(geojson_data))
-        geojson_str = json.dumps(gj_obj, indent=2, ensure_ascii=False)
-    except Exception:
-        geojson_str = json.dumps(geojson_data, indent=2, ensure_ascii=False)
+def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_name="Proyecto", grouping_mode="layer", point_color="#ff0000", line_color="#0000ff", compact=True, precision=DEFAULT_COORD_PRECISION, drop_z=False, report=None, payload="json", simplify=True):
+    """
+    Genera HTML con visor Mapbox usando el template avanzado.
+
+    Con simplify=True las líneas y polígonos se incrustan al nivel de detalle más
+    fino de build_viewer_lods; Mapbox GL ya generaliza por zoom internamente.
+    """
+    if compact:
+        viewer_data = geojson_data
+        if simplify:
+            viewer_data, lod_stats = build_viewer_lods(geojson_data, precision=precision)
+            viewer_data.pop("lods", None)
+            if report is not None:
+                report.update(lod_stats)
+        geojson_str = compact_geojson_str(viewer_data, precision=precision, drop_z=drop_z, report=report, baseline_indent=2)
+        if report is not None and viewer_data is not geojson_data:
+            report["original_bytes"] = _serialized_bytes(geojson_data, 2)
+    else:
+        try:
+            gj_obj = json.loads(json.dumps(geojson_data))
+            geojson_str = json.dumps(gj_obj, indent=2, ensure_ascii=False)
+        except Exception:
+            geojson_str = json.dumps(geojson_data, indent=2, ensure_ascii=False)
+    data_script = viewer_data_script(geojson_str, payload, report)
     
     bounds = compute_bounds_from_geojson(geojson_data)
     if bounds:
@@ -345,6 +656,7 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
     #api-modal-content button:hover {{ background-color: #0056b3; }}
     #api-error {{ color: #ff6b6b; font-size: 12px; margin-top: 10px; display: none; }}
   </style>
+  {VIEWER_STYLE_PLACEHOLDER}
 </head>
 <body>
   <div id="map"></div>
@@ -382,7 +694,8 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
   <div id="developer-footer">Desarrollador: Patricio Sarmiento Reinoso</div>
   <script>
     const mapboxTokenFromPython = "{get_mapbox_token() or ''}";
-    const rawGeoJSON = {geojson_str};
+    {data_script}
+    let rawGeoJSON = {{ type: 'FeatureCollection', features: [] }};
     
     // Función defensiva para corregir coordenadas (Ecuador focus)
     function fixCoord(c) {{
@@ -404,11 +717,6 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
         return g;
     }}
 
-    // Aplicar corrección a todo el GeoJSON
-    if (rawGeoJSON.features) {{
-        rawGeoJSON.features.forEach(f => {{ f.geometry = fixGeom(f.geometry); }});
-    }}
-
     let mapboxAccessToken = mapboxTokenFromPython || localStorage.getItem('mapboxAccessToken');
     const apiModal = document.getElementById('api-modal');
     const apiKeyInput = document.getElementById('api-key-input');
@@ -419,6 +727,16 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
     let layersList = [];
     let layerColors = {{}};
 
+    // Los datos se decodifican en paralelo con la carga del estilo del mapa
+    const dataReady = loadViewerData().then(data => {{
+        rawGeoJSON = data;
+        // Aplicar corrección a todo el GeoJSON
+        if (rawGeoJSON.features) {{
+            rawGeoJSON.features.forEach(f => {{ f.geometry = fixGeom(f.geometry); }});
+        }}
+        currentGeoJSON = rawGeoJSON;
+    }});
+
     function initializeMap() {{
       try {{
         mapboxgl.accessToken = mapboxAccessToken;
@@ -436,7 +754,11 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
         map.addControl(new mapboxgl.FullscreenControl());
         map.on('load', function() {{
           applyElevationFactor();
-          loadDataToMap();
+          dataReady.then(loadDataToMap).catch(e => {{
+            const err = document.getElementById('error');
+            err.textContent = 'No se pudieron cargar los datos: ' + e.message;
+            err.style.display = 'block';
+          }});
         }});
 
         function applyElevationFactor() {{
@@ -480,14 +802,15 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
           
           // Crear entrada para cada capa (geometría + textos por separado)
           // Usar colores iniciales pasados desde Python
-          const initialLineColor = '{line_color}';
-          const initialPointColor = '{point_color}';
+          const viewerStyle = window.VIEWER_STYLE || {{}};
+          const initialLineColor = viewerStyle.lineColor || '{line_color}';
+          const initialPointColor = viewerStyle.pointColor || '{point_color}';
           
           layersList.forEach(l => {{
               // Determinar si la capa tiene líneas o puntos para asignar el color apropiado
               const hasLines = layers[l].some(f => {{
                   const t = f.properties && f.properties.type;
-                  return ['line', 'polyline', 'polygon', 'shape', 'track', 'LineString'].includes(t);
+                  return ['line', 'polyline', 'polygon', 'shape', 'track', 'contour', 'LineString'].includes(t);
               }});
               const defaultColor = hasLines ? initialLineColor : initialPointColor;
               layerColors[l] = layerColors[l] || defaultColor;
@@ -545,7 +868,7 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
                   id: `${{l}}-lns`, 
                   type: 'line', 
                   source: 'src', 
-                  filter: ['all', layerFilter, ['in', ['get','type'], ['literal', ['line','polyline','polygon','shape','track','LineString']]]], 
+                  filter: ['all', layerFilter, ['in', ['get','type'], ['literal', ['line','polyline','polygon','shape','track','contour','LineString']]]], 
                   paint: {{ 'line-color': col, 'line-width': 2 }} 
               }});
               
@@ -590,21 +913,43 @@ def create_mapbox_html(geojson_data, title="Visor GeoJSON Profesional", folder_n
 </html>'''
     return mapbox_html
 
-def create_leaflet_grouped_html(geojson_data, title="Visor GeoJSON Profesional", grouping_mode="type", point_color="#ff0000", line_color="#0000ff", line_width=2):
-    """Genera HTML con Leaflet y control de capas agrupadas por 'type' o 'layer'."""
-    try:
-        gj_obj = json.loads(json.dumps(geojson_data))
-        if isinstance(gj_obj, dict) and gj_obj.get("type") == "FeatureCollection":
-            for f in gj_obj.get("features", []):
-                if not isinstance(f, dict): continue
-                props = f.setdefault("properties", {})
-                if "type" in props and isinstance(props["type"], str):
-                    props["type"] = props["type"].lower()
-                if "layer" not in props:
-                    props["layer"] = "default"
-        geojson_str = json.dumps(gj_obj, ensure_ascii=False)
-    except Exception:
-        geojson_str = json.dumps(geojson_data, ensure_ascii=False)
+def create_leaflet_grouped_html(geojson_data, title="Visor GeoJSON Profesional", grouping_mode="type", point_color="#ff0000", line_color="#0000ff", line_width=2, compact=True, precision=DEFAULT_COORD_PRECISION, drop_z=False, report=None, payload="json", tiled="auto", simplify=True):
+    """
+    Genera HTML con Leaflet y control de capas agrupadas por 'type' o 'layer'.
+
+    Con tiled="auto" las colecciones de más de TILED_VIEWER_MIN_FEATURES features
+    se sirven con create_leaflet_tiled_html (tiled=True lo fuerza, False lo evita).
+    Con simplify=True se incrustan los niveles de detalle de build_viewer_lods y el
+    visor cambia la geometría de líneas y polígonos según el zoom.
+    """
+    feature_count = len(geojson_data.get("features", [])) if isinstance(geojson_data, dict) else 0
+    if tiled is True or (tiled == "auto" and feature_count > TILED_VIEWER_MIN_FEATURES):
+        return create_leaflet_tiled_html(geojson_data, title=title, grouping_mode=grouping_mode, point_color=point_color, line_color=line_color, line_width=line_width, report=report, payload=payload)
+    if compact:
+        viewer_data = geojson_data
+        if simplify:
+            viewer_data, lod_stats = build_viewer_lods(geojson_data, precision=precision)
+            if report is not None:
+                report.update(lod_stats)
+        geojson_str = compact_geojson_str(viewer_data, precision=precision, drop_z=drop_z, normalize_properties=True, report=report)
+        if report is not None and viewer_data is not geojson_data:
+            report["original_bytes"] = _serialized_bytes(geojson_data)
+    else:
+        try:
+            gj_obj = json.loads(json.dumps(geojson_data))
+            if isinstance(gj_obj, dict) and gj_obj.get("type") == "FeatureCollection":
+                for f in gj_obj.get("features", []):
+                    if not isinstance(f, dict): continue
+                    props = f.setdefault("properties", {})
+                    if "type" in props and isinstance(props["type"], str):
+                        props["type"] = props["type"].lower()
+                    if "layer" not in props:
+                        props["layer"] = "default"
+            geojson_str = json.dumps(gj_obj, ensure_ascii=False)
+        except Exception:
+            geojson_str = json.dumps(geojson_data, ensure_ascii=False)
+    data_script = viewer_data_script(geojson_str, payload, report)
+    layers_script = viewer_layers_script()
 
     group_key_js = "(f.properties && f.properties.layer) ? String(f.properties.layer) : 'SinGrupo'" if str(grouping_mode).lower() == "layer" else "(f.properties && f.properties.type) ? String(f.properties.type) : 'SinGrupo'"
 
@@ -621,6 +966,7 @@ def create_leaflet_grouped_html(geojson_data, title="Visor GeoJSON Profesional",
     #map {{ height: 100vh; width: 100%; }} 
     .leaflet-control-layers-expanded {{ max-height: 65vh; overflow-y: auto; background: rgba(255,255,255,0.9) !important; padding: 10px; border-radius: 8px; }} 
   </style>
+  {VIEWER_STYLE_PLACEHOLDER}
 </head>
 <body>
   <div id="map"></div>
@@ -633,12 +979,14 @@ def create_leaflet_grouped_html(geojson_data, title="Visor GeoJSON Profesional",
     const baseLayers = {{ "Calles": calles, "Satelital": satelite, "Positron": positron }};
     satelite.addTo(map);
 
-    const data = {geojson_str};
+    {data_script}
+    {layers_script}
     
-    // Configuración de Estilos Dinámicos
-    const pointColor = '{point_color}';
-    const lineColor = '{line_color}';
-    const lineWidth = {line_width};
+    // Configuración de Estilos Dinámicos (window.VIEWER_STYLE los reemplaza sin regenerar el visor)
+    const viewerStyle = Object.assign({{ pointColor: '{point_color}', lineColor: '{line_color}', lineWidth: {line_width} }}, window.VIEWER_STYLE || {{}});
+    const pointColor = viewerStyle.pointColor;
+    const lineColor = viewerStyle.lineColor;
+    const lineWidth = viewerStyle.lineWidth;
 
     // Función defensiva para corregir coordenadas
     function fixCoord(c) {{
@@ -650,61 +998,339 @@ def create_leaflet_grouped_html(geojson_data, title="Visor GeoJSON Profesional",
         return [lat, lon];
     }}
 
-    const grouped = {{}};
-    if (data && data.features) {{
-      data.features.forEach(f => {{
-        const key = {group_key_js};
-        if (!grouped[key]) grouped[key] = L.featureGroup();
+    // Los datos se decodifican después de dibujar el mapa base
+    loadViewerData().then(data => {{
+        const grouped = {{}};
+        // Puntos y textos de cada grupo en una sola capa de vista
+        const pointLayers = {{}};
+        const labelLayers = {{}};
+        const pointsOf = key => pointLayers[key] || (pointLayers[key] = new PointCloudLayer({{ radius: 4, color: pointColor, weight: 1, fillOpacity: 0.8, fillColor: pointColor }}).addTo(grouped[key]));
+        const labelsOf = key => labelLayers[key] || (labelLayers[key] = new LabelLayer(label => `<div style='font-size:11px;color:${{pointColor}};font-weight:700;background:rgba(255,255,255,0.8);border:1px solid ${{pointColor}};padding:1px 3px;border-radius:2px;white-space:nowrap;'>${{label}}</div>`).addTo(grouped[key]));
+        // Capas de líneas/polígonos con niveles de detalle: [índice del feature, capa, es polígono]
+        const lodLayers = [];
+        if (data && data.features) {{
+          data.features.forEach((f, i) => {{
+            const key = {group_key_js};
+            if (!grouped[key]) grouped[key] = L.featureGroup();
         
-        const type = (f.properties && f.properties.type) ? f.properties.type.toLowerCase() : '';
-        const coords = f.geometry.coordinates;
-
-        if (type === 'text') {{
-            const ll = fixCoord(coords);
-            if (ll) {{
-                const label = (f.properties && f.properties.text) ? String(f.properties.text) : '';
-                L.marker(ll, {{ icon: L.divIcon({{ className: '', html: `<div style='font-size:11px;color:${{pointColor}};font-weight:700;background:rgba(255,255,255,0.8);border:1px solid ${{pointColor}};padding:1px 3px;border-radius:2px;white-space:nowrap;'>${{label}}</div>` }}) }}).addTo(grouped[key]);
-            }}
-        }} else if (f.geometry.type === 'Point') {{
-            const ll = fixCoord(coords);
-            if (ll) {{
-                L.circleMarker(ll, {{ radius: 4, color: pointColor, weight: 1, fillOpacity: 0.8, fillColor: pointColor }}).addTo(grouped[key]);
+            const type = (f.properties && f.properties.type) ? f.properties.type.toLowerCase() : '';
+            const coords = f.geometry.coordinates;
+
+            if (type === 'text') {{
+                const ll = fixCoord(coords);
+                if (ll) {{
+                    const label = (f.properties && f.properties.text) ? String(f.properties.text) : '';
+                    labelsOf(key).addLabel(ll, label);
+                }}
+            }} else if (f.geometry.type === 'Point') {{
+                const ll = fixCoord(coords);
+                if (ll) {{
+                    pointsOf(key).addPoint(ll);
+                }}
+            }} else if (f.geometry.type === 'LineString') {{
+                const path = coords.map(c => fixCoord(c)).filter(c => c !== null);
+                if (path.length > 1) {{
+                    const line = L.polyline(path, {{ color: lineColor, weight: lineWidth, opacity: 0.9 }}).addTo(grouped[key]);
+                    lodLayers.push([i, line, false]);
+                }}
+            }} else if (f.geometry.type === 'Polygon') {{
+                const rings = coords.map(ring => ring.map(c => fixCoord(c)).filter(c => c !== null));
+                const polygon = L.polygon(rings, {{ color: lineColor, weight: lineWidth, fillOpacity: 0.3, fillColor: lineColor }}).addTo(grouped[key]);
+                lodLayers.push([i, polygon, true]);
             }}
-        }} else if (f.geometry.type === 'LineString') {{
-            const path = coords.map(c => fixCoord(c)).filter(c => c !== null);
-            if (path.length > 1) {{
-                L.polyline(path, {{ color: lineColor, weight: lineWidth, opacity: 0.9 }}).addTo(grouped[key]);
+          }});
+        }}
+
+        const overlayMaps = {{}};
+        Object.keys(grouped).forEach(k => {{
+            overlayMaps[k] = grouped[k];
+            grouped[k].addTo(map);
+        }});
+
+        L.control.layers(baseLayers, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
+
+        const totalGroup = L.featureGroup(Object.values(grouped));
+        try {{
+            const bounds = totalGroup.getBounds();
+            if (bounds.isValid()) {{
+                map.fitBounds(bounds, {{ padding: [30, 30] }});
+            }} else {{
+                map.setView([0,0], 2);
             }}
-        }} else if (f.geometry.type === 'Polygon') {{
-            const rings = coords.map(ring => ring.map(c => fixCoord(c)).filter(c => c !== null));
-            L.polygon(rings, {{ color: lineColor, weight: lineWidth, fillOpacity: 0.3, fillColor: lineColor }}).addTo(grouped[key]);
+        }} catch(e) {{ map.setView([0,0], 2); }}
+
+        // Niveles de detalle: por debajo de cada zoom de 'lods' se dibuja la versión simplificada
+        const lods = data.lods || null;
+        let currentLevel = null;
+        function applyLod() {{
+            if (!lods) return;
+            const z = map.getZoom();
+            const level = lods.zooms.findIndex(lz => z <= lz);
+            if (level === currentLevel) return;
+            currentLevel = level;
+            lodLayers.forEach(([i, layer, isPolygon]) => {{
+                const coords = (level >= 0 && lods.levels[level][i]) || data.features[i].geometry.coordinates;
+                const toPath = line => line.map(c => fixCoord(c)).filter(c => c !== null);
+                layer.setLatLngs(isPolygon ? coords.map(toPath) : toPath(coords));
+            }});
         }}
-      }});
+        map.on('zoomend', applyLod);
+        applyLod();
+    }}).catch(e => {{ console.error(e); map.setView([0,0], 2); }});
+  </script>
+</body>
+</html>"""
+    return html
+
+def create_leaflet_tiled_html(geojson_data, title="Visor GeoJSON Profesional", grouping_mode="type", point_color="#ff0000", line_color="#0000ff", line_width=2, report=None, payload="json", min_zoom=None, max_zoom=None):
+    """
+    Visor Leaflet para colecciones grandes: los datos se incrustan ya cortados en
+    teselas JSON (ver build_geojson_tiles) y solo se dibujan las teselas visibles
+    en el zoom actual; por encima del zoom máximo se reutilizan sus teselas.
+    """
+    tiles_str, stats = build_geojson_tiles(geojson_data, min_zoom=min_zoom, max_zoom=max_zoom, grouping_mode=str(grouping_mode).lower())
+    if report is not None:
+        report.update({"features": stats["features"], "tiles": stats["tiles"], "compact_bytes": len(tiles_str.encode("utf-8"))})
+    data_script = viewer_data_script(tiles_str, payload, report)
+    group_field = "layer" if str(grouping_mode).lower() == "layer" else "type"
+
+    html = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+  <title>{title}</title>
+  <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
+  <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+  <style> 
+    html, body {{ height: 100%; margin: 0; background: #f8f9fa; }} 
+    #map {{ height: 100vh; width: 100%; }} 
+    .leaflet-control-layers-expanded {{ max-height: 65vh; overflow-y: auto; background: rgba(255,255,255,0.9) !important; padding: 10px; border-radius: 8px; }} 
+  </style>
+  {VIEWER_STYLE_PLACEHOLDER}
+</head>
+<body>
+  <div id="map"></div>
+  <script>
+    const map = L.map('map', {{ preferCanvas: true }});
+    const calles = L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{ attribution: '&copy; OpenStreetMap' }});
+    const satelite = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{{z}}/{{y}}/{{x}}', {{ attribution: '&copy; Esri' }});
+    const positron = L.tileLayer('https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}{{r}}.png', {{ attribution: '&copy; CartoDB' }});
+    
+    const baseLayers = {{ "Calles": calles, "Satelital": satelite, "Positron": positron }};
+    satelite.addTo(map);
+
+    {data_script}
+    
+    // Configuración de Estilos Dinámicos (window.VIEWER_STYLE los reemplaza sin regenerar el visor)
+    const viewerStyle = Object.assign({{ pointColor: '{point_color}', lineColor: '{line_color}', lineWidth: {line_width} }}, window.VIEWER_STYLE || {{}});
+    const pointColor = viewerStyle.pointColor;
+    const lineColor = viewerStyle.lineColor;
+    const lineWidth = viewerStyle.lineWidth;
+    const renderer = L.canvas({{ padding: 0.5 }});
+
+    function lonToTile(lon, z) {{ return Math.floor((lon + 180) / 360 * Math.pow(2, z)); }}
+    function latToTile(lat, z) {{
+        const r = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+        return Math.floor((1 - Math.log(Math.tan(r) + 1 / Math.cos(r)) / Math.PI) / 2 * Math.pow(2, z));
     }}
 
-    const overlayMaps = {{}};
-    Object.keys(grouped).forEach(k => {{
-        overlayMaps[k] = grouped[k];
-        grouped[k].addTo(map);
-    }});
+    // Los datos se decodifican después de dibujar el mapa base
+    loadViewerData().then(tileset => {{
+        const props = tileset.properties;
+        const groupOf = p => (p && p.{group_field} !== undefined && p.{group_field} !== null) ? String(p.{group_field}) : 'SinGrupo';
+        const grouped = {{}};
+        props.forEach(p => {{
+            const key = groupOf(p);
+            if (!grouped[key]) grouped[key] = L.layerGroup().addTo(map);
+        }});
+        L.control.layers(baseLayers, grouped, {{ position: 'topright', collapsed: false }}).addTo(map);
 
-    L.control.layers(baseLayers, overlayMaps, {{ position: 'topright', collapsed: false }}).addTo(map);
+        function toLayer(feature, latlng) {{
+            if (feature.properties.type === 'text') {{
+                const label = feature.properties.text ? String(feature.properties.text) : '';
+                return L.marker(latlng, {{ icon: L.divIcon({{ className: '', html: `<div style='font-size:11px;color:${{pointColor}};font-weight:700;background:rgba(255,255,255,0.8);border:1px solid ${{pointColor}};padding:1px 3px;border-radius:2px;white-space:nowrap;'>${{label}}</div>` }}) }});
+            }}
+            return L.circleMarker(latlng, {{ renderer: renderer, radius: 4, color: pointColor, weight: 1, fillOpacity: 0.8, fillColor: pointColor }});
+        }}
+        function styleOf(feature) {{
+            const polygon = feature.geometry.type.indexOf('Polygon') >= 0;
+            return {{ color: lineColor, weight: lineWidth, opacity: 0.9, fillOpacity: polygon ? 0.3 : 0, fillColor: lineColor }};
+        }}
 
-    const totalGroup = L.featureGroup(Object.values(grouped));
-    try {{
-        const bounds = totalGroup.getBounds();
-        if (bounds.isValid()) {{
-            map.fitBounds(bounds, {{ padding: [30, 30] }});
+        // Teselas dibujadas: clave z/x/y -> capas agregadas por grupo
+        const rendered = {{}};
+        function renderTile(key) {{
+            const byGroup = {{}};
+            tileset.tiles[key].forEach(item => {{
+                const p = props[item[0]];
+                const g = groupOf(p);
+                (byGroup[g] = byGroup[g] || []).push({{ type: 'Feature', geometry: item[1], properties: p }});
+            }});
+            return Object.keys(byGroup).map(g => {{
+                const layer = L.geoJSON(byGroup[g], {{ renderer: renderer, style: styleOf, pointToLayer: toLayer }});
+                grouped[g].addLayer(layer);
+                return [g, layer];
+            }});
+        }}
+        function updateTiles() {{
+            const z = Math.max(tileset.min_zoom, Math.min(tileset.max_zoom, Math.round(map.getZoom())));
+            const range = tileset.ranges[z];
+            const visible = new Set();
+            if (range) {{
+                const b = map.getBounds();
+                const x0 = Math.max(range[0], lonToTile(b.getWest(), z)), x1 = Math.min(range[1], lonToTile(b.getEast(), z));
+                const y0 = Math.max(range[2], latToTile(b.getNorth(), z)), y1 = Math.min(range[3], latToTile(b.getSouth(), z));
+                for (let x = x0; x <= x1; x++) {{
+                    for (let y = y0; y <= y1; y++) {{
+                        const key = `${{z}}/${{x}}/${{y}}`;
+                        if (tileset.tiles[key]) visible.add(key);
+                    }}
+                }}
+            }}
+            Object.keys(rendered).forEach(key => {{
+                if (!visible.has(key)) {{
+                    rendered[key].forEach(([g, layer]) => grouped[g].removeLayer(layer));
+                    delete rendered[key];
+                }}
+            }});
+            visible.forEach(key => {{ if (!rendered[key]) rendered[key] = renderTile(key); }});
+        }}
+
+        map.on('moveend', updateTiles);
+        if (tileset.bounds) {{
+            map.fitBounds(tileset.bounds, {{ padding: [30, 30] }});
         }} else {{
             map.setView([0,0], 2);
         }}
-    }} catch(e) {{ map.setView([0,0], 2); }}
+        updateTiles();
+    }}).catch(e => {{ console.error(e); map.setView([0,0], 2); }});
   </script>
 </body>
 </html>"""
     return html
 
-def render_map(geojson_data, group_by: str = "type"):
+VIEWER_BENCHMARK_COUNTS = [1000, 10000, 50000, 100000]
+# Por encima de esta cantidad el método de un marcador por feature bloquea el navegador y se omite
+BENCHMARK_MAX_LEGACY_FEATURES = 50000
+
+def create_viewer_benchmark_html(feature_counts=None, center=(-2.0, -79.0), span=0.05, legacy_max=BENCHMARK_MAX_LEGACY_FEATURES):
+    """
+    Página que mide en el navegador el tiempo de dibujo de N puntos y N textos
+    sintéticos con un marcador por feature (visores anteriores) y con las capas
+    de vista de viewer_layers_script, y muestra una tabla por cantidad de features.
+    """
+    counts = json.dumps([int(c) for c in (feature_counts or VIEWER_BENCHMARK_COUNTS)])
+    layers_script = viewer_layers_script()
+    html = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+  <title>Rendimiento del visor</title>
+  <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
+  <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+  <style>
+    body {{ font-family: sans-serif; margin: 16px; }}
+    #map {{ height: 420px; width: 100%; margin-bottom: 12px; }}
+    table {{ border-collapse: collapse; }}
+    th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+  </style>
+</head>
+<body>
+  <div id="map"></div>
+  <div id="status">Midiendo...</div>
+  <table id="results"><tr><th>Features</th><th>Puntos: marcadores (ms)</th><th>Puntos: capa de vista (ms)</th><th>Textos: marcadores (ms)</th><th>Textos: capa de vista (ms)</th></tr></table>
+  <script>
+    const map = L.map('map', {{ preferCanvas: true }}).setView([{center[0]}, {center[1]}], 14);
+    {layers_script}
+    const counts = {counts};
+    const legacyMax = {int(legacy_max)};
+    const span = {float(span)};
+
+    // Generador reproducible para que las corridas sean comparables
+    let seed = 1;
+    function random() {{ seed = (seed * 16807) % 2147483647; return seed / 2147483647; }}
+    function randomLatLngs(n) {{
+        const out = new Array(n);
+        for (let i = 0; i < n; i++) out[i] = [{center[0]} + (random() - 0.5) * span, {center[1]} + (random() - 0.5) * span];
+        return out;
+    }}
+    const labelHtml = label => `<div style='font-size:11px;font-weight:700;background:rgba(255,255,255,0.8);padding:1px 3px;white-space:nowrap;'>${{label}}</div>`;
+    const nextFrame = () => new Promise(resolve => requestAnimationFrame(() => setTimeout(resolve, 0)));
+
+    // Tiempo desde crear la capa hasta el siguiente cuadro pintado
+    async function measure(build) {{
+        await nextFrame();
+        const start = performance.now();
+        const layer = build().addTo(map);
+        await nextFrame();
+        const elapsed = performance.now() - start;
+        map.removeLayer(layer);
+        return elapsed;
+    }}
+
+    async function run() {{
+        const rows = [];
+        for (const n of counts) {{
+            document.getElementById('status').textContent = `Midiendo ${{n}} features...`;
+            const latlngs = randomLatLngs(n);
+            const style = {{ radius: 4, color: '#ff0000', weight: 1, fillOpacity: 0.8, fillColor: '#ff0000' }};
+            const row = {{ features: n }};
+            row.puntos_marcadores = n <= legacyMax ? await measure(() => L.layerGroup(latlngs.map(ll => L.circleMarker(ll, style)))) : null;
+            row.puntos_vista = await measure(() => {{ const l = new PointCloudLayer(style); latlngs.forEach(ll => l.addPoint(ll)); return l; }});
+            row.textos_marcadores = n <= legacyMax ? await measure(() => L.layerGroup(latlngs.map((ll, i) => L.marker(ll, {{ icon: L.divIcon({{ className: '', html: labelHtml(i) }}) }})))) : null;
+            row.textos_vista = await measure(() => {{ const l = new LabelLayer(labelHtml); latlngs.forEach((ll, i) => l.addLabel(ll, i)); return l; }});
+            rows.push(row);
+            const tr = document.createElement('tr');
+            tr.innerHTML = [row.features, row.puntos_marcadores, row.puntos_vista, row.textos_marcadores, row.textos_vista]
+                .map((v, i) => `<td>${{v === null ? 'omitido' : (i === 0 ? v : v.toFixed(1))}}</td>`).join('');
+            document.getElementById('results').appendChild(tr);
+        }}
+        document.getElementById('status').textContent = 'Listo';
+        console.table(rows);
+    }}
+    run();
+  </script>
+</body>
+</html>"""
+    return html
+
+# Crea el icono de cada texto desde sus propiedades (una sola función JS por grupo)
+_FOLIUM_TEXT_ICON_JS = """function(feature, layer) {
+    const label = feature.properties.text;
+    layer.setIcon(label ? L.divIcon({className: '', html: `<div style='font-size:12px;color:#0d6efd;font-weight:600;'>${label}</div>`}) : new L.Icon.Default());
+}"""
+
+def _point_collection(features, with_text=False):
+    """
+    FeatureCollection mínimo para las capas de puntos de folium. Sin textos los
+    puntos van en un único MultiPoint (Leaflet llama a pointToLayer por cada
+    vértice), así cada punto ocupa solo su par lon/lat en el HTML.
+    """
+    out = []
+    for feat in features:
+        coords = (feat.get("geometry") or {}).get("coordinates")
+        if not (coords and isinstance(coords, (list, tuple)) and len(coords) >= 2):
+            continue
+        coords = _round_coords(coords[:2], DEFAULT_COORD_PRECISION)
+        if with_text:
+            props = {"text": str((feat.get("properties") or {}).get("text", ""))}
+            out.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": coords}, "properties": props})
+        else:
+            out.append(coords)
+    if not with_text:
+        out = [{"type": "Feature", "geometry": {"type": "MultiPoint", "coordinates": out}, "properties": {}}] if out else []
+    return {"type": "FeatureCollection", "features": out}
+
+def build_folium_map(geojson_data, group_by: str = "type"):
+    """
+    Arma el mapa folium agrupado por 'type' o 'layer'.
+
+    Cada grupo agrega a lo sumo tres capas folium.GeoJson (geometrías, puntos y
+    textos); los puntos y textos se dibujan con pointToLayer en el navegador, así
+    que el tiempo de armado y el tamaño del HTML no dependen de un objeto por feature.
+    """
     m = folium.Map(location=[-2.0, -79.0], zoom_start=10, tiles=None, prefer_canvas=True)
     folium.TileLayer("OpenStreetMap", name="Calles").add_to(m)
     folium.TileLayer("CartoDB Positron", name="Positron").add_to(m)
@@ -722,7 +1348,6 @@ def render_map(geojson_data, group_by: str = "type"):
         else:
             group["non_text"].append(feature)
 
-    groups = {}
     for key, parts in grouped.items():
         fg = folium.FeatureGroup(name=str(key), show=True)
         fg.add_to(m)
@@ -735,48 +1360,36 @@ def render_map(geojson_data, group_by: str = "type"):
                 elif key == "route":
                     style_function = lambda x: {"color": "#1f78b4", "weight": 3, "opacity": 0.8, "dashArray": "5, 10"}
                 
-                gj = folium.GeoJson(fc, name=f"{key}_geom", style_function=style_function)
-                gj.add_to(fg)
-                groups[key] = gj
+                folium.GeoJson(fc, name=f"{key}_geom", style_function=style_function).add_to(fg)
             except Exception:
                 pass
-        for feat in parts["points"]:
+        if parts["points"]:
             try:
-                coords = feat.get("geometry", {}).get("coordinates", None)
-                if coords and isinstance(coords, (list, tuple)) and len(coords) >= 2:
-                    lon, lat = coords[0], coords[1]
-                    folium.CircleMarker(location=[lat, lon], radius=3, color="#2c7fb8", fill=True, fill_opacity=0.9).add_to(fg)
-            except Exception:
-                continue
-        for feat in parts["texts"]:
+                folium.GeoJson(
+                    _point_collection(parts["points"]),
+                    name=f"{key}_puntos",
+                    marker=folium.CircleMarker(radius=3, color="#2c7fb8", fill=True, fill_opacity=0.9)
+                ).add_to(fg)
+            except Exception as e:
+                logger.error(f"No se pudieron agregar los puntos del grupo {key}: {e}")
+        if parts["texts"]:
             try:
-                coords = feat.get("geometry", {}).get("coordinates", None)
-                props = feat.get("properties", {})
-                if coords and isinstance(coords, (list, tuple)) and len(coords) >= 2:
-                    lon, lat = coords[0], coords[1]
-                    label = str(props.get("text", ""))
-                    if label:
-                        folium.Marker(
-                            location=[lat, lon],
-                            icon=folium.DivIcon(html=f"<div style='font-size:12px;color:#0d6efd;font-weight:600;'>{label}</div>")
-                        ).add_to(fg)
-                    else:
-                        folium.Marker(location=[lat, lon]).add_to(fg)
-            except Exception:
-                continue
+                folium.GeoJson(
+                    _point_collection(parts["texts"], with_text=True),
+                    name=f"{key}_textos",
+                    marker=folium.Marker(icon=folium.DivIcon(html="")),
+                    on_each_feature=JsCode(_FOLIUM_TEXT_ICON_JS)
+                ).add_to(fg)
+            except Exception as e:
+                logger.error(f"No se pudieron agregar los textos del grupo {key}: {e}")
 
-    try:
-        all_bounds = []
-        for gj in groups.values():
-            try:
-                b = gj.get_bounds()
-                if b: all_bounds.extend(b)
-            except Exception:
-                pass
-        if all_bounds:
-            m.fit_bounds(all_bounds)
-    except Exception:
-        pass
+    bounds = compute_bounds_from_geojson(geojson_data)
+    if bounds:
+        m.fit_bounds(bounds)
 
     folium.LayerControl(position="topright").add_to(m)
+    return m
+
+def render_map(geojson_data, group_by: str = "type"):
+    m = build_folium_map(geojson_data, group_by)
     st_folium(m, width=None, height=650)
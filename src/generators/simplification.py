@@ -0,0 +1,83 @@
+import json
+import math
+import numpy as np
+import shapely
+
+from src.generators.vector_tiles import tile_zoom_range, TILE_SIZE
+
+# Zoom de la geometría base del visor: a 1 px de tolerancia en z18 (~0.6 m) el trazo es indistinguible del original
+FINEST_LOD_ZOOM = 18
+# Niveles intermedios a partir del zoom que muestra todos los datos
+LOD_ZOOM_STEP = 2
+LOD_COUNT = 3
+
+def lod_tolerances(geoms, zoom):
+    """
+    Tolerancia por feature equivalente a un píxel en Web Mercator al zoom dado.
+    Un píxel mide lo mismo en longitud a cualquier latitud pero menos en latitud,
+    así que la tolerancia (isótropa, en grados) se escala por el coseno de la
+    latitud del centro de cada geometría.
+    """
+    bounds = shapely.bounds(geoms)
+    lat = np.radians(np.clip((bounds[:, 1] + bounds[:, 3]) / 2.0, -85.0, 85.0))
+    return 360.0 / (TILE_SIZE * 2 ** zoom) * np.cos(lat)
+
+def _geometry_json(geoms, decimals):
+    coords = shapely.get_coordinates(geoms)
+    rounded = shapely.set_coordinates(geoms.copy(), np.round(coords, decimals))
+    return shapely.to_geojson(rounded)
+
+def build_viewer_lods(geojson_data, precision=7, lod_zooms=None):
+    """
+    Prepara un FeatureCollection (lon/lat) para los visores con niveles de detalle.
+
+    Las líneas y polígonos se simplifican con shapely.simplify (Douglas-Peucker
+    vectorizado, preservando topología) con tolerancia por feature. La colección
+    devuelta lleva la geometría al nivel más fino (FINEST_LOD_ZOOM) y una clave
+    'lods' con {"zooms": [...], "levels": [{índice: coordenadas}, ...]} para los
+    zooms menores; un feature solo aparece en un nivel si ahí pierde vértices.
+    El GeoJSON de entrada no se modifica: shapefile y DXF siguen usando el original.
+
+    Retorna (colección para el visor, estadísticas de vértices).
+    """
+    features = geojson_data.get("features", []) if isinstance(geojson_data, dict) else []
+    line_idx = [i for i, f in enumerate(features)
+                if isinstance(f, dict) and isinstance(f.get("geometry"), dict)
+                and f["geometry"].get("type") in ("LineString", "MultiLineString", "Polygon", "MultiPolygon")]
+    stats = {"vertices_before": 0, "vertices_after": 0, "lod_zooms": []}
+    if not line_idx:
+        return geojson_data, stats
+
+    geoms = shapely.from_geojson([json.dumps(features[i]["geometry"]) for i in line_idx], on_invalid="ignore")
+    valid = ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)
+    line_idx = [i for i, v in zip(line_idx, valid) if v]
+    geoms = geoms[valid]
+    if not line_idx:
+        return geojson_data, stats
+    geoms = shapely.force_2d(geoms)
+    before = shapely.get_num_coordinates(geoms)
+
+    if lod_zooms is None:
+        bounds = shapely.bounds(geoms)
+        base_zoom, _ = tile_zoom_range((bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()))
+        lod_zooms = [z for z in range(base_zoom, FINEST_LOD_ZOOM, LOD_ZOOM_STEP)][:LOD_COUNT]
+
+    finest = shapely.simplify(geoms, lod_tolerances(geoms, FINEST_LOD_ZOOM), preserve_topology=True)
+    finest_count = shapely.get_num_coordinates(finest)
+    finest_json = json.loads("[" + ",".join(_geometry_json(finest, precision).tolist()) + "]")
+
+    levels = []
+    for zoom in lod_zooms:
+        simplified = shapely.simplify(finest, lod_tolerances(finest, zoom), preserve_topology=True)
+        reduced = np.flatnonzero(shapely.get_num_coordinates(simplified) < finest_count)
+        decimals = int(min(precision, max(1, math.ceil(-math.log10(360.0 / (TILE_SIZE * 2 ** zoom))) + 1)))
+        level_json = json.loads("[" + ",".join(_geometry_json(simplified[reduced], decimals).tolist()) + "]") if len(reduced) else []
+        levels.append({str(line_idx[k]): g["coordinates"] for k, g in zip(reduced.tolist(), level_json)})
+
+    replaced = dict(zip(line_idx, finest_json))
+    viewer_features = [dict(f, geometry=replaced[i]) if i in replaced else f for i, f in enumerate(features)]
+    collection = {k: v for k, v in geojson_data.items() if k != "features"}
+    collection["features"] = viewer_features
+    collection["lods"] = {"zooms": list(lod_zooms), "levels": levels}
+    stats.update({"vertices_before": int(before.sum()), "vertices_after": int(finest_count.sum()), "lod_zooms": list(lod_zooms)})
+    return collection, stats
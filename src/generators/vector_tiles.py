@@ -0,0 +1,151 @@
+import json
+import math
+import numpy as np
+import shapely
+
+TILE_SIZE = 256
+MAX_TILE_ZOOM = 18
+# Niveles de zoom por encima del que cubre todos los datos con una sola tesela
+TILE_ZOOM_LEVELS = 4
+# Bajo el zoom máximo se conserva un punto por celda de POINT_THIN_PIXELS píxeles y grupo
+POINT_THIN_PIXELS = 2
+# Los textos solo se incluyen en los últimos niveles (a menor zoom son ilegibles)
+LABEL_ZOOM_LEVELS = 2
+MAX_LATITUDE = 85.0511287798
+
+def _lon_to_tile(lon, n):
+    return np.clip(np.floor((np.asarray(lon) + 180.0) / 360.0 * n), 0, n - 1).astype(np.int64)
+
+def _lat_to_tile(lat, n):
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n
+    return np.clip(np.floor(y), 0, n - 1).astype(np.int64)
+
+def _tile_bounds(tx, ty, n):
+    """Límites (oeste, sur, este, norte) en grados de las teselas (arreglos tx, ty)."""
+    west = tx / n * 360.0 - 180.0
+    east = (tx + 1) / n * 360.0 - 180.0
+    north = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * ty / n))))
+    south = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (ty + 1) / n))))
+    return west, south, east, north
+
+def _round_geometries(geoms, decimals):
+    coords = shapely.get_coordinates(geoms)
+    return shapely.set_coordinates(geoms.copy(), np.round(coords, decimals))
+
+def _normalize_properties(props):
+    props = dict(props or {})
+    if isinstance(props.get("type"), str):
+        props["type"] = props["type"].lower()
+    props.setdefault("layer", "default")
+    return props
+
+def tile_zoom_range(bounds, levels=TILE_ZOOM_LEVELS):
+    """Zoom mínimo (todos los datos en ~una tesela) y máximo de teselado para unos límites lon/lat."""
+    west, south, east, north = bounds
+    span = max(east - west, (north - south) * 1.5, 1e-9)
+    min_zoom = int(np.clip(math.floor(math.log2(360.0 / span)), 0, MAX_TILE_ZOOM))
+    return min_zoom, min(MAX_TILE_ZOOM, min_zoom + levels)
+
+def build_geojson_tiles(geojson_data, min_zoom=None, max_zoom=None, grouping_mode="type"):
+    """
+    Corta un FeatureCollection (lon/lat) en teselas JSON al estilo geojson-vt.
+
+    Por cada zoom las líneas y polígonos se simplifican a un píxel (salvo en el
+    zoom máximo, que conserva la geometría completa), los puntos se reducen a uno
+    por celda de POINT_THIN_PIXELS píxeles y grupo, y las geometrías que cruzan varias teselas se recortan con
+    shapely.intersection sobre todos los pares (feature, tesela) de una vez. Las
+    propiedades se guardan una sola vez y las teselas solo referencian su índice.
+
+    Retorna (texto JSON del teselado, estadísticas).
+    """
+    features = [f for f in geojson_data.get("features", []) if isinstance(f, dict) and f.get("geometry")]
+    geoms = shapely.from_geojson([json.dumps(f["geometry"]) for f in features], on_invalid="ignore") if features else np.empty(0, dtype=object)
+    keep = ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms) if len(geoms) else np.zeros(0, dtype=bool)
+    features = [f for f, k in zip(features, keep) if k]
+    geoms = geoms[keep]
+    props = [_normalize_properties(f.get("properties")) for f in features]
+    if not features:
+        return json.dumps({"min_zoom": 0, "max_zoom": 0, "bounds": None, "ranges": {}, "properties": [], "tiles": {}}), {"features": 0, "tiles": 0}
+
+    bounds = shapely.bounds(geoms)
+    data_bounds = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max())
+    auto_min, auto_max = tile_zoom_range(data_bounds)
+    min_zoom = auto_min if min_zoom is None else min_zoom
+    max_zoom = max(min_zoom, auto_max if max_zoom is None else max_zoom)
+
+    type_ids = shapely.get_type_id(geoms)
+    is_point = np.isin(type_ids, (0, 4))
+    is_text = np.array([p.get("type") == "text" for p in props])
+    group_of = {}
+    group_ids = np.array([group_of.setdefault(str(p.get("layer" if grouping_mode == "layer" else "type", "")), len(group_of)) for p in props])
+
+    tiles = {}
+    ranges = {}
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2 ** z
+        pixel = 360.0 / (TILE_SIZE * n)
+        decimals = int(min(9, max(1, math.ceil(-math.log10(pixel)) + 1)))
+        at_max = z == max_zoom
+        active = ~is_text if z < max_zoom - LABEL_ZOOM_LEVELS + 1 else np.ones(len(geoms), dtype=bool)
+
+        if not at_max:
+            # Un punto por celda y grupo; las geometrías menores que un píxel se omiten
+            cell = pixel * POINT_THIN_PIXELS
+            px = np.floor((bounds[:, 0] + 180.0) / cell).astype(np.int64)
+            py = np.floor((bounds[:, 1] + 90.0) / cell).astype(np.int64)
+            point_idx = np.flatnonzero(is_point & active)
+            if len(point_idx):
+                _, first = np.unique(np.column_stack((group_ids[point_idx], px[point_idx], py[point_idx])), axis=0, return_index=True)
+                thinned = np.zeros(len(geoms), dtype=bool)
+                thinned[point_idx[first]] = True
+                active &= ~is_point | thinned
+            tiny = ~is_point & (bounds[:, 2] - bounds[:, 0] < pixel) & (bounds[:, 3] - bounds[:, 1] < pixel)
+            active &= ~tiny
+
+        idx = np.flatnonzero(active)
+        level = geoms[idx]
+        if not at_max:
+            lines = ~is_point[idx]
+            level = level.copy()
+            level[lines] = shapely.simplify(level[lines], pixel, preserve_topology=True)
+
+        x0 = _lon_to_tile(bounds[idx, 0], n)
+        x1 = _lon_to_tile(bounds[idx, 2], n)
+        y0 = _lat_to_tile(bounds[idx, 3], n)
+        y1 = _lat_to_tile(bounds[idx, 1], n)
+        ranges[z] = [int(x0.min()), int(x1.max()), int(y0.min()), int(y1.max())] if len(idx) else None
+
+        # Pares (feature, tesela): una fila por cada tesela que toca el rectángulo de la geometría
+        widths = x1 - x0 + 1
+        counts = widths * (y1 - y0 + 1)
+        pair = np.repeat(np.arange(len(idx)), counts)
+        offset = np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+        tx = x0[pair] + offset % widths[pair]
+        ty = y0[pair] + offset // widths[pair]
+        pair_geoms = level[pair]
+        multi = counts[pair] > 1
+        if multi.any():
+            # Recorte con un margen de 4 píxeles para que los trazos no se corten en el borde
+            west, south, east, north = _tile_bounds(tx[multi], ty[multi], n)
+            margin = 4 * pixel
+            pair_geoms[multi] = shapely.intersection(pair_geoms[multi], shapely.box(west - margin, south - margin, east + margin, north + margin))
+        valid = ~shapely.is_empty(pair_geoms)
+        texts = shapely.to_geojson(_round_geometries(pair_geoms[valid], decimals))
+        for fid, x, y, geom_json in zip(idx[pair[valid]].tolist(), tx[valid].tolist(), ty[valid].tolist(), texts.tolist()):
+            tiles.setdefault(f"{z}/{x}/{y}", []).append(f"[{fid},{geom_json}]")
+
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    parts = [
+        '{"min_zoom":%d,"max_zoom":%d,"bounds":%s,"ranges":%s,"properties":%s,"tiles":{' % (
+            min_zoom, max_zoom,
+            encoder.encode([[data_bounds[1], data_bounds[0]], [data_bounds[3], data_bounds[2]]]),
+            encoder.encode({str(z): r for z, r in ranges.items()}),
+            encoder.encode(props),
+        ),
+        ",".join(f'"{key}":[{",".join(items)}]' for key, items in tiles.items()),
+        "}}",
+    ]
+    text = "".join(parts).replace("</", "<\\/")
+    stats = {"features": len(features), "tiles": len(tiles), "min_zoom": min_zoom, "max_zoom": max_zoom}
+    return text, stats
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from src.generators.map_generators import create_mapbox_html, create_leaflet_grouped_html, apply_viewer_style
+
+logger = logging.getLogger(__name__)
+
+# Caché de visores a nivel de proceso: la comparten todas las sesiones de Streamlit
+VIEWER_CACHE_SIZE = 8
+VIEWER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_VIEWER_CACHE = OrderedDict()
+_VIEWER_CACHE_LOCK = threading.Lock()
+
+def geojson_hash(geojson_data):
+    """Hash del contenido del GeoJSON (dos colecciones iguales dan el mismo hash aunque sean objetos distintos)."""
+    text = json.dumps(geojson_data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def session_geojson_hash(geojson_data, state_key):
+    """
+    geojson_hash calculado una sola vez por objeto: se guarda junto al GeoJSON en
+    st.session_state[state_key] y se reutiliza en cada rerun mientras la sesión
+    tenga el mismo objeto (las pestañas lo reasignan sin copiarlo).
+    """
+    cached = st.session_state.get(state_key)
+    if cached is None or cached[0] is not geojson_data:
+        cached = (geojson_data, geojson_hash(geojson_data))
+        st.session_state[state_key] = cached
+    return cached[1]
+
+def get_viewer_html(geojson_data, map_type="normal", point_color="#ff0000", line_color="#0000ff", line_width=2, data_key=None, **options):
+    """
+    HTML del visor Mapbox o Leaflet agrupado, reutilizando el caché de proceso.
+
+    La clave es (hash del GeoJSON, tipo de mapa, opciones: title, folder_name,
+    grouping_mode, payload...). Colores y ancho de línea no forman parte de la
+    clave: se aplican sobre el HTML cacheado con apply_viewer_style, así que un
+    cambio de estilo no vuelve a serializar los datos. data_key reemplaza al hash
+    del contenido cuando el llamador ya lo tiene (session_geojson_hash), para no
+    serializar el GeoJSON completo en cada rerun.
+    """
+    key = (data_key or geojson_hash(geojson_data), map_type, tuple(sorted((k, str(v)) for k, v in options.items())))
+    with _VIEWER_CACHE_LOCK:
+        html = _VIEWER_CACHE.get(key)
+        if html is not None:
+            _VIEWER_CACHE.move_to_end(key)
+    if html is None:
+        if map_type == "mapbox":
+            html = create_mapbox_html(geojson_data, point_color=point_color, line_color=line_color, drop_z=True, **options)
+        else:
+            html = create_leaflet_grouped_html(geojson_data, point_color=point_color, line_color=line_color, line_width=line_width, **options)
+        with _VIEWER_CACHE_LOCK:
+            _VIEWER_CACHE[key] = html
+            total = sum(len(h) for h in _VIEWER_CACHE.values())
+            while len(_VIEWER_CACHE) > 1 and (len(_VIEWER_CACHE) > VIEWER_CACHE_SIZE or total > VIEWER_CACHE_MAX_BYTES):
+                _, evicted = _VIEWER_CACHE.popitem(last=False)
+                total -= len(evicted)
+        logger.info(f"Visor {map_type} generado y cacheado ({len(html) / 1e6:.2f} MB)")
+    return apply_viewer_style(html, point_color, line_color, line_width)
+
+def clear_viewer_cache():
+    with _VIEWER_CACHE_LOCK:
+        _VIEWER_CACHE.clear()
@@ -120,14 +120,36 @@ def render_sidebar():
                 key="map_type_radio"
             )
             
-            # Detectar cambio y limpiar cache
-            if st.session_state.get("previous_map_type") != map_type_selection:
-                st.session_state["previous_map_type"] = map_type_selection
-                if "project_html" in st.session_state:
-                    del st.session_state["project_html"]
-            
             st.session_state["html_map_type"] = map_type_selection
             
+            payload_selection = st.radio(
+                "Datos del visor:",
+                options=["json", "gzip"],
+                format_func=lambda x: "GeoJSON" if x == "json" else "Comprimido (gzip)",
+                index=(1 if st.session_state.get("html_payload") == "gzip" else 0),
+                horizontal=True,
+                key="html_payload_radio",
+                help="Comprimido: el HTML pesa 5-10 veces menos y el navegador descomprime los datos al abrirlo."
+            )
+            st.session_state["html_payload"] = payload_selection
+            
+            st.session_state["html_data_mode"] = st.radio(
+                "Datos en paquetes:",
+                options=["inline", "external"],
+                format_func=lambda x: "En el HTML" if x == "inline" else "Archivo aparte (.data.js)",
+                index=(1 if st.session_state.get("html_data_mode") == "external" else 0),
+                horizontal=True,
+                key="html_data_mode_radio",
+                help="Archivo aparte: el HTML del paquete no lleva datos y los carga de un .data.js junto a él, siempre comprimido (ocupa una fracción del GeoJSON). En el HTML: un solo archivo para compartir."
+            )
+            
+            st.session_state["gpkg_enabled"] = st.checkbox(
+                "Incluir GeoPackage (.gpkg)",
+                value=st.session_state.get("gpkg_enabled", False),
+                key="gpkg_enabled_checkbox",
+                help="Agrega a las salidas un único .gpkg con una tabla por capa y tipo de geometría e índice espacial R-tree (QGIS/ArcGIS lo abren directamente)."
+            )
+            
             st.session_state["map_point_size"] = st.slider(
                 "Tamaño de Puntos:",
                 min_value=1,
@@ -7,9 +7,23 @@ import json
 import shutil
 from pathlib import Path
 from src.core.converters.dxf_converter import convert_dxf
-from src.generators.map_generators import create_mapbox_html, create_leaflet_grouped_html, create_normal_html
+from src.generators.map_generators import externalize_viewer_data, write_viewer_files
+from src.generators.viewer_cache import get_viewer_html, session_geojson_hash
+from src.utils.package_writer import open_package, add_package_bytes
 from src.core.geometry.coordinate_utils import compute_bounds_from_geojson, strip_z_from_geojson
 
+def _viewer_html(geojson_data, base_name):
+    """Visor del paquete DXF desde el caché de visores (no se regenera en cada rerun)."""
+    map_type = st.session_state.get("html_map_type", "normal")
+    options = {
+        "title": f"Mapa - {base_name}",
+        "grouping_mode": st.session_state.get("group_by", "type"),
+        "payload": st.session_state.get("html_payload", "json"),
+    }
+    if map_type == "mapbox":
+        options["folder_name"] = base_name
+    return get_viewer_html(geojson_data, map_type=map_type, data_key=session_geojson_hash(geojson_data, "dxf_geojson_hash"), **options)
+
 def render_dxf_tab():
     IS_CLOUD = os.path.exists("/mount")
     
@@ -119,7 +133,8 @@ def render_dxf_tab():
                                 dxf_path,
                                 int(st.session_state.get("input_epsg", 32717)),
                                 int(st.session_state.get("output_epsg", 4326)),
-                                shapes_group_by=st.session_state.get("group_by", "type")
+                                shapes_group_by=st.session_state.get("group_by", "type"),
+                                gpkg=st.session_state.get("gpkg_enabled", False)
                             )
                             st.session_state["outputs"] = outputs
                             
@@ -128,11 +143,6 @@ def render_dxf_tab():
                                 st.session_state["project_geojson"] = outputs["geojson"]
                                 st.session_state["project_title"] = f"{st.session_state.get('base_name', 'Proyecto')} - DXF"
                                 st.session_state["project_folder_name"] = st.session_state.get("output_folder") or st.session_state.get("base_name") or "Proyecto"
-                                # Limpiar HTML previo para regenerar con el tipo de mapa actual
-                                if "project_html" in st.session_state:
-                                    del st.session_state["project_html"]
-                                if "project_html_map_type" in st.session_state:
-                                    del st.session_state["project_html_map_type"]
                             
                             st.success("Conversión exitosa")
                         except Exception as e:
@@ -155,39 +165,32 @@ def render_dxf_tab():
             
             # Crear ZIP
             zip_buf = io.BytesIO()
-            with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf, _ = open_package(zip_buf)
+            with zf:
                 if outputs.get("kmz_bytes"): 
-                    zf.writestr(f"{base_name}/{base_name}.kmz", outputs["kmz_bytes"])
+                    add_package_bytes(zf, f"{base_name}/{base_name}.kmz", outputs["kmz_bytes"])
                 if outputs.get("geojson_bytes"): 
-                    zf.writestr(f"{base_name}/{base_name}.geojson", outputs["geojson_bytes"].decode('utf-8'))
+                    add_package_bytes(zf, f"{base_name}/{base_name}.geojson", outputs["geojson_bytes"])
+                if outputs.get("gpkg_bytes"):
+                    add_package_bytes(zf, f"{base_name}/{base_name}.gpkg", outputs["gpkg_bytes"])
                 
                 if outputs.get("shp_zip_bytes"):
                     import io as io_module
                     shp_zip_buf = io_module.BytesIO(outputs["shp_zip_bytes"])
                     with zipfile.ZipFile(shp_zip_buf, "r") as shp_zf:
                         for item in shp_zf.namelist():
-                            zf.writestr(f"{base_name}/shapes/{item}", shp_zf.read(item))
+                            add_package_bytes(zf, f"{base_name}/shapes/{item}", shp_zf.read(item))
                 
                 geojson_data = outputs.get("geojson")
                 if geojson_data:
                     try:
-                        map_type = st.session_state.get("html_map_type", "normal")
+                        html_content = _viewer_html(geojson_data, base_name)
                         
-                        if map_type == "mapbox":
-                            html_content = create_mapbox_html(
-                                geojson_data, 
-                                title=f"Mapa - {base_name}", 
-                                folder_name=base_name,
-                                grouping_mode=st.session_state.get("group_by", "type")
-                            )
-                        else:
-                            html_content = create_leaflet_grouped_html(
-                                geojson_data, 
-                                title=f"Mapa - {base_name}",
-                                grouping_mode=st.session_state.get("group_by", "type")
-                            )
-                        
-                        zf.writestr(f"{base_name}/Visualizador_Mapa.html", html_content)
+                        if st.session_state.get("html_data_mode", "inline") == "external":
+                            html_content, data_js = externalize_viewer_data(html_content, "Visualizador_Mapa.data.js")
+                            if data_js is not None:
+                                add_package_bytes(zf, f"{base_name}/Visualizador_Mapa.data.js", data_js)
+                        add_package_bytes(zf, f"{base_name}/Visualizador_Mapa.html", html_content)
                     except Exception as map_err:
                         st.warning(f"Error generando HTML: {map_err}")
             
@@ -221,6 +224,10 @@ def render_dxf_tab():
                         (full_output_path / f"{base_name}.geojson").write_text(outputs["geojson_bytes"].decode('utf-8'))
                         files_saved.append(f"{base_name}.geojson")
                     
+                    if outputs.get("gpkg_bytes"):
+                        (full_output_path / f"{base_name}.gpkg").write_bytes(outputs["gpkg_bytes"])
+                        files_saved.append(f"{base_name}.gpkg")
+                    
                     if outputs.get("shp_zip_bytes"):
                         import io as io_module
                         shp_zip_buf = io_module.BytesIO(outputs["shp_zip_bytes"])
@@ -230,13 +237,9 @@ def render_dxf_tab():
                         files_saved.append(f"shapes/ (varios archivos)")
                     
                     if outputs.get("geojson"):
-                        map_type = st.session_state.get("html_map_type", "normal")
-                        if map_type == "mapbox":
-                            html_content = create_mapbox_html(outputs["geojson"], title=f"Mapa - {base_name}", folder_name=base_name, grouping_mode=st.session_state.get("group_by", "type"))
-                        else:
-                            html_content = create_leaflet_grouped_html(outputs["geojson"], title=f"Mapa - {base_name}", grouping_mode=st.session_state.get("group_by", "type"))
-                        (full_output_path / "Visualizador_Mapa.html").write_text(html_content, encoding='utf-8')
-                        files_saved.append("Visualizador_Mapa.html")
+                        html_content = _viewer_html(outputs["geojson"], base_name)
+                        written = write_viewer_files(full_output_path / "Visualizador_Mapa.html", html_content, st.session_state.get("html_data_mode", "inline"))
+                        files_saved.extend(p.name for p in written)
                     
                     st.success(f"Guardado en: {full_output_path}")
                     with st.expander("Ver archivos"):
@@ -9,7 +9,7 @@ import shapefile
 from pathlib import Path
 from src.core.converters.kml_converter import parse_kml_via_xml
 from src.core.geometry.coordinate_utils import strip_z_from_geojson, transform_geojson, compute_bounds_from_geojson
-from src.generators.map_generators import create_mapbox_html, create_leaflet_grouped_html
+from src.utils.package_writer import open_local_package
 
 def render_kml_tab():
     # Layout de 3 columnas: 35% - 35% - 30%
@@ -60,11 +60,6 @@ def render_kml_tab():
                     st.session_state["project_geojson"] = geojson
                     st.session_state["project_title"] = f"{suggested} - KML/KMZ"
                     st.session_state["project_folder_name"] = suggested
-                    # Limpiar cache de mapa
-                    if "project_html" in st.session_state:
-                        del st.session_state["project_html"]
-                    if "project_html_map_type" in st.session_state:
-                        del st.session_state["project_html_map_type"]
                 except Exception as e:
                     st.error(f"Error procesando KML/KMZ: {e}")
     
@@ -90,9 +85,6 @@ def render_kml_tab():
             st.session_state["project_point_color"] = p_color
             st.session_state["project_line_color"] = l_color
             st.session_state["project_line_width"] = l_width
-            # Limpiar cache para forzar regeneración
-            if "project_html" in st.session_state:
-                del st.session_state["project_html"]
     
     # ==========================================
     # COLUMNA 3: CONFIGURACIÓN Y RESULTADOS (30%)
@@ -123,37 +115,52 @@ def render_kml_tab():
                 
                 # Generación de paquete ZIP
                 from src.core.converters.universal_exporter import export_geojson_to_all_formats
+                from src.generators.viewer_cache import session_geojson_hash
                 
                 # Obtener tipo de mapa seleccionado en el sidebar
                 map_type = st.session_state.get("html_map_type", "normal")
                 
-                zip_bytes = export_geojson_to_all_formats(
-                    geojson, 
-                    folder_name,
-                    point_color=p_color,
-                    line_color=l_color,
-                    line_width=l_width,
-                    map_type=map_type
-                )
-
-                # Guardado Local
-                try:
-                    save_path = Path(output_dir) / f"{folder_name}.zip"
-                    Path(output_dir).mkdir(parents=True, exist_ok=True)
-                    with open(save_path, "wb") as f:
-                        f.write(zip_bytes)
-                    st.success(f"Guardado en: {save_path}")
-                except Exception as save_err:
+                # El ZIP se escribe directo en la carpeta de salida; si no se puede, en un temporal
+                save_path = Path(output_dir) / f"{folder_name}.zip"
+                package_file, save_err = open_local_package(save_path)
+                if save_err is not None:
                     st.warning(f"No se pudo guardar localmente: {save_err}")
                 
-                # Botón de descarga
-                st.download_button(
-                    label="Descargar ZIP",
-                    data=zip_bytes,
-                    file_name=f"{folder_name}.zip",
-                    mime="application/zip",
-                    use_container_width=True
-                )
+                with package_file:
+                    export_report = {}
+                    package = export_geojson_to_all_formats(
+                        geojson, 
+                        folder_name,
+                        point_color=p_color,
+                        line_color=l_color,
+                        line_width=l_width,
+                        output_epsg=st.session_state.get("output_epsg", 4326),
+                        map_type=map_type,
+                        html_payload=st.session_state.get("html_payload", "json"),
+                        html_data_mode=st.session_state.get("html_data_mode", "inline"),
+                        data_key=session_geojson_hash(geojson, "kml_geojson_hash"),
+                        report=export_report,
+                        target=package_file,
+                        gpkg=st.session_state.get("gpkg_enabled", False)
+                    )
+                    for stage, info in export_report.get("stages", {}).items():
+                        if info["error"]:
+                            st.warning(f"{stage.upper()} no se generó: {info['error']}")
+                    timings = ", ".join(f"{stage.upper()} {info['seconds']:.1f}s" for stage, info in export_report.get("stages", {}).items() if info["seconds"] is not None)
+                    st.caption(f"Paquete generado en {export_report.get('total_seconds', 0):.1f}s ({timings})")
+
+                    if save_err is None:
+                        st.success(f"Guardado en: {save_path}")
+                
+                    # Botón de descarga: el ZIP guardado se lee del disco recién al hacer clic (entero, una vez por descarga)
+                    st.download_button(
+                        label="Descargar ZIP",
+                        data=save_path.read_bytes if save_err is None else package.read(),
+                        file_name=f"{folder_name}.zip",
+                        mime="application/zip",
+                        on_click="ignore",
+                        use_container_width=True
+                    )
                 
             except Exception as e:
                 st.error(f"Error: {type(e).__name__}: {e}")
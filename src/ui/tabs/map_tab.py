@@ -1,7 +1,7 @@
 import streamlit as st
 import json
-from src.core.geometry.coordinate_utils import strip_z_from_geojson
 import src.generators.map_generators as mg
+from src.generators.viewer_cache import get_viewer_html, session_geojson_hash
 
 def render_map_tab():
     if st.session_state.get("topo_index_html"):
@@ -19,38 +19,34 @@ def render_map_tab():
         line_color = st.session_state.get("project_line_color", "#0000ff")
         line_width = st.session_state.get("project_line_width", 2)
         
-        # Verificar si necesitamos regenerar el HTML
-        last_map_type = st.session_state.get("project_html_map_type")
-        if st.session_state.get("project_html") and last_map_type == html_map_type:
-            # Usar HTML cacheado
-            html_now = st.session_state["project_html"]
-        else:
-            # Regenerar HTML con el tipo de mapa y colores actuales
-            b = mg.compute_bounds_from_geojson(pj_geo) or [[-2, -79], [-2, -79]]
-            
-            if html_map_type == "mapbox":
-                html_now = mg.create_mapbox_html(
-                    strip_z_from_geojson(pj_geo), 
-                    title=st.session_state.get("project_title","Mapa del proyecto"), 
-                    folder_name=st.session_state.get("project_folder_name","Proyecto"), 
-                    grouping_mode=st.session_state.get("group_by","type"),
-                    point_color=point_color,
-                    line_color=line_color
-                )
-            else:
-                html_now = mg.create_leaflet_grouped_html(
-                    pj_geo, 
-                    title=st.session_state.get("project_title","Mapa del proyecto"),
-                    grouping_mode=st.session_state.get("group_by","type"),
-                    point_color=point_color,
-                    line_color=line_color,
-                    line_width=line_width
-                )
-            
-            # Guardar HTML y tipo de mapa usado
-            st.session_state["project_html"] = html_now
-            st.session_state["project_html_map_type"] = html_map_type
+        # El visor se cachea por contenido del GeoJSON (hash calculado una vez por objeto); un cambio de colores solo reemplaza el estilo
+        options = {
+            "title": st.session_state.get("project_title", "Mapa del proyecto"),
+            "grouping_mode": st.session_state.get("group_by", "type"),
+            "payload": st.session_state.get("html_payload", "json"),
+        }
+        if html_map_type == "mapbox":
+            options["folder_name"] = st.session_state.get("project_folder_name", "Proyecto")
+        html_now = get_viewer_html(
+            pj_geo,
+            map_type=html_map_type,
+            point_color=point_color,
+            line_color=line_color,
+            line_width=line_width,
+            data_key=session_geojson_hash(pj_geo, "project_geojson_hash"),
+            **options
+        )
         
         st.components.v1.html(html_now, height=750)
     elif not st.session_state.get("topo_index_html"):
         st.info("Genera salidas en alguna pestaña para ver aquí el mapa del proyecto.")
+
+    with st.expander("Rendimiento del visor"):
+        st.caption("Página que mide en el navegador el tiempo de dibujo de puntos y textos según la cantidad de features.")
+        st.download_button(
+            "Descargar benchmark del visor",
+            data=mg.create_viewer_benchmark_html(),
+            file_name="benchmark_visor.html",
+            mime="text/html",
+            key="viewer_benchmark_download"
+        )
@@ -1,12 +1,25 @@
 import streamlit as st
 import pandas as pd
 import io
-import os
-import zipfile
 from pathlib import Path
 from src.core.converters.topo_processor import process_topo_data
+from src.utils.package_writer import open_package, add_package_directory
 from src.core.geometry.coordinate_utils import strip_z_from_geojson
-from src.core.converters.heatmap_converter import create_sample_heatmap_data
+from src.core.converters.terrain_derivatives import TERRAIN_PRODUCTS
+from src.core.converters.heatmap_converter import create_sample_heatmap_data, COG_OVERVIEW_RESAMPLING, BIN_STATISTICS, HEATMAP_DTYPES
+
+def _parse_topo_paste(text):
+    """Convierte el texto pegado (No. X Y Cota Desc) en el DataFrame de puntos."""
+    df = pd.read_csv(io.StringIO(text), sep=r'\t|,|;', engine='python', header=None)
+    if df.shape[1] < 5:
+        while df.shape[1] < 5: 
+            if df.shape[1] == 3: df[df.shape[1]] = 0 
+            else: df[df.shape[1]] = ""
+    df.columns = ["No.", "x", "y", "cota", "desc"]
+    df["cota"] = pd.to_numeric(df["cota"].astype(str).str.replace(',', '.'), errors="coerce").fillna(0)
+    df["x"] = pd.to_numeric(df["x"], errors="coerce")
+    df["y"] = pd.to_numeric(df["y"], errors="coerce")
+    return df.dropna(subset=["x", "y"])
 
 def render_topo_tab():
     # ==========================================
@@ -14,9 +27,11 @@ def render_topo_tab():
     # ==========================================
     if st.session_state.get("clear_topo_requested", False):
         st.session_state["topo_df"] = None
+        st.session_state["topo_df_final"] = None
         # Limpiar el valor del text_area en session_state
-        if "topo_paste_area" in st.session_state:
-            del st.session_state["topo_paste_area"]
+        for key in ("topo_paste_area", "topo_paste_area_final"):
+            if key in st.session_state:
+                del st.session_state[key]
         st.session_state["clear_topo_requested"] = False
         st.rerun()
     
@@ -53,16 +68,7 @@ def render_topo_tab():
             if st.button("Insertar datos", key="btn_topo_insert", use_container_width=True):
                 if topo_paste:
                     try:
-                        df = pd.read_csv(io.StringIO(topo_paste), sep=r'\t|,|;', engine='python', header=None)
-                        if df.shape[1] < 5:
-                            while df.shape[1] < 5: 
-                                if df.shape[1] == 3: df[df.shape[1]] = 0 
-                                else: df[df.shape[1]] = ""
-                        df.columns = ["No.", "x", "y", "cota", "desc"]
-                        df["cota"] = pd.to_numeric(df["cota"].astype(str).str.replace(',', '.'), errors="coerce").fillna(0)
-                        df["x"] = pd.to_numeric(df["x"], errors="coerce")
-                        df["y"] = pd.to_numeric(df["y"], errors="coerce")
-                        st.session_state["topo_df"] = df.dropna(subset=["x", "y"])
+                        st.session_state["topo_df"] = _parse_topo_paste(topo_paste)
                         st.success("Datos insertados")
                     except Exception as e:
                         st.error(f"Error: {e}")
@@ -77,6 +83,24 @@ def render_topo_tab():
             st.session_state["clear_topo_requested"] = True
         
         st.button("Limpiar datos", key="btn_topo_clear", use_container_width=True, on_click=clear_data)
+        
+        # Segunda superficie para corte/relleno
+        with st.expander("SUPERFICIE FINAL (VOLÚMENES)", expanded=False):
+            topo_paste_final = st.text_area(
+                "Pegar levantamiento final (No. X Y Cota Desc)",
+                height=150,
+                key="topo_paste_area_final",
+                help="Se compara contra los datos de arriba (superficie inicial): corte, relleno, neto y GeoTIFF de diferencia."
+            )
+            if st.button("Insertar superficie final", key="btn_topo_insert_final", use_container_width=True):
+                if topo_paste_final:
+                    try:
+                        st.session_state["topo_df_final"] = _parse_topo_paste(topo_paste_final)
+                        st.success(f"Superficie final: {len(st.session_state['topo_df_final'])} puntos")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+            if st.session_state.get("topo_df_final") is not None:
+                st.slider("Resolución de la grilla de volúmenes", 100, 2000, 1000, 100, key="topo_volume_resolution")
     
     # ==========================================
     # COLUMNA 2: CONFIGURACIÓN (35%)
@@ -121,10 +145,50 @@ def render_topo_tab():
         # Mapa de calor
         st.markdown("---")
         generate_heatmap = st.checkbox("Generar mapa de calor (GeoTIFF)", value=False, key="topo_heatmap_enabled")
-        if generate_heatmap:
+        generate_contours = st.checkbox("Generar curvas de nivel", value=False, key="topo_contours_enabled", help="Se extraen de la misma grilla interpolada del mapa de calor.")
+        if generate_heatmap or generate_contours:
             st.session_state["topo_heatmap_margin"] = st.slider("Margen (%)", 5, 50, 15, key="topo_heatmap_margin_slider")
             st.session_state["topo_heatmap_resolution"] = st.slider("Resolución", 200, 1000, 500, key="topo_heatmap_res_slider")
-            st.session_state["topo_heatmap_method"] = st.selectbox("Método", ["linear", "cubic", "nearest"], index=1, key="topo_heatmap_method_select")
+            st.session_state["topo_heatmap_method"] = st.selectbox("Método", ["linear", "cubic", "nearest", "auto"], index=1, key="topo_heatmap_method_select", help="'auto' elige el método con menor RMSE por validación cruzada.")
+            if st.session_state["topo_heatmap_method"] == "auto":
+                st.slider("Tiempo máximo de validación (s)", 2, 60, 10, key="topo_heatmap_auto_budget")
+            st.selectbox("Estadístico por celda", BIN_STATISTICS, index=0, key="topo_heatmap_bin_statistic", help="Los puntos se agrupan por celda de la grilla antes de interpolar.")
+            direct_binning = st.checkbox("Usar celdas directamente con alta densidad", value=False, key="topo_heatmap_direct_binning")
+            if direct_binning:
+                st.slider("Densidad mínima de celdas ocupadas", 0.5, 1.0, 0.8, 0.05, key="topo_heatmap_direct_density")
+            hull_mask = st.checkbox("Recortar al contorno de los puntos", value=False, key="topo_heatmap_hull_mask", help="Las celdas fuera del hull cóncavo del levantamiento se escriben como nodata.")
+            if hull_mask:
+                st.slider("Concavidad del hull (1 = convexo)", 0.05, 1.0, 0.3, 0.05, key="topo_heatmap_hull_ratio")
+        if generate_heatmap:
+            heatmap_dtype = st.selectbox("Tipo de dato", HEATMAP_DTYPES, index=0, key="topo_heatmap_dtype", help="uint16/int16 guardan la cota cuantizada con scale/offset: la mitad del tamaño o menos que float32.")
+            if heatmap_dtype != "float32":
+                st.number_input("Precisión (m)", 0.001, 1.0, 0.01, 0.001, format="%.3f", key="topo_heatmap_precision")
+            st.multiselect(
+                "Derivados del terreno",
+                list(TERRAIN_PRODUCTS.keys()),
+                default=[],
+                format_func=lambda p: {"slope": "Pendiente", "aspect": "Orientación", "hillshade": "Sombreado"}[p],
+                key="topo_terrain_products",
+                help="Se calculan sobre la grilla del mapa de calor y se guardan como GeoTIFF hermanos."
+            )
+            if st.checkbox("Reporte de debug", value=False, key="topo_heatmap_debug", help="Incluye estadísticas, tiempos por etapa y el volcado de puntos."):
+                st.checkbox("Puntos en CSV aparte", value=True, key="topo_heatmap_debug_csv")
+            cog_enabled = st.checkbox("Cloud-Optimized GeoTIFF (COG)", value=False, key="topo_heatmap_cog", help="Agrega overviews internas para que QGIS y visores web lean solo el nivel de zoom necesario.")
+            if cog_enabled:
+                st.selectbox("Remuestreo de overviews", COG_OVERVIEW_RESAMPLING, index=0, key="topo_heatmap_overview_resampling")
+        if generate_contours:
+            col_cv1, col_cv2 = st.columns(2)
+            with col_cv1:
+                st.number_input("Intervalo (m)", 0.01, 500.0, 1.0, 0.25, key="topo_contour_interval")
+            with col_cv2:
+                st.number_input("Índice cada", 0, 50, 5, 1, key="topo_contour_index_every", help="Cada cuántas curvas se marca una curva índice (0 = ninguna).")
+
+        # TIN
+        if st.checkbox("Generar TIN (Delaunay)", value=False, key="topo_tin_enabled", help="Triangulación de todos los puntos: 3DFACE en el DXF, LandXML y GeoJSON de triángulos."):
+            if st.session_state.get("topo_modo") == "Puntos y polilíneas":
+                st.checkbox("Densificar polilíneas como líneas de quiebre (aproximadas)", value=True, key="topo_tin_breaklines", help="Agrega vértices a lo largo de las polilíneas; la triangulación no es restringida y alguna arista puede cruzarlas.")
+            st.checkbox("Incluir TIN en el DXF (3DFACE)", value=True, key="topo_tin_dxf", help="Una entidad por triángulo: unos 20 s por cada 200 000 triángulos. LandXML y GeoJSON se generan siempre.")
+            st.number_input("Arista máxima (0 = sin límite)", 0.0, 100000.0, 0.0, 1.0, key="topo_tin_max_edge", help="Descarta triángulos alargados en el borde del levantamiento.")
     
     # ==========================================
     # COLUMNA 3: RESULTADOS (30%)
@@ -163,7 +227,31 @@ def render_topo_tab():
                     "heatmap_margin": st.session_state.get("topo_heatmap_margin_slider"),
                     "heatmap_resolution": st.session_state.get("topo_heatmap_res_slider"),
                     "heatmap_method": st.session_state.get("topo_heatmap_method_select"),
-                    "html_map_type": st.session_state.get("html_map_type", "normal")
+                    "heatmap_bin_statistic": st.session_state.get("topo_heatmap_bin_statistic", "mean"),
+                    "heatmap_direct_density": st.session_state.get("topo_heatmap_direct_density") if st.session_state.get("topo_heatmap_direct_binning") else None,
+                    "heatmap_hull_mask": st.session_state.get("topo_heatmap_hull_mask", False),
+                    "heatmap_hull_ratio": st.session_state.get("topo_heatmap_hull_ratio", 0.3),
+                    "heatmap_dtype": st.session_state.get("topo_heatmap_dtype", "float32"),
+                    "heatmap_precision": st.session_state.get("topo_heatmap_precision", 0.01),
+                    "terrain_products": st.session_state.get("topo_terrain_products", []) if st.session_state.get("topo_heatmap_enabled") else [],
+                    "heatmap_auto_budget": st.session_state.get("topo_heatmap_auto_budget", 10),
+                    "heatmap_debug": st.session_state.get("topo_heatmap_debug", False),
+                    "heatmap_debug_csv": st.session_state.get("topo_heatmap_debug_csv", True),
+                    "contours_enabled": st.session_state.get("topo_contours_enabled", False),
+                    "volume_surface": st.session_state.get("topo_df_final"),
+                    "volume_resolution": st.session_state.get("topo_volume_resolution", 1000),
+                    "tin_enabled": st.session_state.get("topo_tin_enabled", False),
+                    "tin_breaklines": st.session_state.get("topo_tin_breaklines", True),
+                    "tin_dxf": st.session_state.get("topo_tin_dxf", True),
+                    "tin_max_edge": st.session_state.get("topo_tin_max_edge", 0.0),
+                    "contour_interval": st.session_state.get("topo_contour_interval", 1.0),
+                    "contour_index_every": st.session_state.get("topo_contour_index_every", 5),
+                    "heatmap_cog": st.session_state.get("topo_heatmap_cog", False),
+                    "heatmap_overview_resampling": st.session_state.get("topo_heatmap_overview_resampling", "average"),
+                    "html_map_type": st.session_state.get("html_map_type", "normal"),
+                    "html_payload": st.session_state.get("html_payload", "json"),
+                    "html_data_mode": st.session_state.get("html_data_mode", "inline"),
+                    "gpkg_enabled": st.session_state.get("gpkg_enabled", False)
                 }
                 
                 with st.spinner("Generando..."):
@@ -175,14 +263,32 @@ def render_topo_tab():
                     )
                 
                 st.success(f"Guardado en: {results['main_folder']}")
+                selection = results.get("heatmap_method_selection")
+                if selection:
+                    st.info(f"Método elegido: {selection['method']} ({selection['sample_size']} puntos, {selection['elapsed']:.1f}s)")
+                    if selection["report"]:
+                        st.dataframe(pd.DataFrame(selection["report"]).T.rename(columns={"rmse": "RMSE", "coverage": "Cobertura", "folds": "Pliegues"}))
+                if results.get("terrain_files"):
+                    st.info("Derivados: " + ", ".join(results["terrain_files"]))
+                if results.get("contour_count"):
+                    st.info(f"Curvas de nivel generadas: {results['contour_count']}")
+                volumes = results.get("volumes")
+                if volumes:
+                    col_v1, col_v2, col_v3 = st.columns(3)
+                    col_v1.metric("Corte (m³)", f"{volumes['cut']:,.2f}")
+                    col_v2.metric("Relleno (m³)", f"{volumes['fill']:,.2f}")
+                    col_v3.metric("Neto (m³)", f"{volumes['net']:,.2f}")
+                html_report = results.get("html_report")
+                if html_report:
+                    st.caption(f"Datos del visor: {html_report['original_bytes'] / 1e6:.2f} MB → {html_report['payload_bytes'] / 1e6:.2f} MB ({html_report['features']} features)")
+                if results.get("tin_triangles"):
+                    st.info(f"TIN: {results['tin_triangles']} triángulos (" + ("DXF 3DFACE, " if st.session_state.get("topo_tin_dxf", True) else "") + "LandXML y GeoJSON)")
                 
                 # ZIP
                 zip_buf = io.BytesIO()
-                with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for root, dirs, files in os.walk(results['main_folder']):
-                        for file in files:
-                            p = Path(root) / file
-                            zf.write(p, arcname=p.relative_to(results['main_folder']))
+                zf, _ = open_package(zip_buf)
+                with zf:
+                    add_package_directory(zf, results['main_folder'])
                 
                 st.download_button(
                     "Descargar todo (ZIP)",
@@ -197,11 +303,6 @@ def render_topo_tab():
                     st.session_state["project_geojson"] = results["geojson"]
                     st.session_state["project_title"] = f"{options['folder_name']} - Topografia"
                     st.session_state["project_folder_name"] = options['folder_name']
-                    # Limpiar HTML cacheado para regenerar con el tipo de mapa actual
-                    if "project_html" in st.session_state:
-                        del st.session_state["project_html"]
-                    if "project_html_map_type" in st.session_state:
-                        del st.session_state["project_html_map_type"]
                     st.info("Mapa actualizado en 'Mapa del proyecto'")
         else:
             st.info("Carga datos para ver resultados")
@@ -1,7 +1,6 @@
 import io
-import os
-import zipfile
 from pathlib import Path
+from src.utils.package_writer import open_package, add_package_directory
 
 def local_name(tag: str) -> str:
     try:
@@ -28,14 +27,10 @@ def parse_coords_text(txt: str):
 
 def zip_directory(directory_path: Path) -> bytes:
     buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                abs_path = Path(root) / file
-                rel_path = abs_path.relative_to(directory_path)
-                zipf.write(abs_path, arcname=str(rel_path))
-    buffer.seek(0)
-    return buffer.read()
+    zipf, _ = open_package(buffer)
+    with zipf:
+        add_package_directory(zipf, directory_path)
+    return buffer.getvalue()
 
 def points_equal(p1, p2, eps=1e-6):
     """Compara dos puntos con tolerancia para flotantes"""
@@ -0,0 +1,71 @@
+import zipfile
+import tempfile
+from pathlib import Path
+
+# Los paquetes más chicos que esto quedan en memoria; los mayores pasan a un archivo temporal
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+# Formatos ya comprimidos (KMZ/ZIP son deflate, los GeoTIFF salen con LZW): se guardan sin recomprimir
+STORED_EXTENSIONS = {".kmz", ".zip", ".gz", ".tif", ".tiff", ".png", ".jpg", ".jpeg"}
+# Desde este tamaño el texto (DXF, GeoJSON, HTML...) usa deflate rápido: nivel 1 comprime
+# casi igual que el 6 en estos formatos repetitivos y tarda varias veces menos
+FAST_DEFLATE_BYTES = 4 * 1024 * 1024
+FAST_DEFLATE_LEVEL = 1
+DEFAULT_DEFLATE_LEVEL = 6
+
+def entry_compression(name, size):
+    """Política de compresión por entrada: retorna (compress_type, compresslevel)."""
+    if Path(name).suffix.lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    if size >= FAST_DEFLATE_BYTES:
+        return zipfile.ZIP_DEFLATED, FAST_DEFLATE_LEVEL
+    return zipfile.ZIP_DEFLATED, DEFAULT_DEFLATE_LEVEL
+
+def open_package(target=None):
+    """
+    Abre un ZIP de escritura que se arma entrada por entrada.
+
+    target puede ser una ruta (el ZIP se escribe directo en disco), un archivo
+    binario abierto o None (SpooledTemporaryFile: en memoria hasta SPOOL_MAX_BYTES
+    y luego en disco). Retorna (ZipFile, archivo subyacente); el ZipFile debe
+    cerrarse antes de leer el archivo. ZIP64 queda habilitado para paquetes o
+    entradas de más de 4 GB.
+    """
+    if target is None:
+        fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    elif isinstance(target, (str, Path)):
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        fileobj = open(target, "w+b")
+    else:
+        fileobj = target
+    return zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED, allowZip64=True), fileobj
+
+def open_local_package(save_path):
+    """
+    Abre save_path para escribir el paquete. Si la carpeta no se puede crear o no
+    es escribible se usa un TemporaryFile, así la descarga sigue disponible.
+    Retorna (archivo binario abierto, OSError o None si quedó en save_path).
+    """
+    try:
+        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+        return open(save_path, "w+b"), None
+    except OSError as e:
+        return tempfile.TemporaryFile(), e
+
+def add_package_file(zf, file_path, arcname):
+    """Copia un archivo al ZIP por bloques (nunca entero en memoria) con la compresión de entry_compression."""
+    compress_type, level = entry_compression(arcname, Path(file_path).stat().st_size)
+    zf.write(file_path, arcname.replace("\\", "/"), compress_type=compress_type, compresslevel=level)
+
+def add_package_bytes(zf, arcname, data):
+    """Agrega una entrada desde memoria (bytes o texto) con la compresión de entry_compression."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    compress_type, level = entry_compression(arcname, len(data))
+    zf.writestr(arcname.replace("\\", "/"), data, compress_type=compress_type, compresslevel=level)
+
+def add_package_directory(zf, directory_path, prefix=""):
+    """Agrega todos los archivos de una carpeta bajo prefix/, en orden estable."""
+    directory_path = Path(directory_path)
+    for file_path in sorted(p for p in directory_path.rglob("*") if p.is_file()):
+        add_package_file(zf, file_path, prefix + file_path.relative_to(directory_path).as_posix())